@@ -15,6 +15,7 @@ interface LoggedExercise {
   completed_status: 'pending' | 'partial' | 'full' | 'skipped';
   actual_sets_completed: number;
   actual_reps_per_set: (number | string)[];
+  rep_kinematics?: { fields: string[]; reps: number[][] };
   isSupervisionUIToggled?: boolean;
   current_reps_in_ai_set?: number;
 }
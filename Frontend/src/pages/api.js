@@ -53,16 +53,25 @@ export default apiClient;
 
 //////////////////////////////////////////////////////
 
-export const getTrainingRoutinesApi = () => {
+// Routine summaries (no weekly schedule) from every page of /routines/,
+// returned as { data: [...] }. Use getSpecificRoutineApi for the full routine.
+export const getTrainingRoutinesApi = async () => {
   const token = getAccessToken();
   if (!token) {
-    return Promise.reject(new Error('No access token found. Please log in.'));
+    throw new Error('No access token found. Please log in.');
   }
-  return apiClient.get('/routines/', {
-    headers: {
-      Authorization: `Bearer ${token}`,
-    },
-  });
+  const routines = [];
+  let url = '/routines/?view=summary';
+  while (url) {
+    const response = await apiClient.get(url, {
+      headers: {
+        Authorization: `Bearer ${token}`,
+      },
+    });
+    routines.push(...response.data.results);
+    url = response.data.next;
+  }
+  return { data: routines };
 };
 
 export const getSpecificRoutineApi = (routineDbId) => {
@@ -153,6 +162,17 @@ export const updateDailyLogApi = (logId, logData) => {
   });
 };
 
+// Applies JSON Patch operations to one exercise of a log, e.g.
+// [{ op: 'replace', path: '/actual_sets_completed', value: 2 }].
+// Resolves to { exercise, completion_percentage } computed by the server.
+export const patchLoggedExerciseApi = (logId, originalExerciseId, operations) => {
+  const token = getAccessToken();
+  if (!token) return Promise.reject(new Error('No access token.'));
+  return apiClient.patch(`/daily-logs/${logId}/exercises/${originalExerciseId}/`, operations, {
+    headers: { Authorization: `Bearer ${token}`, 'Content-Type': 'application/json-patch+json' },
+  });
+};
+
 export const getWorkoutContributionsApi = () => {
   const token = sessionStorage.getItem('accessToken');
   if (!token) {
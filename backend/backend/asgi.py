@@ -1,17 +1,21 @@
 # gym/asgi.py
 import os
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+# Set up Django (and its app registry) before anything imports models.
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import gym.routing
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
-
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(), 
+    "http": django_asgi_app, 
     "websocket": AuthMiddlewareStack(
         URLRouter(
             gym.routing.websocket_urlpatterns 
         )
     ),
-})
\ No newline at end of file
+})
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import importlib.util
+import socket
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -84,6 +86,19 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels.layers.InMemoryChannelLayer"
     }
 }
+# InMemoryChannelLayer only reaches consumers in its own process. To run several
+# daphne workers on one host, set USE_LOCAL_CHANNEL_HUB to use the local hub
+# layer (see gym/layers.py). It needs Unix sockets and fcntl, so on Windows the
+# in-memory layer stays in use.
+USE_LOCAL_CHANNEL_HUB = False
+LOCAL_CHANNEL_HUB_SUPPORTED = hasattr(socket, "AF_UNIX") and importlib.util.find_spec("fcntl") is not None
+if USE_LOCAL_CHANNEL_HUB and LOCAL_CHANNEL_HUB_SUPPORTED:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "gym.layers.LocalChannelLayer",
+            "CONFIG": {"path": "/tmp/grindsens-channels.sock"},
+        }
+    }
 
 
 # Database
@@ -162,3 +177,44 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
 }
+
+# --- Supervision socket flow control (see gym/flow.py for all keys) ---
+SUPERVISION_RATE_CONTROL = {
+    'MAX_LAG_MS': 250,
+    'MIN_FPS': 10,
+    'MAX_FPS': 30,
+}
+
+# --- Write-behind persistence of supervision set progress (see gym/persistence.py) ---
+SUPERVISION_WRITE_BEHIND = {
+    'FLUSH_INTERVAL_S': 2.0,
+    'MAX_STORED_REPS': 300,
+}
+
+# --- Per-process cache of supervision session state (see gym/session_cache.py) ---
+SUPERVISION_SESSION_CACHE = {
+    'TTL_S': 15 * 60,
+    'MAX_ENTRIES': 10000,
+}
+
+# --- Process-pool evaluation of pose frames (see gym/offload.py for all keys) ---
+SUPERVISION_OFFLOAD = {
+    'ENABLED': False,
+    'WORKERS': None,  # os.cpu_count()
+}
+
+# --- Columnar archive of raw pose frames per supervision session (see gym/archive.py) ---
+# The only recorder on the socket; `manage.py replay_pose --export-npz` converts archives for offline replay.
+SUPERVISION_ARCHIVE = {
+    'ENABLED': False,
+    'DIRECTORY': BASE_DIR / 'pose_archive',
+    'CHUNK_FRAMES': 300,
+}
+
+# --- Admission control for supervision sockets (see gym/admission.py for all keys) ---
+SUPERVISION_ADMISSION = {
+    'MAX_PER_USER': 3,
+    'MAX_PER_WORKER': 1000,
+    'USER_CONNECT_RATE': 1.0,
+    'USER_CONNECT_BURST': 5,
+}
@@ -0,0 +1,61 @@
+"""
+Codec benchmark for supervision pose frames.
+
+Compares the JSON `pose_landmarks` text message (json.loads +
+landmarks_to_array) with the binary grindsens.pose.v1 frame
+(gym.protocol.decode_frame) on bytes per frame and decode time.
+
+    python benchmarks/bench_codec.py --frames 20000
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_trackers import synthetic_frames  # noqa: E402
+from gym.protocol import decode_frame, encode_frame  # noqa: E402
+from gym.util import landmarks_to_array  # noqa: E402
+
+
+def decode_json(messages):
+    start = time.perf_counter()
+    for message in messages:
+        data = json.loads(message)
+        landmarks_to_array(data["landmarks"])
+    return time.perf_counter() - start
+
+
+def decode_binary(messages):
+    start = time.perf_counter()
+    for message in messages:
+        decode_frame(message)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = synthetic_frames(args.frames)
+    json_messages = [
+        json.dumps({"type": "pose_landmarks", "exercise_name": "bicep curl", "landmarks": landmarks})
+        for landmarks in frames
+    ]
+    binary_messages = [
+        encode_frame(landmarks_to_array(landmarks), timestamp_ms=i * 33.3)
+        for i, landmarks in enumerate(frames)
+    ]
+
+    for name, messages, decoder in (("json", json_messages, decode_json), ("binary", binary_messages, decode_binary)):
+        size = sum(len(m) for m in messages) / len(messages)
+        best = min(decoder(messages) for _ in range(args.repeat))
+        print(f"{name:<8} {size:8.0f} bytes/frame   {best / len(messages) * 1e6:7.2f} us/decode   {len(messages) / best:>12,.0f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Event-loop benchmark for process-pool tracker evaluation.
+
+Simulates many sockets on one event loop, each evaluating batches of
+frames as fast as its results come back, first inline (as the consumer
+does by default) and then through gym.offload.TrackerPool. Reports
+frames/sec across all sockets and how late a 1 ms heartbeat task wakes up,
+which is the delay every other socket on the worker would see.
+
+    python benchmarks/bench_offload.py --connections 200 --batch 30 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from gym.exes import TRACKERS  # noqa: E402
+from gym.offload import DEFAULTS, TrackerPool  # noqa: E402
+from gym.replay import synthetic_curl  # noqa: E402
+
+
+async def heartbeat(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def connection(evaluate, frames, batch, stop, counts, index):
+    stage, counter, offset = None, 0, (index * 7) % len(frames)
+    while not stop.is_set():
+        chunk = frames[offset:offset + batch]
+        if len(chunk) < batch:
+            offset = 0
+            continue
+        result = await evaluate(chunk, stage, counter)
+        stage, counter = result.stage, result.counter
+        counts[index] += len(chunk)
+        offset += batch
+
+
+async def run(mode, args, frames):
+    tracker = TRACKERS["curl_l"]
+    pool = None
+    if mode == "inline":
+        async def evaluate(chunk, stage, counter):
+            result = tracker.run(chunk, stage, counter, reps_per_set=10)
+            await asyncio.sleep(0)  # the consumer yields when it sends its reply
+            return result
+    else:
+        pool = TrackerPool({**DEFAULTS, "ENABLED": True, "WORKERS": args.workers})
+        await pool.run("curl_l", frames[:1])  # start the workers outside the timed section
+
+        async def evaluate(chunk, stage, counter):
+            return await pool.run("curl_l", chunk, stage, counter, reps_per_set=10)
+
+    stop = asyncio.Event()
+    counts = [0] * args.connections
+    lags = []
+    tasks = [asyncio.create_task(heartbeat(lags, stop))]
+    tasks += [asyncio.create_task(connection(evaluate, frames, args.batch, stop, counts, i)) for i in range(args.connections)]
+    started = time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    if pool is not None:
+        pool.shutdown()
+    lags_ms = np.asarray(lags) * 1000
+    print(f"{mode:<8} {sum(counts) / elapsed:>12,.0f} frames/s   heartbeat lag p50 {np.percentile(lags_ms, 50):6.2f} ms"
+          f"   p99 {np.percentile(lags_ms, 99):7.2f} ms   max {lags_ms.max():7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=30, help="Frames per message.")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    frames = synthetic_curl(reps=50).frames
+    for mode in ("inline", "pool"):
+        asyncio.run(run(mode, args, frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Routine write benchmark.
+
+Creates, replaces (PUT of a tree without ids), edits (PUT of the stored
+tree with one rep range changed) and copies routines of increasing size
+through the REST API on a throwaway test database and reports the median
+time and the number of SQL queries per request.
+
+    python benchmarks/bench_routine_writes.py --days 7 --exercises 6 10 20 --runs 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+
+def routine_payload(days, exercises_per_day, name="Benchmark routine"):
+    return {
+        "routine_id": "bench", "routine_name": name, "goal": "strength", "experience_level": "intermediate",
+        "training_split": "split", "days_per_week": str(days), "description": "benchmark",
+        "weekly_schedule": [
+            {
+                "day_of_week_or_number": f"Day {day + 1}", "session_focus": "focus",
+                "exercises": [
+                    {"exercise_name": f"Exercise {day}.{i}", "target_muscles": ["chest", "triceps"], "sets": "3",
+                     "reps_or_duration": "8-12 reps", "rest_period": "60-90 seconds", "notes": "keep form"}
+                    for i in range(exercises_per_day)
+                ],
+            }
+            for day in range(days)
+        ],
+    }
+
+
+def measure(request):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = request()
+        elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+        raise SystemExit(f"{response.status_code}: {str(response.data)[:300]}")
+    return elapsed, len(queries), response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--exercises", type=int, nargs="+", default=[6, 20, 50], help="Exercises per day.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("bench", password="x"))
+        print(f"{'operation':<10} {'days':>5} {'exercises':>10} {'median ms':>10} {'queries':>8}")
+        for per_day in args.exercises:
+            payload = routine_payload(args.days, per_day)
+            results = {"create": [], "replace": [], "edit": [], "copy": []}
+            for _ in range(args.runs):
+                elapsed, queries, response = measure(lambda: client.post("/api/routines/", payload, format="json"))
+                results["create"].append((elapsed, queries))
+                pk = response.data["id"]
+                elapsed, queries, response = measure(lambda: client.put(f"/api/routines/{pk}/", payload, format="json"))
+                results["replace"].append((elapsed, queries))
+                edited = response.data
+                edited["weekly_schedule"][0]["exercises"][0]["reps_or_duration"] = "5 reps"
+                results["edit"].append(measure(lambda: client.put(f"/api/routines/{pk}/", edited, format="json"))[:2])
+                results["copy"].append(measure(lambda: client.post(f"/api/routines/{pk}/copy/"))[:2])
+            for operation, samples in results.items():
+                print(f"{operation:<10} {args.days:>5} {args.days * per_day:>10} "
+                      f"{statistics.median(s[0] for s in samples) * 1000:>10.1f} {samples[-1][1]:>8}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
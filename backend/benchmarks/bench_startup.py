@@ -0,0 +1,89 @@
+"""
+Startup benchmark for the ASGI process.
+
+Imports backend.asgi and the URLconf in fresh interpreters (what every
+daphne worker does before it serves its first request) and reports
+wall-clock import time, peak RSS and the slowest top-level imports from
+`python -X importtime`. With --max-ms / --max-rss-mb it exits non-zero when
+the median goes over budget, so it can run in CI.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import json, os, resource, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+started = time.perf_counter()
+import backend.asgi
+from django.urls import get_resolver
+get_resolver().url_patterns  # the URLconf (and every view module) loads on a worker's first request
+elapsed = time.perf_counter() - started
+print(json.dumps({"import_s": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def run_child(importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", CHILD]
+    result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, env={**os.environ, "PYTHONWARNINGS": "ignore"})
+    if result.returncode != 0:
+        raise SystemExit(f"Importing backend.asgi failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_output, top):
+    """Top-level packages by cumulative import time, from -X importtime's stderr."""
+    totals = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative_us.isdigit() or name.startswith(" "):
+            continue
+        if name == name.lstrip():
+            package = name.split(".")[0]
+            totals[package] = max(totals.get(package, 0), int(cumulative_us))
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest top-level imports to list.")
+    parser.add_argument("--max-ms", type=float, help="Fail when the median import time exceeds this.")
+    parser.add_argument("--max-rss-mb", type=float, help="Fail when the median peak RSS exceeds this.")
+    args = parser.parse_args()
+
+    samples = [run_child()[0] for _ in range(args.runs)]
+    import_ms = statistics.median(sample["import_s"] for sample in samples) * 1000
+    rss_mb = statistics.median(sample["max_rss_kb"] for sample in samples) / 1024
+    print(f"import backend.asgi: median {import_ms:.0f} ms, peak RSS {rss_mb:.1f} MB over {args.runs} runs")
+
+    _sample, importtime_output = run_child(importtime=True)
+    print("slowest top-level imports (cumulative):")
+    for package, cumulative_us in slowest_imports(importtime_output, args.top):
+        print(f"  {package:<28} {cumulative_us / 1000:8.1f} ms")
+
+    failed = False
+    if args.max_ms is not None and import_ms > args.max_ms:
+        print(f"FAIL: import time {import_ms:.0f} ms is over the {args.max_ms:.0f} ms budget")
+        failed = True
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        print(f"FAIL: peak RSS {rss_mb:.1f} MB is over the {args.max_rss_mb:.1f} MB budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
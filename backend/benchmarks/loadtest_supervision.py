@@ -0,0 +1,357 @@
+"""
+Load generator for ws/supervision/.
+
+Opens N authenticated supervision sockets and streams pose frames on each
+at a fixed rate, in binary batches with client timestamps, the way the
+frontend does. Clients follow rate_control messages unless --ignore-rate-control.
+Reports connection setup time, the latency from sending the frame that
+completes a rep to receiving its rep_update (the consumer echoes that
+frame's timestamp as frame_t), server-side frame counts, and
+CPU and memory per connection.
+
+In-process (default): clients talk to backend.asgi.application through
+the channels test communicator, including the session-cookie
+AuthMiddlewareStack, against a throwaway test database. CPU and memory are
+this process's, so they include the simulated clients.
+
+Over a port (--url ws://127.0.0.1:8000): clients use the websockets
+package against a running server. Users named loadtest_<n> are created in
+the configured database (the server's) and deleted afterwards unless
+--keep-users; pass --server-pid to sample the server's CPU and RSS with
+psutil.
+
+    python benchmarks/loadtest_supervision.py --clients 200 --fps 30 --batch 5 --seconds 20
+    python benchmarks/loadtest_supervision.py --url ws://127.0.0.1:8000 --server-pid 4242 --clients 500
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY  # noqa: E402
+from django.contrib.sessions.backends.db import SessionStore  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from gym.archive import ARCHIVE_SUFFIX, PoseArchive  # noqa: E402
+from gym.protocol import POSE_SUBPROTOCOL, encode_batch  # noqa: E402
+from gym.replay import PoseRecording, recording_from_messages, seed_supervision_session, synthetic_curl  # noqa: E402
+
+
+def load_recording(path):
+    path = Path(path)
+    if path.suffix == ".npz":
+        return PoseRecording.load(path)
+    if path.suffix == ARCHIVE_SUFFIX:
+        return PoseArchive(path).to_recording()
+    with open(path) as f:
+        return recording_from_messages(f)
+
+
+def seed_clients(count, exercise_name, prefix):
+    """One user, routine, today's log and logged-in session per client: [(exercise_id, session cookie)]."""
+    clients = []
+    for i in range(count):
+        user, exercise_id = seed_supervision_session(exercise_name, username=f"{prefix}{i}")
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        clients.append((exercise_id, session.session_key))
+    return clients
+
+
+def delete_clients(prefix):
+    from django.contrib.auth.models import User
+
+    User.objects.filter(username__startswith=prefix).delete()
+
+
+class InProcessSocket:
+    def __init__(self, application):
+        self.application = application
+
+    async def connect(self, path, cookie):
+        from channels.testing import WebsocketCommunicator
+
+        self.communicator = WebsocketCommunicator(
+            self.application, path, headers=[(b"cookie", f"sessionid={cookie}".encode())], subprotocols=[POSE_SUBPROTOCOL],
+        )
+        connected, _subprotocol = await self.communicator.connect(timeout=30)
+        return connected
+
+    async def send_bytes(self, data):
+        await self.communicator.send_to(bytes_data=data)
+
+    async def send_text(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def recv(self):
+        return await self.communicator.receive_from(timeout=3600)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class NetworkSocket:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    async def connect(self, path, cookie):
+        from websockets.asyncio.client import connect
+
+        self.websocket = await connect(
+            f"{self.base_url}{path}", additional_headers={"Cookie": f"sessionid={cookie}"},
+            subprotocols=[POSE_SUBPROTOCOL], open_timeout=30, max_queue=None,
+        )
+        return True
+
+    async def send_bytes(self, data):
+        await self.websocket.send(data)
+
+    async def send_text(self, text):
+        await self.websocket.send(text)
+
+    async def recv(self):
+        return await self.websocket.recv()
+
+    async def close(self):
+        await self.websocket.close()
+
+
+class Client:
+    def __init__(self, socket, exercise_id, cookie, recording, offset, args):
+        self.socket = socket
+        self.path = f"/ws/supervision/{exercise_id}/"
+        self.cookie = cookie
+        self.recording = recording
+        self.offset = offset
+        self.args = args
+        self.fps = args.fps
+        self.connect_s = None
+        self.rep_latencies_ms = []
+        self.frames_sent = 0
+        self.errors = []
+        self.stats = None
+        self._stats_received = asyncio.Event()
+        self._initialized = asyncio.Event()
+
+    async def run(self, start_at, stop_at):
+        await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+        started = time.perf_counter()
+        try:
+            if not await self.socket.connect(self.path, self.cookie):
+                self.errors.append("refused")
+                return
+        except Exception as e:
+            self.errors.append(f"connect: {e}")
+            return
+        reader = asyncio.create_task(self.read())
+        try:
+            await asyncio.wait_for(self._initialized.wait(), 30)
+            if self.errors:  # refused by admission control or no exercise to supervise
+                return
+            self.connect_s = time.perf_counter() - started
+            await self.stream(stop_at)
+            await self.socket.send_text(json.dumps({"type": "get_stats"}))
+            await asyncio.wait_for(self._stats_received.wait(), 30)
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+        finally:
+            reader.cancel()
+            with contextlib.suppress(Exception):
+                await self.socket.close()
+
+    async def stream(self, stop_at):
+        frames, batch = self.recording.frames, self.args.batch
+        position = self.offset
+        next_send = time.perf_counter()
+        while time.perf_counter() < stop_at:
+            if position + batch > len(frames):
+                position = 0
+            now_ms = time.perf_counter() * 1000.0
+            interval_ms = 1000.0 / self.fps
+            timestamps = now_ms - interval_ms * np.arange(batch - 1, -1, -1)
+            await self.socket.send_bytes(encode_batch(frames[position:position + batch], timestamps))
+            position += batch
+            self.frames_sent += batch
+            next_send += batch / self.fps
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    async def read(self):
+        while True:
+            message = json.loads(await self.socket.recv())
+            kind = message.get("type")
+            if kind == "rep_update" and message.get("frame_t") is not None:
+                self.rep_latencies_ms.append(time.perf_counter() * 1000.0 - message["frame_t"])
+            elif kind == "initial_state":
+                self._initialized.set()
+            elif kind == "rate_control" and not self.args.ignore_rate_control:
+                self.fps = message["target_fps"]
+            elif kind == "stats":
+                self.stats = message
+                self._stats_received.set()
+            elif kind == "error":
+                self.errors.append(message.get("message"))
+                self._initialized.set()
+
+
+class ResourceSampler:
+    """CPU seconds and RSS of this process, or of --server-pid through psutil."""
+
+    def __init__(self, pid=None):
+        self.process = None
+        if pid is not None:
+            import psutil
+
+            self.process = psutil.Process(pid)
+
+    def cpu_s(self):
+        if self.process is not None:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def rss_mb(self):
+        if self.process is not None:
+            return self.process.memory_info().rss / 2**20
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    values = np.asarray(values)
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)), "max": float(values.max())}
+
+
+async def run_load(args, seeded, recording, application):
+    sampler = ResourceSampler(args.server_pid)
+    rss_before = sampler.rss_mb()
+    ramp = args.ramp if args.ramp is not None else min(5.0, args.clients / 100)
+    now = time.perf_counter()
+    stream_start = now + ramp
+    stop_at = stream_start + args.seconds
+    clients = []
+    for i, (exercise_id, cookie) in enumerate(seeded):
+        socket = NetworkSocket(args.url) if args.url else InProcessSocket(application)
+        offset = (i * 37) % max(1, len(recording) - args.batch)
+        clients.append(Client(socket, exercise_id, cookie, recording, offset, args))
+    tasks = [asyncio.create_task(client.run(now + ramp * i / len(clients), stop_at)) for i, client in enumerate(clients)]
+
+    # Sample steady state: from once everyone should be connected until the streams stop.
+    await asyncio.sleep(max(0.0, stream_start - time.perf_counter()))
+    rss_connected = sampler.rss_mb()
+    cpu_started, wall_started = sampler.cpu_s(), time.perf_counter()
+    await asyncio.sleep(max(0.0, stop_at - time.perf_counter()))
+    cpu_s, wall_s = sampler.cpu_s() - cpu_started, time.perf_counter() - wall_started
+    rss_peak = sampler.rss_mb()
+    await asyncio.gather(*tasks)
+
+    connected = [c for c in clients if c.connect_s is not None]
+    stats = [c.stats for c in clients if c.stats]
+    return {
+        "mode": "network" if args.url else "in-process",
+        "clients": len(clients),
+        "connected": len(connected),
+        "failed": len(clients) - len(connected),
+        "errors": sorted({e for c in clients for e in c.errors})[:10],
+        "fps_per_client": args.fps,
+        "batch": args.batch,
+        "seconds": args.seconds,
+        "connect_ms": percentiles([c.connect_s * 1000 for c in connected]),
+        "rep_latency_ms": percentiles([latency for c in clients for latency in c.rep_latencies_ms]),
+        "reps": sum(len(c.rep_latencies_ms) for c in clients),
+        "frames_sent": sum(c.frames_sent for c in clients),
+        "frames_processed": sum(s["processed"] for s in stats),
+        "frames_dropped": sum(s["dropped"] for s in stats),
+        "cpu_cores": cpu_s / wall_s,
+        "cpu_ms_per_client_second": cpu_s * 1000 / wall_s / max(1, len(connected)),
+        "rss_mb": rss_peak,
+        "rss_kb_per_client": (rss_connected - rss_before) * 1024 / max(1, len(connected)),
+    }
+
+
+def print_report(report):
+    def line(name, stats):
+        if stats["p50"] is None:
+            return f"{name:<22} n/a"
+        return f"{name:<22} p50 {stats['p50']:8.1f}  p95 {stats['p95']:8.1f}  p99 {stats['p99']:8.1f}  max {stats['max']:8.1f}"
+
+    print(f"{report['mode']}: {report['connected']}/{report['clients']} clients connected, "
+          f"{report['fps_per_client']} fps in batches of {report['batch']} for {report['seconds']:.0f} s")
+    print(line("connect ms", report["connect_ms"]))
+    print(line(f"rep latency ms ({report['reps']})", report["rep_latency_ms"]))
+    print(f"{'frames':<22} sent {report['frames_sent']:,}  processed {report['frames_processed']:,}  dropped {report['frames_dropped']:,}")
+    print(f"{'cpu':<22} {report['cpu_cores']:.2f} cores, {report['cpu_ms_per_client_second']:.2f} ms per client-second")
+    print(f"{'memory':<22} {report['rss_mb']:.0f} MB RSS, {report['rss_kb_per_client']:.0f} KB per connected client")
+    for error in report["errors"]:
+        print(f"error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--fps", type=float, default=30.0, help="Frames per second per client.")
+    parser.add_argument("--batch", type=int, default=5, help="Frames per message.")
+    parser.add_argument("--seconds", type=float, default=10.0, help="How long every client streams.")
+    parser.add_argument("--ramp", type=float, help="Seconds over which clients connect (default: clients/100, at most 5).")
+    parser.add_argument("--recording", help="Stream a .npz/.gspose/.jsonl recording instead of a synthetic curl.")
+    parser.add_argument("--url", help="ws:// base URL of a running server; default is in-process.")
+    parser.add_argument("--server-pid", type=int, help="With --url, sample this process's CPU and RSS (needs psutil).")
+    parser.add_argument("--keep-users", action="store_true", help="With --url, keep the loadtest_<n> users afterwards.")
+    parser.add_argument("--ignore-rate-control", action="store_true")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Let the consumers' per-rep prints through.")
+    args = parser.parse_args()
+
+    recording = load_recording(args.recording) if args.recording else synthetic_curl(reps=40)
+    exercise_name = recording.exercise_name or "curl_l"
+    prefix = "loadtest_"
+
+    if args.url:
+        delete_clients(prefix)
+        seeded = seed_clients(args.clients, exercise_name, prefix)
+        try:
+            report = asyncio.run(run_load(args, seeded, recording, None))
+        finally:
+            if not args.keep_users:
+                delete_clients(prefix)
+    else:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            from backend.asgi import application
+
+            seeded = seed_clients(args.clients, exercise_name, prefix)
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                report = asyncio.run(run_load(args, seeded, recording, application))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
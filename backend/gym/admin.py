@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, TrainingRoutine, WeeklyScheduleItem, Exercise,WorkoutPlan,DailyWorkoutLog
+from .models import UserProfile, TrainingRoutine, WeeklyScheduleItem, Exercise,WorkoutPlan,DailyWorkoutLog,ExerciseLogEntry,PoseSessionRecording
 
 
 # Register your models here.
@@ -9,5 +9,5 @@ admin.site.register(WeeklyScheduleItem)
 admin.site.register(Exercise)
 admin.site.register(WorkoutPlan)
 admin.site.register(DailyWorkoutLog)
-
-
+admin.site.register(ExerciseLogEntry)
+admin.site.register(PoseSessionRecording)
@@ -0,0 +1,177 @@
+#admission.py
+#
+# Admission control for supervision sockets (SUPERVISION_ADMISSION).
+#
+# Every accepted socket costs a DB query and per-connection tracker state,
+# so a client reconnecting in a tight loop, or opening socket after socket,
+# could starve everyone else on the worker. Before any of that is set up,
+# SupervisionConsumer asks the process-wide `admission` controller:
+#
+#     MAX_PER_USER      open sockets one user may hold in this process
+#     MAX_PER_WORKER    open sockets in this process
+#     USER_CONNECT_RATE / USER_CONNECT_BURST
+#                       token bucket on one user's connects (per second / bucket size)
+#     WORKER_CONNECT_RATE / WORKER_CONNECT_BURST
+#                       token bucket on all connects to this process
+#
+# A refused socket is accepted only to be told why: it gets an error message
+# with code "server_busy" and retry_after (seconds), then close code 4503.
+# Rate-limited connects get the time until the bucket has a token again;
+# a full user or worker gets BUSY_RETRY_AFTER_S. Limits are per process:
+# behind several workers a user may hold MAX_PER_USER sockets on each.
+
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import registry
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MAX_PER_USER": 3,
+    "MAX_PER_WORKER": 1000,
+    "USER_CONNECT_RATE": 1.0,
+    "USER_CONNECT_BURST": 5,
+    "WORKER_CONNECT_RATE": 100.0,
+    "WORKER_CONNECT_BURST": 200,
+    "BUSY_RETRY_AFTER_S": 5.0,
+}
+
+CLOSE_SERVER_BUSY = 4503
+
+admission_rejected = registry.counter(
+    "supervision_admission_rejected_total", "Supervision sockets refused by admission control.", ("reason",),
+)
+
+
+def admission_settings():
+    return {**DEFAULTS, **getattr(settings, "SUPERVISION_ADMISSION", {})}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Takes a token; returns 0, or the seconds until one is available (nothing taken)."""
+        self.refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def full(self, now):
+        self.refill(now)
+        return self.tokens >= self.burst
+
+
+class Refusal:
+    __slots__ = ("reason", "retry_after")
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def message(self):
+        return {
+            "type": "error",
+            "code": "server_busy",
+            "reason": self.reason,
+            "message": "Server busy, please retry shortly.",
+            "retry_after": math.ceil(self.retry_after),
+        }
+
+
+class AdmissionController:
+    SWEEP_INTERVAL_S = 60.0
+
+    def __init__(self, config=None, clock=time.monotonic):
+        self.config = config or admission_settings()
+        self.clock = clock
+        self.open = 0
+        self._open_by_user = {}
+        self._buckets = {}  # user id -> TokenBucket
+        self._worker_bucket = TokenBucket(self.config["WORKER_CONNECT_RATE"], self.config["WORKER_CONNECT_BURST"], clock())
+        self._next_sweep = clock() + self.SWEEP_INTERVAL_S
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.config["ENABLED"])
+
+    def admit(self, user_id):
+        """Counts the socket as open and returns None, or returns a Refusal."""
+        if not self.enabled:
+            return None
+        now = self.clock()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            refusal = self._check(user_id, now)
+            if refusal is None:
+                self.open += 1
+                self._open_by_user[user_id] = self._open_by_user.get(user_id, 0) + 1
+                return None
+        admission_rejected.inc(1, refusal.reason)
+        return refusal
+
+    def _check(self, user_id, now):
+        config = self.config
+        if self._open_by_user.get(user_id, 0) >= config["MAX_PER_USER"]:
+            return Refusal("user_limit", config["BUSY_RETRY_AFTER_S"])
+        if self.open >= config["MAX_PER_WORKER"]:
+            return Refusal("worker_limit", config["BUSY_RETRY_AFTER_S"])
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(config["USER_CONNECT_RATE"], config["USER_CONNECT_BURST"], now)
+        wait = bucket.take(now)
+        if wait:
+            return Refusal("user_rate", wait)
+        wait = self._worker_bucket.take(now)
+        if wait:
+            bucket.tokens += 1.0  # not this user's fault; give the token back
+            return Refusal("worker_rate", wait)
+        return None
+
+    def release(self, user_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            count = self._open_by_user.get(user_id, 0)
+            if count <= 0:
+                return
+            self.open -= 1
+            if count == 1:
+                del self._open_by_user[user_id]
+            else:
+                self._open_by_user[user_id] = count - 1
+
+    def open_for(self, user_id):
+        return self._open_by_user.get(user_id, 0)
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self._open_by_user.clear()
+            self._buckets.clear()
+            self._worker_bucket = TokenBucket(self.config["WORKER_CONNECT_RATE"], self.config["WORKER_CONNECT_BURST"], self.clock())
+
+    def _sweep(self, now):
+        # A full bucket is the same as no bucket; drop them so idle users cost nothing.
+        for user_id in [user_id for user_id, bucket in self._buckets.items() if bucket.full(now)]:
+            del self._buckets[user_id]
+        self._next_sweep = now + self.SWEEP_INTERVAL_S
+
+
+admission = AdmissionController()
@@ -0,0 +1,245 @@
+#archive.py
+#
+# Columnar archive of one supervision session's raw pose frames.
+#
+# A .gspose file is written append-only while the socket runs and needs
+# no more memory than one chunk:
+#
+#     header   8s magic "GSPOSE1\0", u16 version, u16 landmarks, u16 fields, 10 pad bytes
+#     chunk*   4s "CHNK", u32 frame count, 8 pad bytes,
+#              float64[count] timestamps_ms, float32[count, landmarks, fields] frames
+#     index    per chunk: u64 offset of its timestamps, u32 count, 4 pad, f64 first, f64 last timestamp
+#     meta     UTF-8 JSON (exercise, daily log id, original exercise id, ...)
+#     trailer  u64 index offset, u32 chunk count, u32 meta length, 8s "GSPOSEND"
+#
+# Every column starts on an 8-byte boundary, so PoseArchive maps the file
+# once and hands out numpy views into it; reading a time range touches only
+# the chunks whose first/last timestamps overlap it. A file whose writer
+# died before close() has no trailer; PoseArchive rebuilds the index by
+# walking the chunk headers and repair() writes it back.
+#
+# With SUPERVISION_ARCHIVE['ENABLED'] every supervision socket that finds
+# its exercise in today's log archives its frames under DIRECTORY and, on
+# disconnect, records the file as a PoseSessionRecording of that log entry.
+
+import json
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .util import LANDMARK_FIELDS, NUM_LANDMARKS
+
+ARCHIVE_SUFFIX = ".gspose"
+VERSION = 1
+MAGIC = b"GSPOSE1\0"
+END_MAGIC = b"GSPOSEND"
+HEADER = struct.Struct("<8sHHH10x")
+CHUNK_HEADER = struct.Struct("<4sI8x")
+CHUNK_MAGIC = b"CHNK"
+INDEX_ENTRY = np.dtype([("offset", "<u8"), ("count", "<u4"), ("_pad", "<u4"), ("first_ms", "<f8"), ("last_ms", "<f8")])
+TRAILER = struct.Struct("<QII8s")
+
+DEFAULT_CHUNK_FRAMES = 300  # ten seconds at 30 fps, about 160 KB
+
+DEFAULTS = {
+    "ENABLED": False,
+    "DIRECTORY": "pose_archive",
+    "CHUNK_FRAMES": DEFAULT_CHUNK_FRAMES,
+}
+
+
+def archive_settings():
+    return {**DEFAULTS, **getattr(settings, "SUPERVISION_ARCHIVE", {})}
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class PoseArchiveWriter:
+    def __init__(self, path, meta=None, chunk_frames=DEFAULT_CHUNK_FRAMES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.meta = meta or {}
+        self.chunk_frames = chunk_frames
+        self._file = open(self.path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, NUM_LANDMARKS, LANDMARK_FIELDS))
+        self._index = []
+        self._timestamps = []
+        self._frames = []
+        self._buffered = 0
+        self.frame_count = 0
+        self.first_ms = None
+        self.last_ms = None
+
+    def append(self, frames, timestamps_ms):
+        frames = np.asarray(frames, dtype=np.float32).reshape(-1, NUM_LANDMARKS, LANDMARK_FIELDS)
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.float64).reshape(-1)
+        if len(frames) != len(timestamps_ms):
+            raise ValueError(f"{len(frames)} frames but {len(timestamps_ms)} timestamps")
+        if not len(frames):
+            return
+        self._frames.append(frames.copy())
+        self._timestamps.append(timestamps_ms.copy())
+        self._buffered += len(frames)
+        if self._buffered >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """Writes buffered frames as one chunk."""
+        if not self._buffered:
+            return
+        timestamps = np.concatenate(self._timestamps)
+        frames = np.concatenate(self._frames)
+        self._timestamps, self._frames, self._buffered = [], [], 0
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(frames)))
+        offset = self._file.tell()
+        self._file.write(timestamps.tobytes())
+        self._file.write(frames.tobytes())
+        self._index.append((offset, len(frames), 0, timestamps[0], timestamps[-1]))
+        self.frame_count += len(frames)
+        self.first_ms = timestamps[0] if self.first_ms is None else self.first_ms
+        self.last_ms = timestamps[-1]
+
+    def close(self):
+        """Writes the last chunk, the index, the metadata and the trailer. Returns the path."""
+        if self._file.closed:
+            return self.path
+        self.flush()
+        _write_footer(self._file, self._index, self.meta)
+        self._file.close()
+        return self.path
+
+    @property
+    def size(self):
+        return self.path.stat().st_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _write_footer(file, index, meta):
+    index_offset = file.tell()
+    file.write(np.array(index, dtype=INDEX_ENTRY).tobytes())
+    meta_bytes = json.dumps(meta).encode()
+    file.write(meta_bytes)
+    file.write(TRAILER.pack(index_offset, len(index), len(meta_bytes), END_MAGIC))
+
+
+class PoseArchive:
+    """Read side: memory-maps a .gspose file and slices it by time."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if len(self._map) < HEADER.size:
+            raise ArchiveError(f"{self.path} is too short to be a pose archive")
+        magic, version, self.num_landmarks, self.fields = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ArchiveError(f"{self.path} is not a version {VERSION} pose archive")
+        self.finalized, self.index, self.meta = self._read_footer()
+
+    def _read_footer(self):
+        if len(self._map) >= HEADER.size + TRAILER.size:
+            index_offset, chunks, meta_length, magic = TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+            if magic == END_MAGIC:
+                index = np.frombuffer(self._map, dtype=INDEX_ENTRY, count=chunks, offset=index_offset)
+                meta_offset = index_offset + index.nbytes
+                meta = json.loads(bytes(self._map[meta_offset:meta_offset + meta_length]))
+                return True, index, meta
+        return False, self._scan_chunks(), {}
+
+    def _scan_chunks(self):
+        entries = []
+        position = HEADER.size
+        frame_bytes = self.num_landmarks * self.fields * 4
+        while position + CHUNK_HEADER.size <= len(self._map):
+            magic, count = CHUNK_HEADER.unpack_from(self._map, position)
+            offset = position + CHUNK_HEADER.size
+            end = offset + count * (8 + frame_bytes)
+            if magic != CHUNK_MAGIC or not count or end > len(self._map):
+                break  # torn write at the end of an unfinalized file
+            timestamps = np.frombuffer(self._map, dtype="<f8", count=count, offset=offset)
+            entries.append((offset, count, 0, timestamps[0], timestamps[-1]))
+            position = end
+        return np.array(entries, dtype=INDEX_ENTRY)
+
+    def __len__(self):
+        return int(self.index["count"].sum())
+
+    @property
+    def exercise_name(self):
+        return self.meta.get("exercise_name")
+
+    def chunk(self, i):
+        """(timestamps_ms, frames) views of one chunk; nothing is read until used."""
+        offset, count = int(self.index["offset"][i]), int(self.index["count"][i])
+        timestamps = np.frombuffer(self._map, dtype="<f8", count=count, offset=offset)
+        frames = np.frombuffer(self._map, dtype="<f4", count=count * self.num_landmarks * self.fields,
+                               offset=offset + count * 8).reshape(count, self.num_landmarks, self.fields)
+        return timestamps, frames
+
+    def chunks(self):
+        for i in range(len(self.index)):
+            yield self.chunk(i)
+
+    def read(self, start_ms=None, end_ms=None):
+        """
+        Frames with start_ms <= timestamp < end_ms (either bound may be None)
+        as (timestamps_ms, frames) arrays. Only overlapping chunks are read;
+        a range inside one chunk comes back as views without copying.
+        """
+        lo = -np.inf if start_ms is None else start_ms
+        hi = np.inf if end_ms is None else end_ms
+        overlapping = np.flatnonzero((self.index["last_ms"] >= lo) & (self.index["first_ms"] < hi))
+        parts = []
+        for i in overlapping:
+            timestamps, frames = self.chunk(i)
+            first = np.searchsorted(timestamps, lo, side="left")
+            last = np.searchsorted(timestamps, hi, side="left")
+            if last > first:
+                parts.append((timestamps[first:last], frames[first:last]))
+        if not parts:
+            return np.empty(0), np.empty((0, self.num_landmarks, self.fields), dtype=np.float32)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def to_recording(self):
+        """Loads the whole session as a gym.replay.PoseRecording."""
+        from .replay import PoseRecording
+
+        timestamps, frames = self.read()
+        meta = {key: value for key, value in self.meta.items() if key != "exercise_name"}
+        return PoseRecording(self.exercise_name, np.array(timestamps), np.array(frames), meta)
+
+    def close(self):
+        # The mapping closes once the last view handed out is gone too.
+        self._map = self.index = None
+
+
+def repair(path, meta=None):
+    """Adds the index and trailer to an archive whose writer never closed it; returns the frame count."""
+    archive = PoseArchive(path)
+    if archive.finalized:
+        return len(archive)
+    index = archive.index.copy()
+    frames = len(archive)
+    if len(index):
+        end = int(index["offset"][-1]) + int(index["count"][-1]) * (8 + archive.num_landmarks * archive.fields * 4)
+    else:
+        end = HEADER.size
+    archive.close()
+    with open(path, "r+b") as f:
+        f.truncate(end)
+        f.seek(end)
+        _write_footer(f, index, meta or {})
+        f.flush()
+        os.fsync(f.fileno())
+    return frames
@@ -1,27 +1,27 @@
 # myapp/consumers.py
 import json
+import time
+import uuid
+from pathlib import Path
+import numpy as np
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import async_to_sync, sync_to_async 
-from .models import DailyWorkoutLog, Exercise as DjangoExerciseModel 
+from asgiref.sync import sync_to_async 
+from django.utils import timezone
+from .models import DailyWorkoutLog, ExerciseLogEntry, PoseSessionRecording, Exercise as DjangoExerciseModel
 from . import exes
+from .util import landmarks_to_array, parse_target_sets
+from .persistence import set_progress
+from .session_cache import SupervisionSession, session_cache
+from .protocol import POSE_SUBPROTOCOL, FrameDecodeError, decode_frames
+from .flow import FrameFlowControl
+from .metrics import ConnectionTimings, active_connections
+from .offload import tracker_pool
+from .kinematics import RepKinematics, stored_row
+from .archive import ARCHIVE_SUFFIX, PoseArchiveWriter, archive_settings
+from .admission import CLOSE_SERVER_BUSY, admission
 
-EXERCISE_TRACKERS = {
-    "curl_l": exes.curl_l,
-    "curl_r": exes.curl_r,
-    "curl": exes.curl_r,
-    "bicep curl": exes.curl_l,
-    "dumbbell bicep curl": exes.curl_l,
-    "shoulder_press": exes.shoulder_press,
-    "dumbbell shoulder press": exes.shoulder_press,
-    "lateral_raise": exes.lateral_raise,
-    "dumbbell lateral raise": exes.lateral_raise,
-    "squat": exes.squat,
-    "bodyweight squats": exes.squat,
-    "goblet squats": exes.squat,
-    "sit_up": exes.sit_up,
-    "leg_raise": exes.leg_raise,
-    "jumping_jacks": exes.jumping_jacks,
-}
+# Close code for a socket whose logged exercise has no tracker.
+CLOSE_UNSUPPORTED_EXERCISE = 4422
 
 class SupervisionConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -29,194 +29,401 @@ class SupervisionConsumer(AsyncWebsocketConsumer):
         self.exercise_id_param = self.scope['url_route']['kwargs']['exercise_id'] 
         self.room_group_name = f'supervision_{self.user.id}_{self.exercise_id_param}'
 
+        self.admitted = False
+
         if not self.user.is_authenticated:
             await self.close()
             return
 
+        refusal = admission.admit(self.user.id)
+        if refusal is not None:
+            print(f"Refused supervision socket for user {self.user.username}: {refusal.reason}, retry after {refusal.retry_after:.1f}s")
+            await self.accept(subprotocol=POSE_SUBPROTOCOL if POSE_SUBPROTOCOL in self.scope.get('subprotocols', []) else None)
+            await self.send(text_data=json.dumps(refusal.message()))
+            await self.close(code=CLOSE_SERVER_BUSY)
+            return
+        self.admitted = True
+
         # --- Per-connection state for exercise tracking ---
         self.rep_counter = 0
         self.stage = None 
         self.current_sets_completed = 0 
         self.target_sets = 1 
-        self.exercise_tracker_func = None
+        self.exercise_tracker = None
+        self.kinematics = None
+        self.exercise_name = None
         self.daily_log_id = None 
+        self.session = None
+        self.session_key = None
+        self.binary_frames = POSE_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        self.flow = FrameFlowControl()
+        self.timings = ConnectionTimings()
+        self.reps_counted = 0
+        self.archive = None
 
         # Join room group (not strictly necessary for 1-to-1 but good practice)
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
-        print(f"WebSocket connected for user {self.user.username}, exercise_id_param: {self.exercise_id_param}")
+        await self.accept(subprotocol=POSE_SUBPROTOCOL if self.binary_frames else None)
+        active_connections.inc()
+        print(f"WebSocket connected for user {self.user.username}, exercise_id_param: {self.exercise_id_param}, binary frames: {self.binary_frames}")
         # Send a confirmation or initial state if needed
-        await self.send(text_data=json.dumps({"type": "connection_established", "message": "Supervision connected!"}))
+        await self.send(text_data=json.dumps({"type": "connection_established", "message": "Supervision connected!", "target_fps": self.flow.target_fps}))
 
         # Initialize exercise state (fetch target sets, current sets)
         await self.initialize_exercise_state()
 
 
     async def disconnect(self, close_code):
-        print(f"WebSocket disconnected for user {self.user.username}, exercise: {self.exercise_id_param}")
+        if not self.admitted:
+            return
+        admission.release(self.user.id)
+        active_connections.dec()
+        print(f"WebSocket disconnected for user {self.user.username}, exercise: {self.exercise_id_param}, frames: {self.flow.stats()}, timings: {self.timings.summary()}")
+        self.save_session_state()
+        if self.archive is not None:
+            await self.finish_archive()
+        if self.session_key is not None:
+            session_cache.touch(self.session_key)
+        if self.daily_log_id is not None:
+            try:
+                started = time.perf_counter()
+                await set_progress.flush([self.daily_log_id])
+                self.timings.observe("db", time.perf_counter() - started)
+            except Exception as e:
+                print(f"Error flushing set progress for log {self.daily_log_id}: {e}")
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            if not self.binary_frames:
+                await self.send(text_data=json.dumps({"type": "error", "message": f"Binary frames require the '{POSE_SUBPROTOCOL}' subprotocol."}))
+                return
+            started = time.perf_counter()
+            try:
+                timestamps_ms, frames = decode_frames(bytes_data)
+            except FrameDecodeError as e:
+                await self.send(text_data=json.dumps({"type": "error", "message": str(e)}))
+                return
+            self.timings.observe("decode", time.perf_counter() - started)
+            if self.flow.observe(timestamps_ms[-1] if len(timestamps_ms) else None, len(frames)):
+                self.timings.dropped(len(frames))
+                return
+            if self.exercise_tracker is None:  # state never initialized; the error was sent at connect
+                return
+            await self.process_frames(frames, timestamps_ms)
+            return
+
+        started = time.perf_counter()
         data = json.loads(text_data)
         message_type = data.get('type')
 
         if message_type == 'pose_landmarks':
             landmarks_data = data.get('landmarks')
-            exercise_name_from_frontend = data.get('exercise_name', '').lower().replace(" ", "_") # Standardize
             
             if not landmarks_data:
                 return
+            if self.flow.observe(data.get('t')):
+                self.timings.dropped(1)
+                return
 
-            if not self.exercise_tracker_func:
-                standardized_name = exercise_name_from_frontend 
-                if standardized_name in EXERCISE_TRACKERS:
-                    self.exercise_tracker_func = EXERCISE_TRACKERS[standardized_name]
-                    print(f"Tracker function for '{standardized_name}' set to {self.exercise_tracker_func.__name__}")
-                else:
-                    print(f"No tracker function found for exercise: {exercise_name_from_frontend}")
-                    await self.send(text_data=json.dumps({"type": "error", "message": f"Exercise '{exercise_name_from_frontend}' not supported for AI counting."}))
-                    return
+            if self.exercise_tracker is None:
+                return
             try:
-                new_stage, new_counter = self.exercise_tracker_func(landmarks_data, self.stage, self.rep_counter)
-
-                rep_counted_this_frame = False
-                if new_counter > self.rep_counter:
-                    rep_counted_this_frame = True
-                    print(f"Rep counted for {self.user.username}! Total reps this set: {new_counter}")
-                    # Send rep count update to frontend
-                    await self.send(text_data=json.dumps({
-                        'type': 'rep_update',
-                        'current_reps_this_set': new_counter,
-                        'stage': new_stage
-                    }))
-
-                self.stage = new_stage
-                self.rep_counter = new_counter 
-
-                TARGET_REPS_PER_SET_EXAMPLE = 10 
-                
-                if rep_counted_this_frame and self.rep_counter >= TARGET_REPS_PER_SET_EXAMPLE:
-                    self.current_sets_completed += 1
-                    self.rep_counter = 0
-                    self.stage = None 
-                    print(f"Set completed for {self.user.username}! Sets done: {self.current_sets_completed}/{self.target_sets}")
-
-                    await self.update_db_sets_completed()
-
-                    await self.send(text_data=json.dumps({
-                        'type': 'set_update',
-                        'sets_completed': self.current_sets_completed,
-                        'total_target_sets': self.target_sets,
-                        'message': f"Set {self.current_sets_completed} complete!"
-                    }))
-
-                    if self.current_sets_completed >= self.target_sets:
-                        print(f"All sets completed for exercise {self.exercise_id_param} by {self.user.username}!")
-                        await self.send(text_data=json.dumps({
-                            'type': 'exercise_complete',
-                            'message': 'Exercise complete! Well done!'
-                        }))
-
-
-            except TypeError as te: 
-                print(f"TypeError in tracker function: {te}. Landmarks format might be incorrect.")
-                print(f"Received landmarks_data snippet: {str(landmarks_data)[:200]}") # Log a snippet
-            except Exception as e:
-                print(f"Error processing pose for {self.exercise_tracker_func.__name__ if self.exercise_tracker_func else 'unknown exercise'}: {e}")
-                await self.send(text_data=json.dumps({"type": "error", "message": "Error processing pose."}))
+                frame = landmarks_to_array(landmarks_data)
+            except (TypeError, KeyError, ValueError, AttributeError) as e:
+                print(f"Malformed landmarks: {e}. Received landmarks_data snippet: {str(landmarks_data)[:200]}")
+                await self.send(text_data=json.dumps({"type": "error", "message": "Malformed pose landmarks."}))
+                return
+            self.timings.observe("decode", time.perf_counter() - started)
+            await self.process_frames([frame], [data['t']] if 't' in data else None)
 
+        elif message_type == 'pose_landmarks_batch':
+            # {"type": "pose_landmarks_batch", "frames": [{"t": <ms>, "landmarks": [...]}, ...]}
+            frames_data = data.get('frames')
 
-    @sync_to_async
-    def initialize_exercise_state(self):
+            if not frames_data:
+                return
+            if not isinstance(frames_data, list) or not all(isinstance(frame_data, dict) for frame_data in frames_data):
+                print(f"Malformed landmarks batch. Received frames snippet: {str(frames_data)[:200]}")
+                await self.send(text_data=json.dumps({"type": "error", "message": "Malformed pose landmarks."}))
+                return
+            if self.flow.observe(frames_data[-1].get('t'), len(frames_data)):
+                self.timings.dropped(len(frames_data))
+                return
+
+            if self.exercise_tracker is None:
+                return
+            try:
+                frames = [landmarks_to_array(frame_data['landmarks']) for frame_data in frames_data]
+                timestamps_ms = [frame_data['t'] for frame_data in frames_data] if all('t' in frame_data for frame_data in frames_data) else None
+            except (TypeError, KeyError, ValueError, AttributeError) as e:
+                print(f"Malformed landmarks batch: {e}. Received frames snippet: {str(frames_data)[:200]}")
+                await self.send(text_data=json.dumps({"type": "error", "message": "Malformed pose landmarks."}))
+                return
+            self.timings.observe("decode", time.perf_counter() - started)
+            await self.process_frames(frames, timestamps_ms)
+
+        elif message_type == 'get_stats':
+            await self.send(text_data=json.dumps({
+                "type": "stats",
+                **self.flow.stats(),
+                "reps_counted": self.reps_counted,
+                "sets_completed": self.current_sets_completed,
+                "current_reps_this_set": self.rep_counter,
+                "rep_averages": self.kinematics.averages() if self.kinematics else {},
+                "timings": self.timings.summary()
+            }))
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        started = time.perf_counter()
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        timings = getattr(self, 'timings', None)
+        if timings is not None:
+            timings.observe("send", time.perf_counter() - started)
+
+    def bind_tracker(self, exercise_name):
+        self.exercise_tracker = exes.find_tracker(exercise_name)
+        if self.exercise_tracker is None:
+            print(f"No tracker found for exercise: {exercise_name}")
+            return False
+        self.timings.exercise = self.exercise_tracker.name
+        self.kinematics = RepKinematics(self.exercise_tracker.concentric)
+        print(f"Tracker for '{exercise_name}' set to {self.exercise_tracker.name}")
+        return True
+
+    async def process_frames(self, frames, timestamps_ms=None):
+        """
+        Runs frames through the tracker state machine in order. However many
+        frames there are, the client gets at most one set_update and one
+        rep_update for them, both describing the state after the last frame.
+        When the last rep completed a set, its rep_update carries the full
+        set's count and comes before the set_update, as it did frame by frame.
+        """
+        TARGET_REPS_PER_SET_EXAMPLE = 10 
+
+        frame_times = self.frame_times(len(frames), timestamps_ms)
+        if self.archive is not None:
+            self.archive.append(frames, frame_times)
+
+        sets_before = self.current_sets_completed
+        rep_update = None  # (reps this set, stage) to report for the last rep counted
+        rep_completed_set = False
+        rep_summaries = []
+        rep_frame_t = None  # client timestamp of the frame that completed the last rep
         try:
-            today_date = timezone.now().date()
-            numeric_exercise_id = int(self.exercise_id_param)
+            started = time.perf_counter()
+            if tracker_pool.enabled:
+                # Evaluated in a worker process; this socket's next message waits for the result.
+                result = await tracker_pool.run(self.exercise_tracker.name, np.asarray(frames, dtype=np.float32),
+                                                self.stage, self.rep_counter, reps_per_set=TARGET_REPS_PER_SET_EXAMPLE)
+            else:
+                result = self.exercise_tracker.run(np.asarray(frames), self.stage, self.rep_counter,
+                                                   reps_per_set=TARGET_REPS_PER_SET_EXAMPLE)
+            elapsed = time.perf_counter() - started
+            self.flow.record_processed(len(frames), elapsed)
+            self.timings.observe("tracker", elapsed)
+            self.timings.processed(len(frames))
+            self.stage = result.stage
+            self.rep_counter = result.counter
+            rep_summaries = self.kinematics.extend(frame_times, result.angles, result.rep_frames)
+            if result.rep_frames:
+                self.reps_counted += len(result.rep_frames)
+                rep_completed_set = bool(result.set_frames) and result.rep_frames[-1] == result.set_frames[-1]
+                if rep_completed_set:
+                    rep_update = (TARGET_REPS_PER_SET_EXAMPLE, self.exercise_tracker.rep_stage)
+                else:
+                    rep_update = (self.rep_counter, self.stage)
+                if timestamps_ms is not None:
+                    rep_frame_t = float(frame_times[result.rep_frames[-1]])
+                print(f"{len(result.rep_frames)} rep(s) counted for {self.user.username}! Total reps this set: {self.rep_counter}")
+            if result.set_frames:
+                self.current_sets_completed += len(result.set_frames)
+                print(f"Set completed for {self.user.username}! Sets done: {self.current_sets_completed}/{self.target_sets}")
 
-            daily_log = DailyWorkoutLog.objects.filter(
-                workout_plan__user=self.user,
-                date=today_date
-            ).first()
+        except TypeError as te: 
+            print(f"TypeError in tracker function: {te}. Landmarks format might be incorrect.")
+        except Exception as e:
+            print(f"Error processing pose for {self.exercise_tracker.name if self.exercise_tracker else 'unknown exercise'}: {e}")
+            await self.send(text_data=json.dumps({"type": "error", "message": "Error processing pose."}))
 
-            if not daily_log:
-                print(f"Error: No DailyWorkoutLog found for user {self.user.id} on {today_date}")
-                async_to_sync(self.send)(text_data=json.dumps({"type": "error", "message": "Today's workout log not found."}))
-                return
+        if rep_summaries and self.daily_log_id is not None:
+            set_progress.record_reps(self.daily_log_id, int(self.exercise_id_param), [stored_row(summary) for summary in rep_summaries])
+            set_progress.ensure_flusher()
 
-            self.daily_log_id = daily_log.id
-            found_exercise_log = None
-            for ex_log in daily_log.logged_exercises:
-                if ex_log.get("original_exercise_id") == numeric_exercise_id:
-                    found_exercise_log = ex_log
-                    break
-            
-            if found_exercise_log:
-                self.current_sets_completed = found_exercise_log.get("actual_sets_completed", 0)
-                target_sets_str = found_exercise_log.get("target_sets", "1")
-                try:
-                    self.target_sets = int(target_sets_str.split('-')[-1])
-                except ValueError:
-                    self.target_sets = 1
-                print(f"Initialized state for exercise {numeric_exercise_id}: Current Sets {self.current_sets_completed}, Target Sets {self.target_sets}")
-                async_to_sync(self.send)(text_data=json.dumps({
-                    "type": "initial_state",
-                    "current_sets_completed": self.current_sets_completed,
-                    "target_sets": self.target_sets,
-                    "exercise_name": found_exercise_log.get("exercise_name")
+        if rep_update is not None and rep_completed_set:
+            await self.send_rep_update(*rep_update, rep_summaries, rep_frame_t)
+
+        if self.current_sets_completed > sets_before:
+            await self.update_db_sets_completed()
+
+            await self.send(text_data=json.dumps({
+                'type': 'set_update',
+                'sets_completed': self.current_sets_completed,
+                'total_target_sets': self.target_sets,
+                'message': f"Set {self.current_sets_completed} complete!",
+                'rep_kinematics': rep_summaries[-1] if rep_summaries else None,
+                'frame_t': rep_frame_t
+            }))
+
+            if self.current_sets_completed >= self.target_sets:
+                print(f"All sets completed for exercise {self.exercise_id_param} by {self.user.username}!")
+                await self.send(text_data=json.dumps({
+                    'type': 'exercise_complete',
+                    'message': 'Exercise complete! Well done!'
                 }))
 
-            else:
-                print(f"Error: Exercise with original_id {numeric_exercise_id} not found in today's log for user {self.user.id}")
-                async_to_sync(self.send)(text_data=json.dumps({"type": "error", "message": "Exercise not found in today's log."}))
+        if rep_update is not None and not rep_completed_set:
+            await self.send_rep_update(*rep_update, rep_summaries, rep_frame_t)
+
+        self.save_session_state()
+
+        target_fps = self.flow.retarget()
+        if target_fps is not None:
+            await self.send(text_data=json.dumps({"type": "rate_control", "target_fps": target_fps}))
+
+
+    async def send_rep_update(self, reps_this_set, stage, rep_summaries, frame_t):
+        # Send rep count update to frontend
+        await self.send(text_data=json.dumps({
+            'type': 'rep_update',
+            'current_reps_this_set': reps_this_set,
+            'stage': stage,
+            'rep_kinematics': rep_summaries[-1] if rep_summaries else None,
+            'frame_t': frame_t
+        }))
+
+    def frame_times(self, count, timestamps_ms):
+        """Client timestamps when sent, otherwise receive time spaced back at the target frame rate."""
+        if timestamps_ms is not None:
+            return timestamps_ms
+        return time.time() * 1000.0 - (1000.0 / self.flow.target_fps) * np.arange(count - 1, -1, -1)
+
+    async def initialize_exercise_state(self):
+        try:
+            numeric_exercise_id = int(self.exercise_id_param)
+            self.session_key = (self.user.id, timezone.now().date(), numeric_exercise_id)
+
+            session = session_cache.get(self.session_key)
+            resumed = session is not None
+            if session is None:
+                started = time.perf_counter()
+                session, error_message = await self.load_exercise_session(numeric_exercise_id)
+                self.timings.observe("db", time.perf_counter() - started)
+                if session is None:
+                    await self.send(text_data=json.dumps({"type": "error", "message": error_message}))
+                    return
+                session_cache.put(self.session_key, session)
+
+            self.session = session
+            self.daily_log_id = session.daily_log_id
+            self.exercise_name = session.exercise_name
+            self.target_sets = session.target_sets
+            self.current_sets_completed = session.sets_completed
+            self.stage = session.stage
+            self.rep_counter = session.rep_counter
+            if not self.bind_tracker(self.exercise_name):
+                await self.send(text_data=json.dumps({"type": "error", "message": f"Exercise '{self.exercise_name}' not supported for AI counting."}))
+                await self.close(code=CLOSE_UNSUPPORTED_EXERCISE)
+                return
+            self.start_archive(numeric_exercise_id)
+            print(f"Initialized state for exercise {numeric_exercise_id}: Current Sets {self.current_sets_completed}, Target Sets {self.target_sets}, resumed: {resumed}")
+            await self.send(text_data=json.dumps({
+                "type": "initial_state",
+                "current_sets_completed": self.current_sets_completed,
+                "target_sets": self.target_sets,
+                "exercise_name": self.exercise_name,
+                "current_reps_this_set": self.rep_counter,
+                "stage": self.stage,
+                "resumed": resumed
+            }))
 
         except Exception as e:
             print(f"Error initializing exercise state: {e}")
-            async_to_sync(self.send)(text_data=json.dumps({"type": "error", "message": "Error initializing supervision state."}))
+            await self.send(text_data=json.dumps({"type": "error", "message": "Error initializing supervision state."}))
+
+    def start_archive(self, numeric_exercise_id):
+        config = archive_settings()
+        if not config["ENABLED"]:
+            return
+        name = f"{self.daily_log_id}-{numeric_exercise_id}-{uuid.uuid4().hex[:8]}{ARCHIVE_SUFFIX}"
+        try:
+            self.archive = PoseArchiveWriter(
+                Path(config["DIRECTORY"]) / str(self.session_key[1]) / name,
+                meta={
+                    "user_id": self.user.id,
+                    "daily_log_id": self.daily_log_id,
+                    "original_exercise_id": numeric_exercise_id,
+                },
+                chunk_frames=config["CHUNK_FRAMES"],
+            )
+        except OSError as e:
+            print(f"Error opening pose archive: {e}")
+
+    async def finish_archive(self):
+        archive, self.archive = self.archive, None
+        archive.meta["exercise_name"] = self.exercise_tracker.name if self.exercise_tracker else self.exercise_name
+        try:
+            await sync_to_async(archive.close, thread_sensitive=False)()
+            if not archive.frame_count:
+                archive.path.unlink(missing_ok=True)
+                return
+            await sync_to_async(PoseSessionRecording.objects.create)(
+                daily_log_id=self.daily_log_id,
+                original_exercise_id=archive.meta["original_exercise_id"],
+                exercise_name=archive.meta["exercise_name"] or "",
+                file_path=str(archive.path),
+                frame_count=archive.frame_count,
+                size_bytes=archive.size,
+                first_frame_ms=archive.first_ms,
+                last_frame_ms=archive.last_ms,
+            )
+            print(f"Archived {archive.frame_count} frames ({archive.size} bytes) to {archive.path}")
+        except Exception as e:
+            print(f"Error finishing pose archive {archive.path}: {e}")
 
+    def save_session_state(self):
+        if self.session is None:
+            return
+        self.session.sets_completed = self.current_sets_completed
+        self.session.stage = self.stage
+        self.session.rep_counter = self.rep_counter
 
     @sync_to_async
-    def update_db_sets_completed(self):
+    def load_exercise_session(self, numeric_exercise_id):
+        today_date = self.session_key[1]
+        found_exercise_log = ExerciseLogEntry.objects.filter(
+            daily_log__workout_plan__user=self.user,
+            daily_log__date=today_date,
+            original_exercise_id=numeric_exercise_id,
+        ).only('id', 'daily_log_id', 'exercise_name', 'target_sets', 'actual_sets_completed').first()
+
+        if not found_exercise_log:
+            if not DailyWorkoutLog.objects.filter(workout_plan__user=self.user, date=today_date).exists():
+                print(f"Error: No DailyWorkoutLog found for user {self.user.id} on {today_date}")
+                return None, "Today's workout log not found."
+            print(f"Error: Exercise with original_id {numeric_exercise_id} not found in today's log for user {self.user.id}")
+            return None, "Exercise not found in today's log."
+
+        buffered_sets = set_progress.pending(found_exercise_log.daily_log_id, numeric_exercise_id)
+        return SupervisionSession(
+            found_exercise_log.daily_log_id,
+            found_exercise_log,
+            parse_target_sets(found_exercise_log.target_sets),
+            found_exercise_log.actual_sets_completed if buffered_sets is None else buffered_sets,
+        ), None
+
+
+    async def update_db_sets_completed(self):
         if self.daily_log_id is None:
             print("Error: daily_log_id not set, cannot update DB.")
             return
 
-        try:
-            daily_log = DailyWorkoutLog.objects.get(id=self.daily_log_id)
-            updated_logged_exercises = []
-            exercise_updated_in_log = False
-            numeric_exercise_id = int(self.exercise_id_param)
-
-            for ex_log in daily_log.logged_exercises:
-                if ex_log.get("original_exercise_id") == numeric_exercise_id:
-                    ex_log["actual_sets_completed"] = self.current_sets_completed
-                    target_sets_for_status_str = ex_log.get("target_sets", "1")
-                    try:
-                        target_sets_for_status = int(target_sets_for_status_str.split('-')[-1])
-                    except ValueError:
-                        target_sets_for_status = 1
-                    
-                    if self.current_sets_completed >= target_sets_for_status:
-                        ex_log["completed_status"] = "full"
-                    elif self.current_sets_completed > 0:
-                        ex_log["completed_status"] = "partial"
-                    else:
-                        ex_log["completed_status"] = "pending"
-                    exercise_updated_in_log = True
-                updated_logged_exercises.append(ex_log)
-            
-            if exercise_updated_in_log:
-                daily_log.logged_exercises = updated_logged_exercises
-                daily_log.save(update_fields=['logged_exercises'])
-                print(f"DB updated for log {self.daily_log_id}, exercise {self.exercise_id_param}, sets: {self.current_sets_completed}")
-            else:
-                print(f"Exercise {self.exercise_id_param} not found in log {self.daily_log_id} during DB update attempt.")
-
-        except DailyWorkoutLog.DoesNotExist:
-            print(f"Error: DailyWorkoutLog with id {self.daily_log_id} not found for DB update.")
-        except Exception as e:
-            print(f"Error updating DB sets completed: {e}")
+        # Written behind by gym.persistence: coalesced per log and flushed in batches.
+        set_progress.record(self.daily_log_id, int(self.exercise_id_param), self.current_sets_completed)
+        set_progress.ensure_flusher()
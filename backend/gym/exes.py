@@ -1,144 +1,349 @@
 #exes.py
+#
+# Exercise trackers are data. Each entry in EXERCISE_SPECS names the
+# features it reads from a frame and the stage transitions those features
+# drive; compile_spec() turns it into an ExerciseTracker whose transition
+# table is evaluated for a whole batch of frames at once.
+#
+# Features:
+#     ("angle", A, B, C)   joint angle at B in degrees (gym.util.calculate_angles)
+#     ("x" | "y", A, B)    A.x - B.x (or .y) in normalized image coordinates
+#     ("abs_x" | "abs_y", A, B)   the same difference, absolute
+#
+# Transitions are checked in order on every frame and each one sees the
+# stage left by the previous one:
+#     {"from": stage or absent for any stage,
+#      "when": [(feature, "<" | ">", threshold), ...],   all must hold
+#      "to": stage, "count": True to count a rep}
+#
+# A pair of transitions with different thresholds (curl: > 160 to go
+# "down", < 40 from "down" to count) is the hysteresis band that keeps
+# jitter around one threshold from counting reps.
+#
+# "kinematics" names the joint angle (A, B, C) that gym.kinematics follows
+# for tempo and range of motion, and whether it closes (curl) or opens
+# (press) in the concentric phase. ExerciseTracker.run returns it per frame.
+#
+# "aliases" are other names a routine may log the exercise under. find_tracker()
+# looks names up in TRACKER_INDEX, built once from the tracker names and
+# aliases after normalize_exercise_name(): case, punctuation and plurals are
+# ignored, so "Sit-Ups", "sit ups" and "sit_up" are the same key. A name that
+# is still unknown is retried without leading equipment or posture words
+# ("Seated Dumbbell Shoulder Press" -> "shoulder press").
 
-import mediapipe as mp
-from gym.util import calculate_angle
-
-
-mp_pose = mp.solutions.pose
-
-def curl_l(landmarks,stage,counter):
-
-    shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-    elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-    wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-    
-    # Calculate angle
-    angle = calculate_angle(shoulder, elbow, wrist)
-    
-    # Curl counter logic
-    if angle > 160:
-        stage = "down"
-    if angle < 40 and stage == 'down':
-        stage = "up"
-        counter += 1
-    
-    return stage,counter
-
-def curl_r(landmarks,stage,counter):
-
-    shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-    elbow = [landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value].y]
-    wrist = [landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value].y]
-    
-    # Calculate angle
-    angle = calculate_angle(shoulder, elbow, wrist)
-    
-    # Curl counter logic
-    if angle > 160:
-        stage = "down"
-    if angle < 40 and stage == 'down':
-        stage = "up"
-        counter += 1
-    
-    return stage,counter
-
-def shoulder_press(landmarks,stage,counter):
-    right_index = landmarks[mp_pose.PoseLandmark.RIGHT_INDEX.value].y
-    left_index = landmarks[mp_pose.PoseLandmark.LEFT_INDEX.value].y
-    nose = landmarks[mp_pose.PoseLandmark.NOSE.value].y
-    
-    if right_index > nose and left_index > nose:
-        stage = "up"
-    if right_index < nose and left_index < nose and stage == 'up':
-        stage = "down"
-        counter += 1
-    
-    return stage,counter
-
-def lateral_raise(landmarks,stage,counter): #can be used for FRONT RAISE AS WELL
-    right_index = landmarks[mp_pose.PoseLandmark.RIGHT_INDEX.value].y
-    left_index = landmarks[mp_pose.PoseLandmark.LEFT_INDEX.value].y
-    right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y
-
-    if right_index > right_shoulder and left_index > right_shoulder:
-        stage = "up"
-    if right_index < right_shoulder and left_index < right_shoulder and stage == 'up':
-        stage = "down"
-        counter += 1
-    
-    return stage,counter
-
-def squat(landmarks,stage,counter):
-    right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y
-    right_knee = landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y
-
-    if right_hip > right_knee:
-        stage = "up"
-    if right_hip < right_knee and stage == 'up':
-        stage = "down"
-        counter += 1
-    
-    return stage,counter
-
-def sit_up(landmarks,stage,counter):
-    nose = landmarks[mp_pose.PoseLandmark.NOSE.value].y
-    right_knee = landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y
-
-    if right_knee > nose:
-        stage = "up"
-    if right_knee < nose and stage == 'up':
-        stage = "down"
-        counter += 1
-    
-    return stage,counter
-
-def leg_raise(landmarks,stage,counter): #not sure if its working
-    nose = [landmarks[mp_pose.PoseLandmark.NOSE.value].x,
-            landmarks[mp_pose.PoseLandmark.NOSE.value].y]
-    right_knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-    right_foot_index = [landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value].y]
-    
-    # Calculate angle
-    angle = calculate_angle(nose, right_knee, right_foot_index)
-
-    # counter logic
-    if angle > 160:
-        stage = "down"
-    if angle < 100 and stage == 'down':
-        stage = "up"
-        counter += 1
-
-def jumping_jacks(landmarks,stage,counter): #to test
-
-    right_foot_index = landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value].x
-    left_foot_index = landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value].x
-    right_index = landmarks[mp_pose.PoseLandmark.RIGHT_INDEX.value].y
-    left_index = landmarks[mp_pose.PoseLandmark.LEFT_INDEX.value].y
-    nose = landmarks[mp_pose.PoseLandmark.NOSE.value].y
-
-    if right_index > nose and left_index > nose and abs(right_foot_index - left_foot_index) > 100:
-        stage = "up"
-    if right_index < nose and left_index < nose and abs(right_foot_index - left_foot_index) < 100 and stage == 'up':
-        stage = "down"
-        counter += 1
-
-    return stage,counter
+import re
+from collections import namedtuple
 
+import numpy as np
 
+from gym.landmarks import POSE_LANDMARKS
+from gym.util import calculate_angles, joint_triplets
 
 
+EXERCISE_SPECS = {
+    "curl_l": {
+        "features": {"elbow": ("angle", "LEFT_SHOULDER", "LEFT_ELBOW", "LEFT_WRIST")},
+        "transitions": [
+            {"when": [("elbow", ">", 160)], "to": "down"},
+            {"from": "down", "when": [("elbow", "<", 40)], "to": "up", "count": True},
+        ],
+        "kinematics": {"angle": ("LEFT_SHOULDER", "LEFT_ELBOW", "LEFT_WRIST"), "concentric": "closing"},
+        "aliases": ["bicep curl", "hammer curl"],
+    },
+    "curl_r": {
+        "features": {"elbow": ("angle", "RIGHT_SHOULDER", "RIGHT_ELBOW", "RIGHT_WRIST")},
+        "transitions": [
+            {"when": [("elbow", ">", 160)], "to": "down"},
+            {"from": "down", "when": [("elbow", "<", 40)], "to": "up", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_SHOULDER", "RIGHT_ELBOW", "RIGHT_WRIST"), "concentric": "closing"},
+        "aliases": ["curl"],
+    },
+    "shoulder_press": {
+        "features": {
+            "right_hand": ("y", "RIGHT_INDEX", "NOSE"),
+            "left_hand": ("y", "LEFT_INDEX", "NOSE"),
+        },
+        "transitions": [
+            {"when": [("right_hand", ">", 0), ("left_hand", ">", 0)], "to": "up"},
+            {"from": "up", "when": [("right_hand", "<", 0), ("left_hand", "<", 0)], "to": "down", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_SHOULDER", "RIGHT_ELBOW", "RIGHT_WRIST"), "concentric": "opening"},
+        "aliases": ["overhead press", "military press"],
+    },
+    # can be used for FRONT RAISE AS WELL
+    "lateral_raise": {
+        "features": {
+            "right_hand": ("y", "RIGHT_INDEX", "RIGHT_SHOULDER"),
+            "left_hand": ("y", "LEFT_INDEX", "RIGHT_SHOULDER"),
+        },
+        "transitions": [
+            {"when": [("right_hand", ">", 0), ("left_hand", ">", 0)], "to": "up"},
+            {"from": "up", "when": [("right_hand", "<", 0), ("left_hand", "<", 0)], "to": "down", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_HIP", "RIGHT_SHOULDER", "RIGHT_ELBOW"), "concentric": "opening"},
+        "aliases": ["front raise"],
+    },
+    "squat": {
+        "features": {"hip_below_knee": ("y", "RIGHT_HIP", "RIGHT_KNEE")},
+        "transitions": [
+            {"when": [("hip_below_knee", ">", 0)], "to": "up"},
+            {"from": "up", "when": [("hip_below_knee", "<", 0)], "to": "down", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_HIP", "RIGHT_KNEE", "RIGHT_ANKLE"), "concentric": "opening"},
+        "aliases": ["goblet squat", "air squat"],
+    },
+    "sit_up": {
+        "features": {"knee_below_nose": ("y", "RIGHT_KNEE", "NOSE")},
+        "transitions": [
+            {"when": [("knee_below_nose", ">", 0)], "to": "up"},
+            {"from": "up", "when": [("knee_below_nose", "<", 0)], "to": "down", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_SHOULDER", "RIGHT_HIP", "RIGHT_KNEE"), "concentric": "closing"},
+    },
+    # not sure if its working
+    "leg_raise": {
+        "features": {"hip": ("angle", "NOSE", "RIGHT_KNEE", "RIGHT_FOOT_INDEX")},
+        "transitions": [
+            {"when": [("hip", ">", 160)], "to": "down"},
+            {"from": "down", "when": [("hip", "<", 100)], "to": "up", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_SHOULDER", "RIGHT_HIP", "RIGHT_KNEE"), "concentric": "closing"},
+        "aliases": ["lying leg raise"],
+    },
+    # to test
+    "jumping_jacks": {
+        "features": {
+            "right_hand": ("y", "RIGHT_INDEX", "NOSE"),
+            "left_hand": ("y", "LEFT_INDEX", "NOSE"),
+            "feet_apart": ("abs_x", "RIGHT_FOOT_INDEX", "LEFT_FOOT_INDEX"),
+        },
+        "transitions": [
+            {"when": [("right_hand", ">", 0), ("left_hand", ">", 0), ("feet_apart", ">", 100)], "to": "up"},
+            {"from": "up", "when": [("right_hand", "<", 0), ("left_hand", "<", 0), ("feet_apart", "<", 100)],
+             "to": "down", "count": True},
+        ],
+        "kinematics": {"angle": ("RIGHT_HIP", "RIGHT_SHOULDER", "RIGHT_WRIST"), "concentric": "opening"},
+        "aliases": ["star jump"],
+    },
+}
 
+AXES = {"x": 0, "y": 1}
+ANY_STAGE = -1
+NO_STAGE = 0
 
+TrackerResult = namedtuple("TrackerResult", ["stage", "counter", "rep_frames", "set_frames", "angles"])
 
 
+class ExerciseTracker:
+    """
+    Compiled form of one EXERCISE_SPECS entry. Stages are small ints
+    internally (0 is "no stage yet") and names at the edges.
+    """
 
+    def __init__(self, name, stages, angle_joints, delta_points, delta_axes, delta_abs,
+                 cond_features, cond_signs, cond_thresholds, membership,
+                 trans_from, trans_to, trans_counts, kinematic_column, concentric):
+        self.name = name
+        self.stages = stages
+        self.stage_ids = {stage: i for i, stage in enumerate(stages)}
+        self.angle_joints = angle_joints
+        self.delta_points = delta_points
+        self.delta_axes = delta_axes
+        self.delta_abs = delta_abs
+        self.cond_features = cond_features
+        self.cond_signs = cond_signs
+        self.cond_thresholds = cond_thresholds
+        self.membership = membership
+        self.required = membership.sum(axis=0)
+        self.transitions = list(zip(trans_from, trans_to, trans_counts))
+        self.kinematic_column = kinematic_column
+        self.concentric = concentric
 
+    def __repr__(self):
+        return f"<ExerciseTracker {self.name}>"
 
+    def features(self, frames):
+        """(n, f) feature matrix for a (n, 33, 4) stack of frames."""
+        columns = []
+        if len(self.angle_joints):
+            columns.append(calculate_angles(frames, self.angle_joints))
+        if len(self.delta_points):
+            deltas = (frames[:, self.delta_points[:, 0], self.delta_axes]
+                      - frames[:, self.delta_points[:, 1], self.delta_axes])
+            columns.append(np.where(self.delta_abs, np.abs(deltas), deltas))
+        return np.concatenate(columns, axis=1) if len(columns) > 1 else columns[0]
+
+    def fired(self, frames, features=None):
+        """(n, t) bool matrix: which transitions' conditions hold on which frame."""
+        if features is None:
+            features = self.features(frames)
+        values = features[:, self.cond_features] * self.cond_signs
+        conditions = (values > self.cond_thresholds).astype(np.int32)
+        return conditions @ self.membership == self.required
+
+    def run(self, frames, stage=None, counter=0, reps_per_set=None):
+        """
+        Steps the state machine over a (n, 33, 4) stack of frames. When
+        `reps_per_set` is given, the counter and stage reset after that many
+        reps, exactly like a completed set. Returns a TrackerResult with the
+        final stage and counter, the frame indices where reps and sets
+        were completed and the kinematic angle of every frame.
+        """
+        frames = np.asarray(frames, dtype=np.float32)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        features = self.features(frames)
+        fired = self.fired(frames, features)
+        active = np.flatnonzero(fired.any(axis=1))
+
+        state = self.stage_ids[stage]
+        rep_frames = []
+        set_frames = []
+        for i, row in zip(active.tolist(), fired[active].tolist()):
+            for fires, (from_state, to_state, counts) in zip(row, self.transitions):
+                if fires and (from_state == ANY_STAGE or from_state == state):
+                    state = to_state
+                    if counts:
+                        counter += 1
+                        rep_frames.append(i)
+            if reps_per_set and rep_frames and rep_frames[-1] == i and counter >= reps_per_set:
+                set_frames.append(i)
+                counter = 0
+                state = NO_STAGE
+        return TrackerResult(self.stages[state], counter, rep_frames, set_frames, features[:, self.kinematic_column])
+
+    @property
+    def rep_stage(self):
+        """The stage a counted rep leaves the state machine in."""
+        return next(self.stages[to_state] for _from_state, to_state, counts in self.transitions if counts)
+
+    def __call__(self, frame, stage, counter):
+        result = self.run(frame, stage, counter)
+        return result.stage, result.counter
+
+
+def compile_spec(name, spec):
+    angle_joints, delta_points, delta_axes, delta_abs = [], [], [], []
+    feature_columns = {}
+    for feature_name, (kind, *landmarks) in spec["features"].items():
+        indices = [POSE_LANDMARKS[landmark] for landmark in landmarks]
+        if kind == "angle":
+            feature_columns[feature_name] = ("angle", len(angle_joints))
+            angle_joints.append(indices)
+        else:
+            feature_columns[feature_name] = ("delta", len(delta_points))
+            delta_points.append(indices)
+            delta_axes.append(AXES[kind[-1]])
+            delta_abs.append(kind.startswith("abs_"))
+
+    def column(feature_name):
+        kind, position = feature_columns[feature_name]
+        return position if kind == "angle" else len(angle_joints) + position
+
+    kinematic_joints = [POSE_LANDMARKS[landmark] for landmark in spec["kinematics"]["angle"]]
+    if kinematic_joints in angle_joints:
+        kinematic_column = angle_joints.index(kinematic_joints)
+    else:
+        kinematic_column = len(angle_joints)
+        angle_joints.append(kinematic_joints)
+
+    stages = [None]
+    for transition in spec["transitions"]:
+        for stage in (transition.get("from"), transition["to"]):
+            if stage is not None and stage not in stages:
+                stages.append(stage)
+
+    cond_features, cond_signs, cond_thresholds = [], [], []
+    membership = np.zeros((sum(len(t["when"]) for t in spec["transitions"]), len(spec["transitions"])), dtype=np.int32)
+    trans_from, trans_to, trans_counts = [], [], []
+    for t, transition in enumerate(spec["transitions"]):
+        for feature_name, op, threshold in transition["when"]:
+            # x < t is evaluated as -x > -t so every condition is one comparison.
+            sign = 1.0 if op == ">" else -1.0
+            membership[len(cond_features), t] = 1
+            cond_features.append(column(feature_name))
+            cond_signs.append(sign)
+            cond_thresholds.append(sign * threshold)
+        trans_from.append(stages.index(transition["from"]) if "from" in transition else ANY_STAGE)
+        trans_to.append(stages.index(transition["to"]))
+        trans_counts.append(bool(transition.get("count")))
+
+    return ExerciseTracker(
+        name,
+        stages,
+        joint_triplets(*angle_joints) if angle_joints else np.empty((0, 3), dtype=np.intp),
+        np.array(delta_points, dtype=np.intp).reshape(-1, 2),
+        np.array(delta_axes, dtype=np.intp),
+        np.array(delta_abs, dtype=bool),
+        np.array(cond_features, dtype=np.intp),
+        np.array(cond_signs, dtype=np.float32),
+        np.array(cond_thresholds, dtype=np.float32),
+        membership,
+        trans_from,
+        trans_to,
+        trans_counts,
+        kinematic_column,
+        spec["kinematics"]["concentric"],
+    )
+
+
+TRACKERS = {name: compile_spec(name, spec) for name, spec in EXERCISE_SPECS.items()}
+
+
+def _singular(word):
+    if word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith(("ss", "us")) and len(word) > 2:
+        return word[:-1]
+    return word
+
+
+def normalize_exercise_name(name):
+    """'Dumbbell Shoulder-Presses' -> 'dumbbell_shoulder_press'."""
+    return "_".join(_singular(word) for word in re.findall(r"[a-z0-9]+", (name or "").lower()))
+
+
+MODIFIER_WORDS = frozenset({
+    "dumbbell", "barbell", "kettlebell", "cable", "machine", "band", "bodyweight", "weighted",
+    "seated", "standing", "alternating", "single", "arm", "one",
+})
+
+
+def _build_index():
+    index = {}
+    for name, spec in EXERCISE_SPECS.items():
+        for alias in (name, *spec.get("aliases", ())):
+            key = normalize_exercise_name(alias)
+            if index.setdefault(key, name) != name:
+                raise ValueError(f"Exercise alias '{alias}' names both {index[key]} and {name}")
+    return index
+
+
+TRACKER_INDEX = _build_index()
+
+
+def find_tracker(exercise_name):
+    """The ExerciseTracker for a logged exercise name, or None if none supports it."""
+    key = normalize_exercise_name(exercise_name)
+    if key not in TRACKER_INDEX:
+        words = key.split("_")
+        while len(words) > 1 and words[0] in MODIFIER_WORDS:
+            words.pop(0)
+        key = "_".join(words)
+    name = TRACKER_INDEX.get(key)
+    return TRACKERS[name] if name is not None else None
+
+
+def evaluate_batch(requests):
+    """
+    Process-pool entry point (gym/offload.py): runs each (tracker name,
+    frames, stage, counter, reps_per_set) request in order. It lives here
+    so workers only import this module, numpy and gym.util/landmarks.
+    """
+    return [
+        TRACKERS[name].run(frames, stage, counter, reps_per_set=reps_per_set)
+        for name, frames, stage, counter, reps_per_set in requests
+    ]
@@ -0,0 +1,121 @@
+#flow.py
+#
+# Per-connection flow control for the supervision socket.
+#
+# The consumer handles one message at a time, so when a client sends faster
+# than we evaluate, frames wait in the socket's queue and rep feedback falls
+# behind. Every frame carries the client's timestamp; the gap between it and
+# our clock, minus the smallest gap seen recently (clock offset + network
+# floor), is how far behind we are. Frames further behind than MAX_LAG_MS
+# are dropped without evaluation: by the time we would answer, newer frames
+# are already queued behind them. The target frame rate sent to the client
+# backs off while we drop or lag, and creeps back up once we keep up.
+
+import time
+
+from django.conf import settings
+
+DEFAULTS = {
+    "MAX_LAG_MS": 250.0,          # frames further behind than this are dropped
+    "MIN_FPS": 10,                # never ask for less; reps need this to be counted reliably
+    "MAX_FPS": 30,
+    "CONTROL_INTERVAL_S": 1.0,    # how often the target rate may change
+    "BASELINE_WINDOW_S": 30.0,    # how long a clock-offset baseline is trusted
+    "CPU_BUDGET": 0.5,            # share of a core one connection may use for evaluation
+}
+
+
+def rate_control_settings():
+    return {**DEFAULTS, **getattr(settings, "SUPERVISION_RATE_CONTROL", {})}
+
+
+class FrameFlowControl:
+    def __init__(self, config=None, clock=time.monotonic):
+        self.config = config or rate_control_settings()
+        self.clock = clock
+        self.target_fps = self.config["MAX_FPS"]
+        self.processed = 0
+        self.dropped = 0
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.service_s_per_frame = 0.0
+        self._baseline = None
+        self._window_min = None
+        self._window_started = clock()
+        self._last_control = clock()
+        self._dropped_at_last_control = 0
+        self._max_lag_since_control = 0.0
+
+    def observe(self, client_timestamp_ms, frame_count=1):
+        """
+        Updates the lag estimate from the newest client timestamp in a
+        message and returns True when the message is stale and should be
+        dropped. Messages without a timestamp are never dropped.
+        """
+        if client_timestamp_ms is None:
+            return False
+        now = self.clock()
+        offset_ms = now * 1000.0 - float(client_timestamp_ms)
+
+        if self._window_min is None or offset_ms < self._window_min:
+            self._window_min = offset_ms
+        if self._baseline is None or offset_ms < self._baseline:
+            self._baseline = offset_ms
+        if now - self._window_started >= self.config["BASELINE_WINDOW_S"]:
+            # Let the baseline follow clock drift instead of keeping an all-time minimum.
+            self._baseline = self._window_min
+            self._window_min = offset_ms
+            self._window_started = now
+
+        self.lag_ms = offset_ms - self._baseline
+        self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+        self._max_lag_since_control = max(self._max_lag_since_control, self.lag_ms)
+        if self.lag_ms > self.config["MAX_LAG_MS"]:
+            self.dropped += frame_count
+            return True
+        return False
+
+    def record_processed(self, frame_count, elapsed_s):
+        self.processed += frame_count
+        per_frame = elapsed_s / max(frame_count, 1)
+        if self.service_s_per_frame:
+            self.service_s_per_frame += 0.1 * (per_frame - self.service_s_per_frame)
+        else:
+            self.service_s_per_frame = per_frame
+
+    def retarget(self):
+        """
+        Returns the new target frame rate when it changed since the last
+        control interval, otherwise None. Multiplicative back-off while we
+        drop frames or run more than half the lag budget behind, additive
+        increase while we keep up, capped by what the CPU budget allows.
+        """
+        now = self.clock()
+        if now - self._last_control < self.config["CONTROL_INTERVAL_S"]:
+            return None
+
+        target = self.target_fps
+        if self.dropped > self._dropped_at_last_control or self._max_lag_since_control > self.config["MAX_LAG_MS"] / 2:
+            target = int(target * 0.75)
+        elif self._max_lag_since_control < self.config["MAX_LAG_MS"] / 10:
+            target += 2
+        if self.service_s_per_frame:
+            target = min(target, int(self.config["CPU_BUDGET"] / self.service_s_per_frame))
+        target = max(self.config["MIN_FPS"], min(self.config["MAX_FPS"], target))
+
+        self._last_control = now
+        self._dropped_at_last_control = self.dropped
+        self._max_lag_since_control = 0.0
+        if target == self.target_fps:
+            return None
+        self.target_fps = target
+        return target
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "lag_ms": round(self.lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "target_fps": self.target_fps,
+        }
@@ -0,0 +1,139 @@
+#jsonpatch.py
+#
+# JSON Patch (RFC 6902) for one logged exercise.
+#
+# PATCH /daily-logs/<pk>/exercises/<original_exercise_id>/ takes a list of
+# operations such as
+#
+#     [{"op": "replace", "path": "/actual_sets_completed", "value": 2},
+#      {"op": "add", "path": "/actual_reps_per_set/-", "value": 10}]
+#
+# and applies them to the entry's logged_exercises dict. All six operations
+# are supported (add, remove, replace, move, copy, test); paths are JSON
+# Pointers (RFC 6901), "-" appends to a list. The patch is applied to a copy
+# and either every operation succeeds or PatchError says which one failed.
+
+import copy
+import re
+
+OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_pointer(pointer):
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise PatchError(f"Invalid JSON pointer {pointer!r}.")
+    if not pointer:
+        return []
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container, token, pointer, allow_end=False):
+    if allow_end and token == "-":
+        return len(container)
+    if not re.fullmatch(r"0|[1-9][0-9]*", token):
+        raise PatchError(f"Invalid list index in {pointer!r}.")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"List index out of range in {pointer!r}.")
+    return index
+
+
+def _parent(document, tokens, pointer):
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict) and token in target:
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_list_index(target, token, pointer)]
+        else:
+            raise PatchError(f"Path {pointer!r} does not exist.")
+    if not isinstance(target, (dict, list)):
+        raise PatchError(f"Path {pointer!r} does not exist.")
+    return target
+
+
+def _get(document, pointer):
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return document
+    parent, token = _parent(document, tokens, pointer), tokens[-1]
+    if isinstance(parent, list):
+        return parent[_list_index(parent, token, pointer)]
+    if token not in parent:
+        raise PatchError(f"Path {pointer!r} does not exist.")
+    return parent[token]
+
+
+def _add(document, pointer, value):
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise PatchError("The whole entry can't be replaced.")
+    parent, token = _parent(document, tokens, pointer), tokens[-1]
+    if isinstance(parent, list):
+        parent.insert(_list_index(parent, token, pointer, allow_end=True), value)
+    else:
+        parent[token] = value
+
+
+def _remove(document, pointer):
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise PatchError("The whole entry can't be removed.")
+    parent, token = _parent(document, tokens, pointer), tokens[-1]
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, token, pointer))
+    if token not in parent:
+        raise PatchError(f"Path {pointer!r} does not exist.")
+    return parent.pop(token)
+
+
+def apply_patch(document, operations):
+    """Returns a patched copy of `document`; raises PatchError and leaves it untouched on failure."""
+    if not isinstance(operations, list):
+        raise PatchError("A JSON Patch is a list of operations.")
+    document = copy.deepcopy(document)
+    for number, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise PatchError(f"Operation {number}: op must be one of {', '.join(OPERATIONS)}.")
+        op, path = operation["op"], operation.get("path")
+        if op in ("add", "replace", "test") and "value" not in operation:
+            raise PatchError(f"Operation {number}: {op} needs a value.")
+        if op in ("move", "copy") and "from" not in operation:
+            raise PatchError(f"Operation {number}: {op} needs a from path.")
+        try:
+            parse_pointer(path)
+            if op in ("move", "copy"):
+                parse_pointer(operation["from"])
+            if op == "add":
+                _add(document, path, copy.deepcopy(operation["value"]))
+            elif op == "remove":
+                _remove(document, path)
+            elif op == "replace":
+                _remove(document, path)
+                _add(document, path, copy.deepcopy(operation["value"]))
+            elif op == "move":
+                if path != operation["from"] and path.startswith(operation["from"] + "/"):
+                    raise PatchError(f"Can't move {operation['from']!r} into itself.")
+                _add(document, path, _remove(document, operation["from"]))
+            elif op == "copy":
+                _add(document, path, copy.deepcopy(_get(document, operation["from"])))
+            elif _get(document, path) != operation["value"]:
+                raise PatchError(f"Test failed at {path!r}.")
+        except PatchError as e:
+            raise PatchError(f"Operation {number}: {e}") from None
+    return document
+
+
+def patched_paths(operations):
+    """Top-level keys a patch writes to (test operations write nothing); call after apply_patch() accepted it."""
+    paths = set()
+    for operation in operations:
+        if operation.get("op") != "test":
+            tokens = parse_pointer(operation.get("path"))
+            if tokens:
+                paths.add(tokens[0])
+    return paths
@@ -0,0 +1,125 @@
+#kinematics.py
+#
+# Streaming per-rep kinematics for one supervision socket.
+#
+# Each tracker also reports a kinematic angle per frame (the "kinematics"
+# entry of its spec, e.g. the elbow for curls). RepKinematics keeps the
+# last CAPACITY (timestamp, angle) samples in a ring buffer, so memory per
+# socket is fixed however long a set runs. When the tracker counts a rep it
+# summarises the samples since the previous rep:
+#
+#     duration_ms     eccentric_ms + concentric_ms (pauses at either end
+#                     of the movement are left out)
+#     eccentric_ms    from leaving the concentric end position to reaching
+#                     the other end
+#     concentric_ms   from last leaving that end until the rep was counted
+#     min_angle, max_angle, rom, peak_angle (the angle at the concentric
+#                     end: smallest for curls, largest for presses)
+#
+# "Reaching" an end means coming within END_TOLERANCE of the rep's range
+# of motion, which keeps landmark jitter from splitting a pause in two.
+# Trackers that count a rep part-way through the concentric phase (squat
+# counts as the hip rises past the knee) report the concentric time up to
+# that point. A rep longer than the buffer is summarised from the samples
+# still in it.
+
+from collections import deque
+
+import numpy as np
+
+CAPACITY = 512  # about 17 s at 30 fps
+END_TOLERANCE = 0.1
+HISTORY = 50
+
+# Compact per-rep rows stored in the day's log, in this column order.
+STORED_FIELDS = ("duration_ms", "eccentric_ms", "concentric_ms", "min_angle", "max_angle")
+
+
+class RepKinematics:
+    def __init__(self, concentric="closing", capacity=CAPACITY):
+        if concentric not in ("closing", "opening"):
+            raise ValueError(f"concentric must be 'closing' or 'opening', not {concentric!r}")
+        # Work on a signed angle that always rises in the eccentric phase.
+        self.sign = 1.0 if concentric == "closing" else -1.0
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.angles = np.zeros(capacity, dtype=np.float32)
+        self.samples = 0  # total ever written; the ring holds the last `capacity`
+        self.last_rep_end = None  # absolute sample index of the last counted rep
+        self.reps = 0
+        self.history = deque(maxlen=HISTORY)
+
+    def extend(self, timestamps_ms, angles, rep_frames=()):
+        """
+        Adds a batch of samples and returns a summary for every rep the
+        tracker counted in it (`rep_frames` are indices into the batch).
+        """
+        angles = np.asarray(angles, dtype=np.float32)
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.float64)
+        base = self.samples
+        summaries = []
+        written = 0
+        for frame in rep_frames:
+            # Write up to and including the rep frame, summarise, continue.
+            self._write(timestamps_ms[written:frame + 1], angles[written:frame + 1])
+            written = frame + 1
+            summaries.append(self._summarise(base + frame))
+        self._write(timestamps_ms[written:], angles[written:])
+        return summaries
+
+    def _write(self, times, angles):
+        count = len(angles)
+        if count > self.capacity:
+            times, angles = times[-self.capacity:], angles[-self.capacity:]
+            self.samples += count - self.capacity
+            count = self.capacity
+        positions = (self.samples + np.arange(count)) % self.capacity
+        self.times[positions] = times
+        self.angles[positions] = angles
+        self.samples += count
+
+    def _summarise(self, end):
+        oldest = max(self.samples - self.capacity, 0)
+        start = oldest if self.last_rep_end is None else max(self.last_rep_end, oldest)
+        self.last_rep_end = end
+        self.reps += 1
+        positions = np.arange(start, end + 1) % self.capacity
+        times = self.times[positions]
+        angles = self.angles[positions]
+        signed = angles * self.sign
+
+        low, high = float(signed.min()), float(signed.max())
+        tolerance = END_TOLERANCE * (high - low)
+        at_high = np.flatnonzero(signed >= high - tolerance)
+        at_low = np.flatnonzero(signed <= low + tolerance)
+        turn = int(at_high[-1])  # concentric phase starts here
+        before_turn = at_low[at_low < turn]
+        eccentric_start = int(before_turn[-1]) if len(before_turn) else 0
+        bottom = int(at_high[at_high >= eccentric_start][0])
+
+        eccentric_ms = times[bottom] - times[eccentric_start]
+        concentric_ms = times[-1] - times[turn]
+        summary = {
+            "rep": self.reps,
+            "duration_ms": round(float(eccentric_ms + concentric_ms)),
+            "eccentric_ms": round(float(eccentric_ms)),
+            "concentric_ms": round(float(concentric_ms)),
+            "min_angle": round(float(angles.min()), 1),
+            "max_angle": round(float(angles.max()), 1),
+            "rom": round(float(angles.max() - angles.min()), 1),
+            "peak_angle": round(float(low * self.sign), 1),
+        }
+        self.history.append(summary)
+        return summary
+
+    def averages(self):
+        """Mean of each statistic over the last HISTORY reps."""
+        if not self.history:
+            return {}
+        keys = ("duration_ms", "eccentric_ms", "concentric_ms", "rom")
+        return {key: round(sum(rep[key] for rep in self.history) / len(self.history), 1) for key in keys}
+
+
+def stored_row(summary):
+    """The compact row persisted per rep: integers in STORED_FIELDS order."""
+    return [int(round(summary[field])) for field in STORED_FIELDS]
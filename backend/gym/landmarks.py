@@ -0,0 +1,28 @@
+#landmarks.py
+#
+# MediaPipe Pose landmark indices as a plain table. The pose model is the
+# frontend's job; the server only needs to know which of the 33 rows in a
+# frame is which joint, and importing mediapipe for that costs more than
+# everything else a worker loads at startup. The order matches
+# mediapipe.solutions.pose.PoseLandmark and must not change.
+
+POSE_LANDMARK_NAMES = (
+    "NOSE",
+    "LEFT_EYE_INNER", "LEFT_EYE", "LEFT_EYE_OUTER",
+    "RIGHT_EYE_INNER", "RIGHT_EYE", "RIGHT_EYE_OUTER",
+    "LEFT_EAR", "RIGHT_EAR",
+    "MOUTH_LEFT", "MOUTH_RIGHT",
+    "LEFT_SHOULDER", "RIGHT_SHOULDER",
+    "LEFT_ELBOW", "RIGHT_ELBOW",
+    "LEFT_WRIST", "RIGHT_WRIST",
+    "LEFT_PINKY", "RIGHT_PINKY",
+    "LEFT_INDEX", "RIGHT_INDEX",
+    "LEFT_THUMB", "RIGHT_THUMB",
+    "LEFT_HIP", "RIGHT_HIP",
+    "LEFT_KNEE", "RIGHT_KNEE",
+    "LEFT_ANKLE", "RIGHT_ANKLE",
+    "LEFT_HEEL", "RIGHT_HEEL",
+    "LEFT_FOOT_INDEX", "RIGHT_FOOT_INDEX",
+)
+
+POSE_LANDMARKS = {name: index for index, name in enumerate(POSE_LANDMARK_NAMES)}
@@ -0,0 +1,459 @@
+#layers.py
+#
+# LocalChannelLayer: a channel layer for several daphne workers on one host
+# with no broker to run.
+#
+# One process hosts a ChannelHub on a Unix socket and every layer instance
+# (one connection per event loop) talks to it in msgpack. The hub owns group
+# membership and routes each message to the connection whose "specific."
+# prefix the channel carries, so a consumer in any worker can be reached via
+# group_send from any other. Plain (non-"!") channels are queued at the hub
+# and handed to whichever connection asks to receive first.
+#
+# Nobody has to start the hub: the first layer that finds no one listening
+# takes a file lock, binds the socket and serves it from a daemon thread.
+# If that worker exits, the others reconnect, one of them takes over, and
+# each re-registers its prefix and group memberships; messages in flight
+# during the handover are lost, as they are when a Redis layer restarts.
+# `manage.py run_channel_hub` runs the hub as its own process instead.
+#
+# Sends are batched: everything a connection sends during one event-loop
+# tick goes out as one write, and group_sends issued together travel as one
+# frame. The hub in turn writes each connection at most once per read. Like
+# the other layers, a full channel drops group messages rather than waiting.
+#
+# Unix sockets and fcntl locks make this POSIX-only; on Windows the module
+# still imports, but LOCAL_LAYER_SUPPORTED is False and the layer refuses to
+# start (settings.py keeps the in-memory layer there).
+
+import asyncio
+import os
+import random
+import socket
+import string
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCAL_LAYER_SUPPORTED = fcntl is not None and hasattr(socket, "AF_UNIX")
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "grindsens-channels.sock")
+
+# A hub stops writing to a connection whose unsent output passes this many
+# bytes (a worker that stopped reading) and drops its messages instead.
+MAX_CONNECTION_BUFFER = 16 * 1024 * 1024
+
+RECONNECT_DELAY_S = 0.1
+
+
+def _pack(*op):
+    return msgpack.packb(op, use_bin_type=True)
+
+
+def _specific_prefix(channel):
+    return channel[:channel.index("!") + 1] if "!" in channel else None
+
+
+class _HubConnection:
+    __slots__ = ("writer", "prefixes", "outgoing")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.prefixes = set()
+        self.outgoing = []
+
+
+class ChannelHub:
+    """Routes messages between LocalChannelLayer connections."""
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, expiry=60, group_expiry=86400, capacity=100):
+        self.path = str(path)
+        self.expiry = expiry
+        self.group_expiry = group_expiry
+        self.capacity = capacity
+        self.owners = {}  # "specific.xxx!" -> _HubConnection
+        self.groups = defaultdict(dict)  # group -> {channel: joined_at}
+        self.queues = defaultdict(deque)  # plain channel -> deque of (expires_at, message)
+        self.waiting = defaultdict(deque)  # plain channel -> connections blocked in receive()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+    async def _serve(self, reader, writer):
+        connection = _HubConnection(writer)
+        unpacker = msgpack.Unpacker(raw=False)
+        try:
+            while data := await reader.read(65536):
+                unpacker.feed(data)
+                touched = set()
+                for op in unpacker:
+                    self._handle(connection, op, touched)
+                for target in touched:
+                    self._write(target)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._drop(connection)
+            writer.close()
+
+    def _handle(self, connection, op, touched):
+        kind = op[0]
+        if kind == "send":
+            for channel, message in op[1]:
+                self._route(channel, message, touched)
+        elif kind == "group_send":
+            now = time.time()
+            for group, message in op[1]:
+                members = self.groups.get(group)
+                if not members:
+                    continue
+                for channel, joined_at in list(members.items()):
+                    if joined_at < now - self.group_expiry:
+                        del members[channel]
+                    else:
+                        self._route(channel, message, touched)
+        elif kind == "group_add":
+            self.groups[op[1]][op[2]] = time.time()
+        elif kind == "group_discard":
+            members = self.groups.get(op[1])
+            if members is not None:
+                members.pop(op[2], None)
+                if not members:
+                    del self.groups[op[1]]
+        elif kind == "receive":
+            self._pull(op[1], connection, touched)
+        elif kind == "hello":
+            self.owners[op[1]] = connection
+            connection.prefixes.add(op[1])
+        elif kind == "flush":
+            self.groups.clear()
+            self.queues.clear()
+
+    def _route(self, channel, message, touched):
+        prefix = _specific_prefix(channel)
+        if prefix is not None:
+            owner = self.owners.get(prefix)
+            if owner is not None:
+                owner.outgoing.append((channel, message))
+                touched.add(owner)
+            return
+        waiting = self.waiting.get(channel)
+        while waiting:
+            receiver = waiting.popleft()
+            if not receiver.writer.is_closing():
+                receiver.outgoing.append((channel, message))
+                touched.add(receiver)
+                return
+        queue = self.queues[channel]
+        self._expire(queue)
+        if len(queue) < self.capacity:
+            queue.append((time.time() + self.expiry, message))
+
+    def _pull(self, channel, connection, touched):
+        queue = self.queues.get(channel)
+        if queue:
+            self._expire(queue)
+        if queue:
+            connection.outgoing.append((channel, queue.popleft()[1]))
+            touched.add(connection)
+        else:
+            self.waiting[channel].append(connection)
+
+    @staticmethod
+    def _expire(queue):
+        now = time.time()
+        while queue and queue[0][0] < now:
+            queue.popleft()
+
+    def _write(self, connection):
+        messages, connection.outgoing = connection.outgoing, []
+        writer = connection.writer
+        if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_CONNECTION_BUFFER:
+            return
+        writer.write(_pack("deliver", messages))
+
+    def _drop(self, connection):
+        for prefix in connection.prefixes:
+            if self.owners.get(prefix) is connection:
+                del self.owners[prefix]
+        if connection.prefixes:
+            for group, members in list(self.groups.items()):
+                for channel in [c for c in members if _specific_prefix(c) in connection.prefixes]:
+                    del members[channel]
+                if not members:
+                    del self.groups[group]
+        for waiting in self.waiting.values():
+            while connection in waiting:
+                waiting.remove(connection)
+
+
+_hub_lock = threading.Lock()
+_hub_threads = {}
+
+
+def _hub_listening(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def ensure_hub(path, **hub_kwargs):
+    """
+    Makes sure some process serves a hub on `path`, starting one on a daemon
+    thread in this process if nobody does. A file lock next to the socket
+    keeps two workers from electing themselves at once.
+    """
+    if not LOCAL_LAYER_SUPPORTED:
+        raise ImproperlyConfigured("The local channel hub needs Unix sockets and fcntl; use another channel layer here.")
+    path = str(path)
+    with _hub_lock, open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if _hub_listening(path):
+            return False
+        if os.path.exists(path):
+            os.unlink(path)  # left behind by a hub that died
+        ready = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            hub = ChannelHub(path, **hub_kwargs)
+            try:
+                loop.run_until_complete(hub.start())
+            except OSError as e:
+                failure.append(e)
+                ready.set()
+                return
+            ready.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name=f"channel-hub:{path}", daemon=True)
+        thread.start()
+        ready.wait()
+        if failure:
+            raise failure[0]
+        _hub_threads[path] = thread
+        print(f"Channel hub listening on {path} (pid {os.getpid()})")
+        return True
+
+
+class _LoopConnection:
+    """A layer's link to the hub from one event loop, with its local channel queues."""
+
+    def __init__(self, layer, loop):
+        self.layer = layer
+        self.loop = loop
+        self.prefix = "specific.%s!" % "".join(random.choice(string.ascii_letters) for _ in range(12))
+        self.queues = {}  # channel -> asyncio.Queue of (expires_at, message)
+        self.memberships = set()  # (group, channel) added through this connection
+        self.outbox = []
+        self.writer = None
+        self.connected = asyncio.Event()
+        self.reader_task = None
+        self._flush_scheduled = False
+
+    async def connect(self):
+        reader, writer = await self.layer._open_hub()
+        self.writer = writer
+        writer.write(_pack("hello", self.prefix))
+        for group, channel in self.memberships:
+            writer.write(_pack("group_add", group, channel))
+        self.connected.set()
+        self.reader_task = self.loop.create_task(self._read(reader))
+        self._schedule_flush()
+
+    async def _read(self, reader):
+        unpacker = msgpack.Unpacker(raw=False)
+        try:
+            while data := await reader.read(65536):
+                unpacker.feed(data)
+                for op in unpacker:
+                    if op[0] == "deliver":
+                        for channel, message in op[1]:
+                            self.deliver(channel, message)
+        except ConnectionError:
+            pass
+        self.connected.clear()
+        self.writer = None
+        # Keep the prefix and re-register group memberships with whichever hub comes up next.
+        while not self.loop.is_closed():
+            await asyncio.sleep(RECONNECT_DELAY_S)
+            try:
+                await self.connect()
+                return
+            except OSError:
+                continue
+
+    def queue(self, channel):
+        queue = self.queues.get(channel)
+        if queue is None:
+            queue = self.queues[channel] = asyncio.Queue(maxsize=self.layer.get_capacity(channel))
+        return queue
+
+    def deliver(self, channel, message):
+        try:
+            self.queue(channel).put_nowait((time.time() + self.layer.expiry, message))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def enqueue(self, kind, item):
+        """Adds to the last batch of the same kind, so one tick's sends share a frame."""
+        if self.outbox and self.outbox[-1][0] == kind:
+            self.outbox[-1][1].append(item)
+        else:
+            self.outbox.append((kind, [item]))
+        self._schedule_flush()
+
+    def command(self, *op):
+        self.outbox.append(op)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self.writer is None or not self.outbox:
+            return
+        ops, self.outbox = self.outbox, []
+        self.writer.write(b"".join(_pack(*op) for op in ops))
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            self._flush()
+            self.writer.close()
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """
+    Channel layer shared by every worker process on one host through a
+    ChannelHub on a Unix socket. CONFIG keys: path (socket file), expiry,
+    group_expiry, capacity, channel_capacity, start_hub (False to require
+    an externally run hub).
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, start_hub=True):
+        if not LOCAL_LAYER_SUPPORTED:
+            raise ImproperlyConfigured("LocalChannelLayer needs Unix sockets and fcntl; use InMemoryChannelLayer or Redis here.")
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.start_hub = start_hub
+        self._connections = {}
+
+    async def _open_hub(self):
+        try:
+            return await asyncio.open_unix_connection(self.path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not self.start_hub:
+                raise
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: ensure_hub(self.path, expiry=self.expiry, group_expiry=self.group_expiry, capacity=self.capacity)
+        )
+        return await asyncio.open_unix_connection(self.path)
+
+    async def _connection(self):
+        loop = asyncio.get_running_loop()
+        connection = self._connections.get(loop)
+        if connection is None:
+            for closed in [l for l in self._connections if l.is_closed()]:
+                del self._connections[closed]
+            connection = self._connections[loop] = _LoopConnection(self, loop)
+            try:
+                await connection.connect()
+            except BaseException:
+                del self._connections[loop]
+                raise
+        return connection
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        connection = await self._connection()
+        if _specific_prefix(channel) == connection.prefix:
+            if not connection.deliver(channel, message):
+                raise ChannelFull(channel)
+            return
+        connection.enqueue("send", (channel, message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        connection = await self._connection()
+        queue = connection.queue(channel)
+        if queue.empty() and _specific_prefix(channel) is None:
+            connection.command("receive", channel)
+        try:
+            while True:
+                expires_at, message = await queue.get()
+                if expires_at >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                connection.queues.pop(channel, None)
+
+    async def new_channel(self):
+        connection = await self._connection()
+        return connection.prefix + "".join(random.choice(string.ascii_letters) for _ in range(12))
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        connection = await self._connection()
+        connection.memberships.add((group, channel))
+        connection.command("group_add", group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        connection = await self._connection()
+        connection.memberships.discard((group, channel))
+        connection.command("group_discard", group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        connection = await self._connection()
+        connection.enqueue("group_send", (group, message))
+
+    async def flush(self):
+        connection = await self._connection()
+        connection.queues.clear()
+        connection.memberships.clear()
+        connection.command("flush")
+
+    async def close(self):
+        connection = self._connections.pop(asyncio.get_running_loop(), None)
+        if connection is not None:
+            await connection.close()
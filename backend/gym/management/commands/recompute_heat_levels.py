@@ -0,0 +1,28 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gym.models import WorkoutPlan
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every workout plan's stored heat level over the last seven days with one aggregate query. "
+        "Run it shortly after midnight so the window rolls forward for users who don't open the app that day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Last day of the window, YYYY-MM-DD (default: today).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Plans per UPDATE.")
+
+    def handle(self, *args, **options):
+        today = None
+        if options["date"]:
+            try:
+                today = datetime.strptime(options["date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("Invalid --date. Use YYYY-MM-DD.")
+        started = time.perf_counter()
+        plans, changed = WorkoutPlan.recompute_heat_levels(today, batch_size=options["batch_size"])
+        self.stdout.write(f"Recomputed heat for {plans} plans ({changed} changed) in {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,98 @@
+import asyncio
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from gym.archive import ARCHIVE_SUFFIX, PoseArchive
+from gym.exes import TRACKERS
+from gym.replay import (
+    AuthenticatedApplication,
+    PoseRecording,
+    recording_from_messages,
+    replay_consumer,
+    replay_tracker,
+    seed_supervision_session,
+    synthetic_curl,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays recorded pose streams through the trackers and/or SupervisionConsumer and reports "
+        "rep counts, frames/sec and p50/p99 latency. Takes .npz recordings, .gspose archives or JSON-lines message logs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("recordings", nargs="*", help="Recording files (.npz), session archives (.gspose) or logged socket messages (.jsonl).")
+        parser.add_argument("--synthetic", type=int, metavar="REPS", help="Also replay a synthetic curl_l stream with this many reps.")
+        parser.add_argument("--tracker", help="Tracker to use instead of the one named in the recording.")
+        parser.add_argument("--batch-size", type=int, action="append", dest="batch_sizes",
+                            help="Frames per call/message. Repeat to compare sizes (default 1).")
+        parser.add_argument("--via", choices=["tracker", "consumer", "both"], default="tracker")
+        parser.add_argument("--json", action="store_true", help="Send JSON messages instead of binary frames in consumer mode.")
+        parser.add_argument("--export-npz", metavar="DIR", help="Also save every loaded recording as an .npz file in DIR.")
+
+    def handle(self, *args, **options):
+        recordings = [self.load(Path(path)) for path in options["recordings"]]
+        if options["synthetic"]:
+            recordings.append(synthetic_curl(reps=options["synthetic"]))
+        if not recordings:
+            raise CommandError("Nothing to replay: pass recording files or --synthetic REPS.")
+        if options["export_npz"]:
+            for recording in recordings:
+                name = Path(recording.meta.get("source", recording.exercise_name)).stem
+                path = recording.save(Path(options["export_npz"]) / f"{name}.npz")
+                self.stdout.write(f"Saved {len(recording)} frames to {path}")
+        batch_sizes = options["batch_sizes"] or [1]
+
+        reports = []
+        for recording in recordings:
+            tracker_name = options["tracker"] or recording.exercise_name
+            if tracker_name not in TRACKERS:
+                raise CommandError(f"No tracker named '{tracker_name}'. Known: {', '.join(sorted(TRACKERS))}.")
+            if options["via"] in ("tracker", "both"):
+                for batch_size in batch_sizes:
+                    reports.append((recording, batch_size, replay_tracker(recording, TRACKERS[tracker_name], batch_size)))
+        if options["via"] in ("consumer", "both"):
+            reports.extend(self.replay_through_consumer(recordings, batch_sizes, options))
+
+        self.stdout.write(f"{'recording':<40} {'mode':<24} {'batch':>5} {'frames':>7} {'reps':>5} {'sets':>5} {'frames/s':>11} {'p50 us':>9} {'p99 us':>9}")
+        for recording, batch_size, report in reports:
+            self.stdout.write(
+                f"{recording.meta.get('source', recording.exercise_name)[:40]:<40} {report['mode']:<24} {batch_size:>5} "
+                f"{report['frames']:>7} {report['reps']:>5} {report['sets']:>5} {report['frames_per_s']:>11,.0f} "
+                f"{report['p50_us']:>9.1f} {report['p99_us']:>9.1f}"
+            )
+
+    def load(self, path):
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+        if path.suffix == ".npz":
+            recording = PoseRecording.load(path)
+        elif path.suffix == ARCHIVE_SUFFIX:
+            recording = PoseArchive(path).to_recording()
+        else:
+            with open(path) as f:
+                recording = recording_from_messages(f)
+        recording.meta["source"] = path.name
+        return recording
+
+    def replay_through_consumer(self, recordings, batch_sizes, options):
+        """Runs against a throwaway test database so no real user or log is touched."""
+        from gym.routing import websocket_urlpatterns
+        from channels.routing import URLRouter
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            reports = []
+            for i, recording in enumerate(recordings):
+                tracker_name = options["tracker"] or recording.exercise_name
+                for batch_size in batch_sizes:
+                    user, exercise_id = seed_supervision_session(tracker_name, username=f"replay_{i}_{batch_size}")
+                    application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+                    report = asyncio.run(replay_consumer(recording, application, exercise_id, batch_size, binary=not options["json"]))
+                    reports.append((recording, batch_size, report))
+            return reports
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,30 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gym.layers import DEFAULT_SOCKET_PATH, ensure_hub
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the ChannelHub for gym.layers.LocalChannelLayer in the foreground, so worker restarts "
+        "don't take group membership with them. Without it the first worker to connect hosts the hub."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Socket path (default: the default layer's CONFIG path).")
+
+    def handle(self, *args, **options):
+        config = settings.CHANNEL_LAYERS.get("default", {}).get("CONFIG", {})
+        path = str(options["path"] or config.get("path", DEFAULT_SOCKET_PATH))
+        hub_options = {key: config[key] for key in ("expiry", "group_expiry", "capacity") if key in config}
+        # Reuses the election lock so a stale socket is cleared and a live hub is left alone.
+        if not ensure_hub(path, **hub_options):
+            self.stderr.write(f"A hub is already listening on {path}.")
+            return
+        self.stdout.write(f"Serving channel hub on {path}. Ctrl-C to stop.")
+        try:
+            asyncio.run(asyncio.Event().wait())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,221 @@
+#metrics.py
+#
+# In-process metrics for the supervision pipeline, rendered in the
+# Prometheus text format by MetricsView (/api/metrics/, admin only).
+#
+# Histograms have fixed buckets: observing a value is a bisect and two
+# increments under a lock, cheap enough to run several times per frame.
+# Labels are per exercise, never per connection, so the series count stays
+# bounded; per-connection numbers go to ConnectionTimings, which a socket
+# reports in its `stats` reply and logs on disconnect. Each worker process
+# keeps its own registry, so scrape every worker (or sum across them).
+
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds, 10 us .. 1 s: tracker runs sit at the bottom, DB calls at the top.
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+FPS_BUCKETS = (1, 5, 10, 15, 20, 25, 30, 45, 60)
+
+STAGES = ("decode", "tracker", "send", "db")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [*zip(labelnames, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _name, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _value), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, *labels):
+        self.inc(-amount, *labels)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackGauge(_Metric):
+    """A gauge read from `callback()` at scrape time, for state other modules already keep."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def render(self):
+        return self.header() + [f"{self.name} {_format_value(self.callback())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (not cumulative) counts plus an overflow slot, then sum.
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            snapshot = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = (("le", _format_value(bound) if bound == float("inf") else repr(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback_gauge(self, name, documentation, callback):
+        return self.register(CallbackGauge(name, documentation, callback))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "supervision_stage_seconds", "Time spent per supervision pipeline stage (decode, tracker, send, db).",
+    ("stage", "exercise"),
+)
+frames_processed = registry.counter(
+    "supervision_frames_processed_total", "Pose frames run through a tracker.", ("exercise",),
+)
+frames_dropped = registry.counter(
+    "supervision_frames_dropped_total", "Pose frames dropped as stale before reaching a tracker.", ("exercise",),
+)
+connection_fps = registry.histogram(
+    "supervision_connection_fps", "Frames per second processed on one socket, sampled about once a second.",
+    ("exercise",), buckets=FPS_BUCKETS,
+)
+active_connections = registry.gauge(
+    "supervision_active_connections", "Authenticated supervision sockets currently open in this process.",
+)
+set_progress_flush_seconds = registry.histogram(
+    "supervision_set_progress_flush_seconds", "Duration of one write-behind flush of set progress.",
+)
+
+
+class ConnectionTimings:
+    """
+    One socket's share of the stage histograms: feeds the process-wide
+    metrics under the socket's exercise label and keeps its own count,
+    total and worst case per stage for the `stats` reply.
+    """
+
+    FPS_SAMPLE_S = 1.0
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.exercise = "unbound"
+        self._stages = {stage: [0, 0.0, 0.0] for stage in STAGES}  # count, total_s, max_s
+        self._window_started = clock()
+        self._window_frames = 0
+
+    def observe(self, stage, seconds):
+        stage_seconds.observe(seconds, stage, self.exercise)
+        entry = self._stages[stage]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+    def dropped(self, count):
+        frames_dropped.inc(count, self.exercise)
+
+    def processed(self, count):
+        frames_processed.inc(count, self.exercise)
+        self._window_frames += count
+        now = self.clock()
+        elapsed = now - self._window_started
+        if elapsed >= self.FPS_SAMPLE_S:
+            connection_fps.observe(self._window_frames / elapsed, self.exercise)
+            self._window_started, self._window_frames = now, 0
+
+    def summary(self):
+        return {
+            stage: {"count": count, "mean_us": round(total / count * 1e6, 1) if count else 0.0, "max_us": round(worst * 1e6, 1)}
+            for stage, (count, total, worst) in self._stages.items()
+        }
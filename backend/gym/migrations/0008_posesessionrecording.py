@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0007_alter_dailyworkoutlog_logged_exercises'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PoseSessionRecording',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_exercise_id', models.PositiveIntegerField(help_text='original_exercise_id of the logged exercise entry.')),
+                ('exercise_name', models.CharField(blank=True, max_length=255)),
+                ('file_path', models.CharField(help_text='Path of the .gspose archive (see gym/archive.py).', max_length=500)),
+                ('frame_count', models.PositiveIntegerField(default=0)),
+                ('size_bytes', models.PositiveBigIntegerField(default=0)),
+                ('first_frame_ms', models.FloatField(blank=True, help_text='Client timestamp of the first frame.', null=True)),
+                ('last_frame_ms', models.FloatField(blank=True, help_text='Client timestamp of the last frame.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('daily_log', models.ForeignKey(help_text="The day's log this session was recorded against.", on_delete=django.db.models.deletion.CASCADE, related_name='pose_recordings', to='gym.dailyworkoutlog')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['daily_log', 'original_exercise_id'], name='gym_poseses_daily_l_4473c4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0008_posesessionrecording'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutplan',
+            name='heat_level',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='workoutplan',
+            name='heat_window_end',
+            field=models.DateField(blank=True, help_text='Last day of the window heat_level was computed for.', null=True),
+        ),
+        migrations.AddField(
+            model_name='workoutplan',
+            name='heat_window_total',
+            field=models.PositiveIntegerField(default=0, help_text='Sum of completion_percentage over the heat window.'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0009_workoutplan_stored_heat_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingroutine',
+            name='base_routine',
+            field=models.ForeignKey(blank=True, help_text='Preset whose schedule this routine shares until it edits its own.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='adoptions', to='gym.trainingroutine'),
+        ),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TEXT_COLUMNS = {
+    'exercise_name': '', 'target_sets': '1', 'target_reps_or_duration': '', 'completed_status': 'pending',
+    'user_notes_for_exercise': '',
+}
+LIST_COLUMNS = ('target_muscles', 'actual_reps_per_set', 'weight_used_per_set')
+COLUMNS = ('original_exercise_id', 'notes_from_routine', 'actual_sets_completed', 'actual_duration_seconds',
+           'rep_kinematics', *TEXT_COLUMNS, *LIST_COLUMNS)
+# Items without a usable, unique original_exercise_id get one from this range, far above
+# any real Exercise id; the value they had is kept in extra and restored on reverse.
+SYNTHETIC_ID_BASE = 2_000_000_000
+LEGACY_ID_KEY = 'legacy_original_exercise_id'
+
+
+def _number(value, kind, default):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _entry_fields(item):
+    fields = {name: str(item[name]) if item.get(name) is not None else default for name, default in TEXT_COLUMNS.items()}
+    fields.update({name: item[name] if isinstance(item.get(name), list) else [] for name in LIST_COLUMNS})
+    notes = item.get('notes_from_routine')
+    fields['notes_from_routine'] = None if notes is None else str(notes)
+    fields['actual_sets_completed'] = max(0, _number(item.get('actual_sets_completed'), int, 0))
+    fields['actual_duration_seconds'] = _number(item.get('actual_duration_seconds'), float, None)
+    fields['rep_kinematics'] = item.get('rep_kinematics')
+    fields['extra'] = {key: value for key, value in item.items() if key not in COLUMNS}
+    return fields
+
+
+def entries_from_json(apps, schema_editor):
+    DailyWorkoutLog = apps.get_model('gym', 'DailyWorkoutLog')
+    ExerciseLogEntry = apps.get_model('gym', 'ExerciseLogEntry')
+    entries, renumbered = [], 0
+    for log_id, logged_exercises in DailyWorkoutLog.objects.values_list('id', 'logged_exercises').iterator():
+        if logged_exercises is None:
+            continue
+        if not isinstance(logged_exercises, list) or not all(isinstance(item, dict) for item in logged_exercises):
+            raise ValueError(
+                f"DailyWorkoutLog {log_id}: logged_exercises must be a list of objects to be migrated to "
+                f"ExerciseLogEntry rows; fix or clear it and run the migration again."
+            )
+        seen = set()
+        for position, item in enumerate(logged_exercises):
+            fields = _entry_fields(item)
+            exercise_id = _number(item.get('original_exercise_id'), int, None)
+            if exercise_id is None or not 0 <= exercise_id < SYNTHETIC_ID_BASE or exercise_id in seen:
+                # Sockets and the API address entries by this id, so give it one nothing else uses.
+                fields['extra'][LEGACY_ID_KEY] = item.get('original_exercise_id')
+                exercise_id = SYNTHETIC_ID_BASE + position
+                renumbered += 1
+            seen.add(exercise_id)
+            entries.append(ExerciseLogEntry(daily_log_id=log_id, position=position, original_exercise_id=exercise_id,
+                                            **fields))
+        if len(entries) >= 1000:
+            ExerciseLogEntry.objects.bulk_create(entries)
+            entries = []
+    ExerciseLogEntry.objects.bulk_create(entries)
+    if renumbered:
+        print(f"Gave {renumbered} logged exercise(s) without a usable original_exercise_id an id from {SYNTHETIC_ID_BASE}; "
+              f"the old value is kept under extra['{LEGACY_ID_KEY}'].")
+
+
+def json_from_entries(apps, schema_editor):
+    DailyWorkoutLog = apps.get_model('gym', 'DailyWorkoutLog')
+    ExerciseLogEntry = apps.get_model('gym', 'ExerciseLogEntry')
+    logged = {}
+    for entry in ExerciseLogEntry.objects.order_by('daily_log_id', 'position', 'id').iterator():
+        item = {**entry.extra, **{name: getattr(entry, name) for name in COLUMNS}}
+        if LEGACY_ID_KEY in item:
+            item['original_exercise_id'] = item.pop(LEGACY_ID_KEY)
+        if item['rep_kinematics'] is None:
+            del item['rep_kinematics']
+        logged.setdefault(entry.daily_log_id, []).append(item)
+    logs = list(DailyWorkoutLog.objects.filter(id__in=list(logged)).only('id'))
+    for daily_log in logs:
+        daily_log.logged_exercises = logged[daily_log.id]
+    DailyWorkoutLog.objects.bulk_update(logs, ['logged_exercises'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym', '0010_trainingroutine_base_routine'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0, help_text="Index in the day's logged_exercises list.")),
+                ('original_exercise_id', models.PositiveIntegerField(help_text='Id of the routine Exercise this entry was logged from.')),
+                ('exercise_name', models.CharField(max_length=255)),
+                ('target_muscles', models.JSONField(blank=True, default=list)),
+                ('target_sets', models.CharField(max_length=50)),
+                ('target_reps_or_duration', models.CharField(blank=True, default='', max_length=100)),
+                ('notes_from_routine', models.TextField(blank=True, null=True)),
+                ('completed_status', models.CharField(default='pending', help_text='pending, partial, full or skipped.', max_length=20)),
+                ('actual_sets_completed', models.PositiveIntegerField(default=0)),
+                ('actual_reps_per_set', models.JSONField(blank=True, default=list)),
+                ('actual_duration_seconds', models.FloatField(blank=True, null=True)),
+                ('weight_used_per_set', models.JSONField(blank=True, default=list)),
+                ('user_notes_for_exercise', models.TextField(blank=True, default='')),
+                ('rep_kinematics', models.JSONField(blank=True, help_text='Per-rep rows written by supervision sockets (gym/persistence.py).', null=True)),
+                ('extra', models.JSONField(blank=True, default=dict, help_text='Client keys that have no column.')),
+                ('daily_log', models.ForeignKey(help_text="The day's log this exercise belongs to.", on_delete=django.db.models.deletion.CASCADE, related_name='exercise_entries', to='gym.dailyworkoutlog')),
+            ],
+            options={
+                'ordering': ['position', 'id'],
+                'indexes': [models.Index(fields=['exercise_name', 'daily_log'], name='gym_exercis_exercis_4ef076_idx')],
+                'constraints': [models.UniqueConstraint(fields=('daily_log', 'original_exercise_id'), name='unique_exercise_per_daily_log')],
+            },
+        ),
+        migrations.RunPython(entries_from_json, json_from_entries),
+        migrations.RemoveField(
+            model_name='dailyworkoutlog',
+            name='logged_exercises',
+        ),
+    ]
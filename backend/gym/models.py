@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
-from datetime import timedelta, date as DateObject
+from datetime import datetime, timedelta, date as DateObject
 
 
 # Create your models here.
@@ -31,6 +33,20 @@ class TrainingRoutine(models.Model):
     flexibility_guidelines = models.TextField(null=True, blank=True)
     precautions = models.TextField(null=True, blank=True)
     coach_response = models.TextField(default="No coach feedback.") 
+    # Adopting a preset (POST /routines/<pk>/copy/) inserts only this row:
+    # the adopted routine reads the preset's days and exercises through
+    # base_routine until its schedule is first edited, and then gets a copy
+    # of its own (copy-on-write). Its top-level fields are its own from the
+    # start. A preset's schedule is handed to its adopters before the preset
+    # is edited or deleted, so what they adopted never changes under them.
+    base_routine = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='adoptions',
+        help_text="Preset whose schedule this routine shares until it edits its own."
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -38,6 +54,15 @@ class TrainingRoutine(models.Model):
         prefix = "[PRESET] " if self.is_preset else f"[{self.user.username if self.user else 'NO_USER'}] "
         return f"{prefix}{self.routine_name}"
 
+    @property
+    def schedule_owner(self):
+        """The routine whose WeeklyScheduleItem rows this routine trains by."""
+        return self.base_routine if self.base_routine_id else self
+
+    @property
+    def schedule(self):
+        return self.schedule_owner.weekly_schedule.all()
+
 class WeeklyScheduleItem(models.Model):
     routine = models.ForeignKey(TrainingRoutine, on_delete=models.CASCADE, related_name='weekly_schedule')
     day_of_week_or_number = models.CharField(max_length=255)
@@ -74,36 +99,84 @@ class WorkoutPlan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # heat_level is the average completion percentage of the plan's logs over
+    # the HEAT_WINDOW_DAYS days ending heat_window_end, divided by ten (0-10).
+    # It is stored: DailyWorkoutLog.save() and delete() adjust heat_window_total
+    # when a log in the window changes, and the first change or read on a new
+    # day recomputes the window. `manage.py recompute_heat_levels` does all
+    # plans at once.
+    heat_level = models.PositiveSmallIntegerField(default=0)
+    heat_window_total = models.PositiveIntegerField(default=0, help_text="Sum of completion_percentage over the heat window.")
+    heat_window_end = models.DateField(null=True, blank=True, help_text="Last day of the window heat_level was computed for.")
+
     def __str__(self):
         routine_name = self.current_routine.routine_name if self.current_routine else "No routine selected"
         return f"{self.user.username}'s Workout Plan ({routine_name})"
 
-    @property
-    def heat_level(self): 
+    def refresh_heat_level(self, today=None, force=False):
+        """Recomputes heat_level with one aggregate query if the window no longer ends today."""
+        today = today or timezone.now().date()
+        if self.heat_window_end == today and not force:
+            return self.heat_level
+        total = self.daily_logs.filter(date__range=heat_window(today)).aggregate(
+            total=Sum('completion_percentage'))['total'] or 0
+        self._store_heat(total, today)
+        return self.heat_level
+
+    def _store_heat(self, total, window_end):
+        self.heat_window_total, self.heat_window_end, self.heat_level = total, window_end, heat_from_total(total)
+        # update() so the plan's updated_at only tracks the user's own edits.
+        WorkoutPlan.objects.filter(pk=self.pk).update(
+            heat_window_total=self.heat_window_total, heat_window_end=window_end, heat_level=self.heat_level)
+
+    @classmethod
+    def apply_completion_change(cls, plan_id, log_date, delta):
         """
-        Calculates the heat_level dynamically based on the
-        average completion percentage of DailyWorkoutLogs in the last 7 days.
+        Adds `delta` percentage points on `log_date` to a plan's stored heat.
+        With delta None (the old value is unknown) the window is recomputed.
         """
         today = timezone.now().date()
-        seven_days_ago = today - timedelta(days=6) 
+        with transaction.atomic():
+            plan = cls.objects.select_for_update().only(
+                'id', 'heat_level', 'heat_window_total', 'heat_window_end').filter(pk=plan_id).first()
+            if plan is None:
+                return
+            if delta is None or plan.heat_window_end != today:
+                plan.refresh_heat_level(today, force=True)
+                return
+            start, end = heat_window(today)
+            if delta and start <= log_date <= end:
+                plan._store_heat(max(0, plan.heat_window_total + delta), today)
 
-        recent_logs = self.daily_logs.filter( 
-            date__gte=seven_days_ago,
-            date__lte=today
-        )
+    @classmethod
+    def recompute_heat_levels(cls, today=None, batch_size=1000):
+        """Recomputes every plan's heat with one aggregate query; returns (plans, plans changed)."""
+        today = today or timezone.now().date()
+        window = Q(daily_logs__date__range=heat_window(today))
+        rows = cls.objects.annotate(
+            window_total=Coalesce(Sum('daily_logs__completion_percentage', filter=window), 0),
+        ).values_list('id', 'window_total', 'heat_window_total', 'heat_window_end', 'heat_level').order_by()
+        plans, changed = 0, []
+        for plan_id, total, stored_total, stored_end, stored_level in rows.iterator():
+            plans += 1
+            level = heat_from_total(total)
+            if (total, today, level) != (stored_total, stored_end, stored_level):
+                changed.append(cls(id=plan_id, heat_window_total=total, heat_window_end=today, heat_level=level))
+        cls.objects.bulk_update(changed, ['heat_window_total', 'heat_window_end', 'heat_level'], batch_size=batch_size)
+        return plans, len(changed)
 
-        if not recent_logs.exists():
-            return 0
 
-        total_percentage_sum = 0
-        for log in recent_logs:
-            total_percentage_sum += log.completion_percentage
+HEAT_WINDOW_DAYS = 7
 
-        days_in_period = 7
-        average_completion_percentage_over_period = total_percentage_sum / days_in_period
 
-        calculated_heat = round(average_completion_percentage_over_period / 10)
-        return max(0, min(10, calculated_heat))
+def heat_window(end):
+    return end - timedelta(days=HEAT_WINDOW_DAYS - 1), end
+
+
+def heat_from_total(total):
+    """0-10 from the summed completion percentages of the window, counting days without a log as 0%."""
+    return max(0, min(10, round(total / HEAT_WINDOW_DAYS / 10)))
+
 
 class DailyWorkoutLog(models.Model):
     workout_plan = models.ForeignKey(
@@ -122,7 +195,6 @@ class DailyWorkoutLog(models.Model):
         related_name='logged_as_daily_workout',
         help_text="Reference to the actual routine instance used for this log, if available."
     )
-    logged_exercises = models.JSONField(default=list, help_text="Details of exercises logged for the day, including completion.", null=True,blank=True,)
     completion_percentage = models.PositiveIntegerField(
         default=0,
         validators=[MinValueValidator(0),MaxValueValidator(100)],
@@ -137,8 +209,135 @@ class DailyWorkoutLog(models.Model):
     def __str__(self):
         return f"Log for {self.workout_plan.user.username} on {self.date} ({self.completion_percentage}%)"
 
+    @property
+    def logged_exercises(self):
+        """The day's ExerciseLogEntry rows in the API's logged_exercises shape (one query unless prefetched)."""
+        return [entry.as_logged_exercise() for entry in self.exercise_entries.all()]
+
+    HEAT_FIELDS = {'workout_plan', 'workout_plan_id', 'date', 'completion_percentage'}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_heat = instance._heat_contribution()
+        return instance
+
+    def _heat_contribution(self):
+        """(plan id, date, completion) as stored, or None if any of them wasn't loaded."""
+        loaded = self.__dict__
+        if not all(name in loaded for name in ('workout_plan_id', 'date', 'completion_percentage')):
+            return None
+        log_date = loaded['date']
+        if isinstance(log_date, datetime):
+            log_date = log_date.date()
+        return loaded['workout_plan_id'], log_date, loaded['completion_percentage']
+
     def save(self, *args, **kwargs):
-        if self.workout_plan and self.workout_plan.current_routine and not self.routine_used:
+        # Ids first, so saving a log that already has its routine loads nothing.
+        if self.workout_plan_id and not self.routine_used_id and self.workout_plan.current_routine:
             self.routine_used = self.workout_plan.current_routine
             self.routine_log_name = self.workout_plan.current_routine.routine_name
-        super().save(*args, **kwargs)
\ No newline at end of file
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or self.HEAT_FIELDS.intersection(update_fields):
+            self._update_heat(None if adding else getattr(self, '_saved_heat', None), adding)
+
+    def delete(self, *args, **kwargs):
+        contribution = getattr(self, '_saved_heat', None)
+        result = super().delete(*args, **kwargs)
+        if contribution is not None:
+            WorkoutPlan.apply_completion_change(contribution[0], contribution[1], -contribution[2])
+        return result
+
+    def _update_heat(self, old, adding):
+        new = self._heat_contribution()
+        self._saved_heat = new
+        if new is None or (old is None and not adding):
+            WorkoutPlan.apply_completion_change(self.workout_plan_id, None, None)
+            return
+        if old == new:
+            return
+        if old is not None:
+            WorkoutPlan.apply_completion_change(old[0], old[1], -old[2])
+        WorkoutPlan.apply_completion_change(new[0], new[1], new[2])
+
+
+class ExerciseLogEntry(models.Model):
+    """
+    One exercise of a day's log. The API still nests these as the log's
+    logged_exercises list, one dict per row with these fields as keys;
+    keys a client sends that aren't fields round-trip through `extra`.
+    """
+    daily_log = models.ForeignKey(
+        DailyWorkoutLog,
+        on_delete=models.CASCADE,
+        related_name='exercise_entries',
+        help_text="The day's log this exercise belongs to."
+    )
+    position = models.PositiveSmallIntegerField(default=0, help_text="Index in the day's logged_exercises list.")
+    original_exercise_id = models.PositiveIntegerField(help_text="Id of the routine Exercise this entry was logged from.")
+    exercise_name = models.CharField(max_length=255)
+    target_muscles = models.JSONField(default=list, blank=True)
+    target_sets = models.CharField(max_length=50)
+    target_reps_or_duration = models.CharField(max_length=100, blank=True, default='')
+    notes_from_routine = models.TextField(null=True, blank=True)
+    completed_status = models.CharField(max_length=20, default='pending', help_text="pending, partial, full or skipped.")
+    actual_sets_completed = models.PositiveIntegerField(default=0)
+    actual_reps_per_set = models.JSONField(default=list, blank=True)
+    actual_duration_seconds = models.FloatField(null=True, blank=True)
+    weight_used_per_set = models.JSONField(default=list, blank=True)
+    user_notes_for_exercise = models.TextField(blank=True, default='')
+    rep_kinematics = models.JSONField(null=True, blank=True, help_text="Per-rep rows written by supervision sockets (gym/persistence.py).")
+    extra = models.JSONField(default=dict, blank=True, help_text="Client keys that have no column.")
+
+    LOGGED_FIELDS = (
+        'original_exercise_id', 'exercise_name', 'target_muscles', 'target_sets', 'target_reps_or_duration',
+        'notes_from_routine', 'completed_status', 'actual_sets_completed', 'actual_reps_per_set',
+        'actual_duration_seconds', 'weight_used_per_set', 'user_notes_for_exercise', 'rep_kinematics',
+    )
+
+    class Meta:
+        ordering = ['position', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['daily_log', 'original_exercise_id'], name='unique_exercise_per_daily_log'),
+        ]
+        indexes = [models.Index(fields=['exercise_name', 'daily_log'])]
+
+    def __str__(self):
+        return f"{self.exercise_name} in log {self.daily_log_id} ({self.actual_sets_completed}/{self.target_sets} sets)"
+
+    def as_logged_exercise(self):
+        entry = {**self.extra, **{field: getattr(self, field) for field in self.LOGGED_FIELDS}}
+        if entry['rep_kinematics'] is None:
+            del entry['rep_kinematics']  # only entries a socket has written reps to carry it
+        return entry
+
+
+class PoseSessionRecording(models.Model):
+    daily_log = models.ForeignKey(
+        DailyWorkoutLog,
+        on_delete=models.CASCADE,
+        related_name='pose_recordings',
+        help_text="The day's log this session was recorded against."
+    )
+    original_exercise_id = models.PositiveIntegerField(help_text="original_exercise_id of the logged exercise entry.")
+    exercise_name = models.CharField(max_length=255, blank=True)
+    file_path = models.CharField(max_length=500, help_text="Path of the .gspose archive (see gym/archive.py).")
+    frame_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    first_frame_ms = models.FloatField(null=True, blank=True, help_text="Client timestamp of the first frame.")
+    last_frame_ms = models.FloatField(null=True, blank=True, help_text="Client timestamp of the last frame.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['daily_log', 'original_exercise_id'])]
+
+    def __str__(self):
+        return f"{self.exercise_name or 'Exercise ' + str(self.original_exercise_id)} recording for log {self.daily_log_id} ({self.frame_count} frames)"
+
+    def open(self):
+        """The recording as a memory-mapped gym.archive.PoseArchive."""
+        from .archive import PoseArchive
+        return PoseArchive(self.file_path)
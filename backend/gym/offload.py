@@ -0,0 +1,124 @@
+#offload.py
+#
+# Optional process-pool evaluation of pose frames (SUPERVISION_OFFLOAD).
+#
+# With ENABLED, SupervisionConsumer hands each message's frames to
+# tracker_pool instead of running the tracker on the event loop. Requests
+# arriving within BATCH_WINDOW_MS of each other, from any number of
+# sockets, are sent to a worker process as one job (sent early once it
+# holds MAX_BATCH_FRAMES frames; one large request is never split), and
+# each caller's future resolves when its job returns. The loop only pays
+# for pickling the frames.
+#
+# Ordering: a consumer awaits its result before channels hands it the next
+# message, and each request carries the stage and counter the previous one
+# returned, so every socket's frames are still evaluated in order and in
+# sequence. Requests from different sockets are independent and may finish
+# in any order.
+#
+# The worker entry point is gym.exes.evaluate_batch, so workers only import
+# gym.exes (numpy, no Django; TrackerPoolTests checks this) and are started
+# with "spawn" so they don't inherit the ASGI process's threads and sockets.
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .exes import evaluate_batch
+from .metrics import registry
+
+DEFAULTS = {
+    "ENABLED": False,
+    "WORKERS": None,  # os.cpu_count()
+    "BATCH_WINDOW_MS": 2.0,
+    "MAX_BATCH_FRAMES": 512,
+    "START_METHOD": "spawn",
+}
+
+
+def offload_settings():
+    return {**DEFAULTS, **getattr(settings, "SUPERVISION_OFFLOAD", {})}
+
+
+offload_batch_requests = registry.histogram(
+    "supervision_offload_batch_requests", "Tracker requests (one socket's message each) per process-pool job.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+class TrackerPool:
+    def __init__(self, config=None):
+        self.config = config or offload_settings()
+        self._executor = None
+        self._pending = []  # (request, future) waiting for the current batch window
+        self._pending_frames = 0
+        self._dispatch_handle = None
+        self.jobs = 0
+
+    @property
+    def enabled(self):
+        return bool(self.config["ENABLED"])
+
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.config["WORKERS"] or os.cpu_count(),
+                mp_context=multiprocessing.get_context(self.config["START_METHOD"]),
+                # Unpickling this imports gym.exes, which compiles the tracker table once per worker.
+                initializer=evaluate_batch, initargs=([],),
+            )
+        return self._executor
+
+    async def run(self, tracker_name, frames, stage=None, counter=0, reps_per_set=None):
+        """Evaluates frames in a worker process; same result as ExerciseTracker.run."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((tracker_name, frames, stage, counter, reps_per_set), future))
+        self._pending_frames += len(frames)
+        if self._pending_frames >= self.config["MAX_BATCH_FRAMES"]:
+            self._dispatch()
+        elif self._dispatch_handle is None:
+            self._dispatch_handle = loop.call_later(self.config["BATCH_WINDOW_MS"] / 1000.0, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._dispatch_handle is not None:
+            self._dispatch_handle.cancel()
+            self._dispatch_handle = None
+        batch, self._pending, self._pending_frames = self._pending, [], 0
+        if batch:
+            asyncio.get_running_loop().create_task(self._submit(batch))
+
+    async def _submit(self, batch):
+        requests = [request for request, _future in batch]
+        offload_batch_requests.observe(len(requests))
+        self.jobs += 1
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor(), evaluate_batch, requests)
+        except BaseException as e:
+            if isinstance(e, BrokenProcessPool):
+                print(f"Tracker process pool broke ({e}); starting a new one for the next batch.")
+                self._executor = None
+            for _request, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_request, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+tracker_pool = TrackerPool()
+atexit.register(tracker_pool.shutdown)
@@ -0,0 +1,90 @@
+#pagination.py
+#
+# Keyset ("cursor") pagination for the routine list.
+#
+# Routines are listed presets first, then newest first. DRF's
+# CursorPagination only keys on the first ordering field, which here is a
+# boolean, so this paginator keys on all three: the cursor is the
+# (is_preset, created_at, id) of the last routine on the page, and the next
+# page is the routines strictly after it in that order. Each page is one
+# indexed range query however deep it is, and routines created while a
+# client pages through never shift it onto rows it has already seen.
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class RoutineCursorPagination(BasePagination):
+    ordering = ('-is_preset', '-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            is_preset, created_at, pk = position
+            queryset = queryset.filter(
+                Q(is_preset__lt=is_preset)
+                | Q(is_preset=is_preset, created_at__lt=created_at)
+                | Q(is_preset=is_preset, created_at=created_at, id__lt=pk)
+            )
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.next_position = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            self.next_position = (last.is_preset, last.created_at, last.pk)
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            is_preset, created_at, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return bool(is_preset), datetime.fromisoformat(created_at), int(pk)
+        except (binascii.Error, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        is_preset, created_at, pk = position
+        return base64.urlsafe_b64encode(json.dumps([is_preset, created_at.isoformat(), pk]).encode()).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,165 @@
+#persistence.py
+#
+# Write-behind buffer for set progress coming from supervision sockets.
+#
+# Consumers record (log, exercise, sets completed) here instead of
+# writing the exercise's ExerciseLogEntry row on every set, along with the
+# compact per-rep kinematics rows (gym.kinematics.stored_row) that are
+# appended to its rep_kinematics. Set counts for the same exercise coalesce
+# (the latest count wins), rep rows accumulate, and all are written in one
+# transaction per flush, touching only the entries that changed: every
+# FLUSH_INTERVAL_S, when a socket disconnects, and at interpreter shutdown. A flush that fails puts its updates back so
+# the next one retries them; nothing is dropped until it is written. The
+# one exception is a REST edit of an exercise: it calls discard_sets() first,
+# so a buffered count from a socket can't overwrite what the user just saved.
+
+import asyncio
+import atexit
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .metrics import registry, set_progress_flush_seconds
+from .kinematics import STORED_FIELDS
+from .util import completion_status
+
+DEFAULTS = {
+    "FLUSH_INTERVAL_S": 2.0,
+    "MAX_STORED_REPS": 300,  # per exercise per day; the oldest rows go first
+}
+
+
+def write_behind_settings():
+    return {**DEFAULTS, **getattr(settings, "SUPERVISION_WRITE_BEHIND", {})}
+
+
+class SetProgressBuffer:
+    def __init__(self, flush_interval_s=None):
+        self.flush_interval_s = flush_interval_s
+        self._pending = {}  # daily_log_id -> {original_exercise_id: {"sets": n, "reps": [row, ...]}}
+        self._lock = threading.Lock()
+        self._task = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, daily_log_id, original_exercise_id, sets_completed):
+        with self._lock:
+            self._entry(daily_log_id, original_exercise_id)["sets"] = sets_completed
+
+    def record_reps(self, daily_log_id, original_exercise_id, rows):
+        with self._lock:
+            self._entry(daily_log_id, original_exercise_id).setdefault("reps", []).extend(rows)
+
+    def _entry(self, daily_log_id, original_exercise_id):
+        return self._pending.setdefault(daily_log_id, {}).setdefault(original_exercise_id, {})
+
+    def discard_sets(self, daily_log_id, original_exercise_id=None):
+        """Forgets buffered set counts for a log (or one of its exercises); buffered rep rows are kept."""
+        with self._lock:
+            updates = self._pending.get(daily_log_id, {})
+            for exercise_id in [original_exercise_id] if original_exercise_id is not None else list(updates):
+                update = updates.get(exercise_id)
+                if update is None:
+                    continue
+                update.pop("sets", None)
+                if not update.get("reps"):
+                    del updates[exercise_id]
+            if not updates:
+                self._pending.pop(daily_log_id, None)
+
+    def pending(self, daily_log_id, original_exercise_id):
+        """Buffered set count for an exercise, or None when nothing is waiting to be written."""
+        with self._lock:
+            return self._pending.get(daily_log_id, {}).get(original_exercise_id, {}).get("sets")
+
+    def ensure_flusher(self):
+        """Starts the periodic flush task on the running event loop if it isn't running there yet."""
+        if self._task is not None and not self._task.done() and self._task.get_loop() is asyncio.get_running_loop():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        interval = self.flush_interval_s or write_behind_settings()["FLUSH_INTERVAL_S"]
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing buffered set progress: {e}")
+
+    async def flush(self, daily_log_ids=None):
+        await sync_to_async(self.flush_sync)(daily_log_ids)
+
+    def flush_sync(self, daily_log_ids=None):
+        with self._lock:
+            if daily_log_ids is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {log_id: self._pending.pop(log_id) for log_id in daily_log_ids if log_id in self._pending}
+        if not batch:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            written = self._write(batch)
+        except Exception:
+            self._requeue(batch)
+            raise
+        set_progress_flush_seconds.observe(time.perf_counter() - started)
+        self.flushes += 1
+        self.rows_written += written
+        return written
+
+    def _write(self, batch):
+        from .models import ExerciseLogEntry
+
+        max_stored_reps = write_behind_settings()["MAX_STORED_REPS"]
+        wanted = Q()
+        for log_id, updates in batch.items():
+            wanted |= Q(daily_log_id=log_id, original_exercise_id__in=list(updates))
+        with transaction.atomic():
+            entries = list(ExerciseLogEntry.objects.select_for_update().filter(wanted).only(
+                'id', 'daily_log_id', 'original_exercise_id', 'target_sets', 'actual_sets_completed',
+                'completed_status', 'rep_kinematics'))
+            for entry in entries:
+                update = batch[entry.daily_log_id][entry.original_exercise_id]
+                if "sets" in update:
+                    entry.actual_sets_completed = update["sets"]
+                    entry.completed_status = completion_status(update["sets"], entry.target_sets)
+                if update.get("reps"):
+                    stored = entry.rep_kinematics or {"fields": list(STORED_FIELDS), "reps": []}
+                    stored["reps"] = (stored["reps"] + update["reps"])[-max_stored_reps:]
+                    entry.rep_kinematics = stored
+            ExerciseLogEntry.objects.bulk_update(entries, ['actual_sets_completed', 'completed_status', 'rep_kinematics'])
+        return len(entries)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for log_id, updates in batch.items():
+                for exercise_id, update in updates.items():
+                    entry = self._entry(log_id, exercise_id)
+                    if "sets" in update:
+                        # A newer count recorded while we were failing wins.
+                        entry.setdefault("sets", update["sets"])
+                    if update.get("reps"):
+                        entry["reps"] = update["reps"] + entry.get("reps", [])
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(updates) for updates in self._pending.values())
+
+
+set_progress = SetProgressBuffer()
+registry.callback_gauge("supervision_set_progress_pending", "Exercises with set counts or rep rows buffered and not yet written.", set_progress.pending_count)
+
+
+@atexit.register
+def _flush_on_shutdown():
+    try:
+        set_progress.flush_sync()
+    except Exception as e:
+        print(f"Error flushing buffered set progress at shutdown: {e}")
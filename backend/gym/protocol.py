@@ -0,0 +1,115 @@
+#protocol.py
+#
+# Binary wire format for the supervision socket (ws/supervision/<exercise_id>/).
+#
+# A client that offers the POSE_SUBPROTOCOL subprotocol may send each pose
+# frame as one binary message instead of the JSON `pose_landmarks` text
+# message:
+#
+#     offset  size  type     field
+#     0       1     uint8    protocol version (PROTOCOL_VERSION)
+#     1       1     uint8    message kind (KIND_FRAME)
+#     2       2     uint16   landmark count (33 for MediaPipe Pose)
+#     4       8     float64  client timestamp in milliseconds
+#     12      16*n  float32  x, y, z, visibility for each landmark
+#
+# Several frames can travel in one KIND_BATCH message (the binary form of
+# the JSON `pose_landmarks_batch` message):
+#
+#     offset  size    type     field
+#     0       1       uint8    protocol version (PROTOCOL_VERSION)
+#     1       1       uint8    message kind (KIND_BATCH)
+#     2       2       uint16   landmark count per frame
+#     4       4       uint32   frame count f
+#     8       8*f     float64  client timestamp of each frame in milliseconds
+#     8+8*f   16*n*f  float32  the frames, one after the other
+#
+# Everything is little-endian. The landmark block starts on a 4-byte
+# boundary so the server can view it in place with np.frombuffer.
+
+import struct
+
+import numpy as np
+
+from gym.util import LANDMARK_FIELDS, NUM_LANDMARKS
+
+POSE_SUBPROTOCOL = "grindsens.pose.v1"
+PROTOCOL_VERSION = 1
+
+KIND_FRAME = 1
+KIND_BATCH = 2
+
+MESSAGE_PREFIX = struct.Struct("<BBH")
+FRAME_HEADER = struct.Struct("<BBHd")
+BATCH_HEADER = struct.Struct("<BBHI")
+LANDMARK_DTYPE = np.dtype("<f4")
+TIMESTAMP_DTYPE = np.dtype("<f8")
+
+
+class FrameDecodeError(ValueError):
+    pass
+
+
+def encode_frame(frame, timestamp_ms=0.0):
+    """Packs a (n, 4) landmark array (or anything landmarks_to_array accepts) into one binary message."""
+    frame = np.ascontiguousarray(frame, dtype=LANDMARK_DTYPE).reshape(-1, LANDMARK_FIELDS)
+    header = FRAME_HEADER.pack(PROTOCOL_VERSION, KIND_FRAME, frame.shape[0], timestamp_ms)
+    return header + frame.tobytes()
+
+
+def encode_batch(frames, timestamps_ms):
+    """Packs a (f, n, 4) stack of frames and their f timestamps into one KIND_BATCH message."""
+    frames = np.ascontiguousarray(frames, dtype=LANDMARK_DTYPE).reshape(len(timestamps_ms), -1, LANDMARK_FIELDS)
+    timestamps = np.ascontiguousarray(timestamps_ms, dtype=TIMESTAMP_DTYPE)
+    header = BATCH_HEADER.pack(PROTOCOL_VERSION, KIND_BATCH, frames.shape[1], frames.shape[0])
+    return header + timestamps.tobytes() + frames.tobytes()
+
+
+def _check_prefix(data, header):
+    if len(data) < header.size:
+        raise FrameDecodeError("Binary message is shorter than its header.")
+    version, kind, landmark_count = MESSAGE_PREFIX.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise FrameDecodeError(f"Unsupported protocol version {version}.")
+    if landmark_count != NUM_LANDMARKS:
+        raise FrameDecodeError(f"Expected {NUM_LANDMARKS} landmarks, got {landmark_count}.")
+    return kind
+
+
+def decode_frame(data):
+    """
+    Returns (timestamp_ms, frame) for a binary frame message. `frame` is a
+    read-only (n, 4) float32 view over `data`; nothing is copied.
+    """
+    kind = _check_prefix(data, FRAME_HEADER)
+    if kind != KIND_FRAME:
+        raise FrameDecodeError(f"Expected a single frame, got message kind {kind}.")
+    _version, _kind, landmark_count, timestamp_ms = FRAME_HEADER.unpack_from(data)
+    values = landmark_count * LANDMARK_FIELDS
+    if len(data) != FRAME_HEADER.size + values * LANDMARK_DTYPE.itemsize:
+        raise FrameDecodeError("Binary frame length does not match its landmark count.")
+    frame = np.frombuffer(data, dtype=LANDMARK_DTYPE, count=values, offset=FRAME_HEADER.size)
+    return timestamp_ms, frame.reshape(landmark_count, LANDMARK_FIELDS)
+
+
+def decode_frames(data):
+    """
+    Decodes either message kind into (timestamps_ms, frames) with shapes
+    (f,) and (f, n, 4). Both are read-only views over `data`.
+    """
+    kind = _check_prefix(data, MESSAGE_PREFIX)
+    if kind == KIND_FRAME:
+        timestamp_ms, frame = decode_frame(data)
+        return np.array([timestamp_ms], dtype=TIMESTAMP_DTYPE), frame[np.newaxis]
+    if kind != KIND_BATCH:
+        raise FrameDecodeError(f"Unknown binary message kind {kind}.")
+    _check_prefix(data, BATCH_HEADER)
+
+    _version, _kind, landmark_count, frame_count = BATCH_HEADER.unpack_from(data)
+    values = frame_count * landmark_count * LANDMARK_FIELDS
+    frames_offset = BATCH_HEADER.size + frame_count * TIMESTAMP_DTYPE.itemsize
+    if len(data) != frames_offset + values * LANDMARK_DTYPE.itemsize:
+        raise FrameDecodeError("Binary batch length does not match its frame and landmark counts.")
+    timestamps = np.frombuffer(data, dtype=TIMESTAMP_DTYPE, count=frame_count, offset=BATCH_HEADER.size)
+    frames = np.frombuffer(data, dtype=LANDMARK_DTYPE, count=values, offset=frames_offset)
+    return timestamps, frames.reshape(frame_count, landmark_count, LANDMARK_FIELDS)
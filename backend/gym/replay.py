@@ -0,0 +1,223 @@
+#replay.py
+#
+# Record-and-replay harness for the pose trackers.
+#
+# A PoseRecording is one stream of frames as the supervision socket saw
+# them: a (n, 33, 4) float32 landmark array, the client timestamps and the
+# exercise name, stored as a compressed .npz file. Live sockets record into
+# .gspose archives (gym/archive.py, SUPERVISION_ARCHIVE) instead; an archive
+# becomes a PoseRecording through PoseArchive.to_recording(), and
+# `manage.py replay_pose --export-npz DIR` saves it as .npz. Recordings
+# replay straight into a tracker (replay_tracker) or through
+# SupervisionConsumer over the channels test communicator (replay_consumer);
+# both report rep counts, throughput and per-call latency percentiles.
+# `manage.py replay_pose` wraps them.
+
+import json
+import math
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from .landmarks import POSE_LANDMARKS
+from .util import LANDMARK_FIELDS, NUM_LANDMARKS, landmarks_to_array
+
+
+class PoseRecording:
+    def __init__(self, exercise_name, timestamps_ms, frames, meta=None):
+        self.exercise_name = exercise_name
+        self.timestamps_ms = np.asarray(timestamps_ms, dtype=np.float64)
+        self.frames = np.asarray(frames, dtype=np.float32).reshape(-1, NUM_LANDMARKS, LANDMARK_FIELDS)
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header = json.dumps({"exercise_name": self.exercise_name, **self.meta})
+        with open(path, "wb") as f:
+            np.savez_compressed(f, frames=self.frames, timestamps_ms=self.timestamps_ms, header=np.array(header))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            exercise_name = header.pop("exercise_name")
+            return cls(exercise_name, data["timestamps_ms"], data["frames"], meta=header)
+
+
+def synthetic_curl(reps=10, fps=30.0, seconds_per_rep=2.0, side="LEFT", seed=0):
+    """A curl recording with exactly `reps` full reps plus a little landmark noise."""
+    rng = np.random.default_rng(seed)
+    count = int(reps * seconds_per_rep * fps) + int(fps)
+    frames = np.full((count, NUM_LANDMARKS, LANDMARK_FIELDS), 0.5, dtype=np.float32)
+    frames[:, :, 3] = 0.9
+    shoulder, elbow, wrist = (POSE_LANDMARKS[f"{side}_{joint}"] for joint in ("SHOULDER", "ELBOW", "WRIST"))
+    t = np.arange(count) / fps
+    # Start extended (angle 175), flex to 25 and back once per rep, then hold extended.
+    phase = np.clip(t / seconds_per_rep, 0, reps)
+    elbow_angle = np.radians(100 + 75 * np.cos(2 * math.pi * phase))
+    frames[:, shoulder, :2] = (0.5, 0.3)
+    frames[:, elbow, :2] = (0.5, 0.5)
+    frames[:, wrist, 0] = 0.5 + 0.2 * np.sin(elbow_angle)
+    frames[:, wrist, 1] = 0.5 - 0.2 * np.cos(elbow_angle)
+    frames[:, :, :2] += rng.normal(0, 0.002, (count, NUM_LANDMARKS, 2)).astype(np.float32)
+    return PoseRecording(f"curl_{side[0].lower()}", t * 1000.0, frames)
+
+
+def _report(mode, frames, reps, sets, elapsed_s, call_latencies_s):
+    latencies_us = np.asarray(call_latencies_s) * 1e6
+    return {
+        "mode": mode,
+        "frames": frames,
+        "reps": reps,
+        "sets": sets,
+        "frames_per_s": frames / elapsed_s if elapsed_s else float("inf"),
+        "p50_us": float(np.percentile(latencies_us, 50)) if len(latencies_us) else 0.0,
+        "p99_us": float(np.percentile(latencies_us, 99)) if len(latencies_us) else 0.0,
+    }
+
+
+def replay_tracker(recording, tracker, batch_size=1):
+    """
+    Feeds a recording straight into a tracker, `batch_size` frames per
+    ExerciseTracker.run call. Latency percentiles are per call, i.e. how
+    long the newest frame of a batch waits for its result.
+    """
+    stage, counter, reps = None, 0, 0
+    latencies = []
+    started = time.perf_counter()
+    for offset in range(0, len(recording), batch_size):
+        call_started = time.perf_counter()
+        result = tracker.run(recording.frames[offset:offset + batch_size], stage, counter)
+        latencies.append(time.perf_counter() - call_started)
+        reps += len(result.rep_frames)
+        stage, counter = result.stage, result.counter
+    return _report(f"tracker:{tracker.name}", len(recording), reps, 0, time.perf_counter() - started, latencies)
+
+
+async def replay_consumer(recording, application, exercise_id, batch_size=1, headers=None, binary=True):
+    """
+    Streams a recording through SupervisionConsumer with the channels test
+    communicator. After every message the runner asks for `stats` and waits
+    for the answer, so each latency sample covers decode, evaluation and any
+    rep/set messages for that message. Replays run faster than real time,
+    so the recorded timestamps never look late to stale-frame dropping.
+    """
+    from channels.testing import WebsocketCommunicator
+
+    from .protocol import POSE_SUBPROTOCOL, encode_batch
+
+    communicator = WebsocketCommunicator(
+        application, f"/ws/supervision/{exercise_id}/",
+        headers=headers or [], subprotocols=[POSE_SUBPROTOCOL] if binary else None,
+    )
+    connected, _subprotocol = await communicator.connect()
+    if not connected:
+        raise RuntimeError("Supervision socket refused the connection.")
+
+    latencies = []
+
+    async def drain_until_stats():
+        while True:
+            message = json.loads(await communicator.receive_from(timeout=10))
+            if message["type"] == "stats":
+                return message
+            if message["type"] == "error":
+                raise RuntimeError(message["message"])
+
+    stats_request = json.dumps({"type": "get_stats"})
+    await communicator.send_to(text_data=stats_request)
+    first = await drain_until_stats()
+
+    started = time.perf_counter()
+    for offset in range(0, len(recording), batch_size):
+        frames = recording.frames[offset:offset + batch_size]
+        timestamps = recording.timestamps_ms[offset:offset + batch_size]
+        call_started = time.perf_counter()
+        if binary:
+            await communicator.send_to(bytes_data=encode_batch(frames, timestamps))
+        else:
+            await communicator.send_to(text_data=json.dumps({
+                "type": "pose_landmarks_batch",
+                "exercise_name": recording.exercise_name,
+                "frames": [{"t": t, "landmarks": [dict(zip(("x", "y", "z", "visibility"), lm)) for lm in frame.tolist()]}
+                           for t, frame in zip(timestamps.tolist(), frames)],
+            }))
+        await communicator.send_to(text_data=stats_request)
+        last = await drain_until_stats()
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    await communicator.disconnect()
+    return _report(
+        "consumer:binary" if binary else "consumer:json", len(recording),
+        last["reps_counted"] - first["reps_counted"], last["sets_completed"] - first["sets_completed"],
+        elapsed, latencies,
+    )
+
+
+def recording_from_messages(lines, exercise_name=None):
+    """Builds a recording from logged JSON pose_landmarks / pose_landmarks_batch messages, one per line."""
+    timestamps, frames = [], []
+    for line in lines:
+        message = json.loads(line)
+        exercise_name = exercise_name or message.get("exercise_name")
+        if message.get("type") == "pose_landmarks":
+            items = [message]
+        elif message.get("type") == "pose_landmarks_batch":
+            items = message.get("frames", [])
+        else:
+            continue
+        for item in items:
+            frames.append(landmarks_to_array(item["landmarks"]))
+            timestamps.append(item.get("t", len(timestamps)))
+    return PoseRecording(exercise_name, timestamps, np.stack(frames) if frames else np.empty((0, NUM_LANDMARKS, LANDMARK_FIELDS)))
+
+
+class AuthenticatedApplication:
+    """Wraps an ASGI application so every connection runs as `user`, skipping the session cookie."""
+
+    def __init__(self, application, user):
+        self.application = application
+        self.user = user
+
+    async def __call__(self, scope, receive, send):
+        return await self.application(dict(scope, user=self.user), receive, send)
+
+
+def seed_supervision_session(exercise_name, username="replay", target_sets="3"):
+    """
+    Creates a user with a one-exercise routine and today's DailyWorkoutLog
+    for it, which is what a supervision socket needs to connect. Returns
+    (user, original_exercise_id). Only use this against a throwaway database.
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from .models import DailyWorkoutLog, Exercise, ExerciseLogEntry, TrainingRoutine, WeeklyScheduleItem, WorkoutPlan
+
+    user = User.objects.create_user(username=username, password=uuid.uuid4().hex)
+    routine = TrainingRoutine.objects.create(
+        user=user, routine_id=f"{username}_routine", routine_name=f"{username} routine", goal="replay",
+        experience_level="any", training_split="full body", days_per_week="1", description="replay",
+    )
+    schedule_item = WeeklyScheduleItem.objects.create(routine=routine, day_of_week_or_number="Day 1", session_focus="replay")
+    exercise = Exercise.objects.create(
+        schedule_item=schedule_item, exercise_name=exercise_name, sets=target_sets,
+        reps_or_duration="10", rest_period="60 seconds",
+    )
+    plan = WorkoutPlan.objects.create(user=user, current_routine=routine)
+    daily_log = DailyWorkoutLog.objects.create(workout_plan=plan, date=timezone.now().date())
+    ExerciseLogEntry.objects.create(
+        daily_log=daily_log,
+        original_exercise_id=exercise.pk,
+        exercise_name=exercise_name,
+        target_sets=target_sets,
+        target_reps_or_duration="10",
+    )
+    return user, exercise.pk
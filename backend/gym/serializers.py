@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import UserProfile, TrainingRoutine, WeeklyScheduleItem, Exercise,WorkoutPlan, TrainingRoutine,DailyWorkoutLog
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from .models import UserProfile, TrainingRoutine, WeeklyScheduleItem, Exercise,WorkoutPlan, TrainingRoutine,DailyWorkoutLog,ExerciseLogEntry
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -32,60 +34,230 @@ class UserProfileSerializer(serializers.ModelSerializer):
 #######################################################################################
 
 class ExerciseSerializer(serializers.ModelSerializer):
+    # Writable so a routine update can tell edited exercises from new ones.
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = Exercise
         fields = ['id', 'exercise_name', 'target_muscles', 'sets', 'reps_or_duration', 'rest_period', 'notes']
 
 class WeeklyScheduleItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     exercises = ExerciseSerializer(many=True) 
 
     class Meta:
         model = WeeklyScheduleItem
         fields = ['id', 'day_of_week_or_number', 'session_focus', 'exercises']
 
+def write_weekly_schedule(routine, weekly_schedule_data):
+    """
+    Inserts a routine's days and their exercises with one batched INSERT
+    each; call inside a transaction. weekly_schedule_data is the validated
+    (or copied) list of day dicts, each with an 'exercises' list.
+    """
+    write_weekly_schedules([routine], weekly_schedule_data)
+
+
+def write_weekly_schedules(routines, weekly_schedule_data):
+    """write_weekly_schedule() for several routines at once, still one INSERT per table."""
+    days = [_without_id(day) for day in weekly_schedule_data]
+    exercises_per_day = [day.pop('exercises', []) for day in days]
+    schedule_items = WeeklyScheduleItem.objects.bulk_create(
+        [WeeklyScheduleItem(routine=routine, **day) for routine in routines for day in days]
+    )
+    if any(item.pk is None for item in schedule_items):
+        # Backends that can't return ids from a bulk insert: rows were inserted in order.
+        schedule_items = [item for routine in routines for item in list(routine.weekly_schedule.order_by('id'))[-len(days):]]
+    Exercise.objects.bulk_create([
+        Exercise(schedule_item=schedule_item, **_without_id(exercise))
+        for schedule_item, exercises in zip(schedule_items, exercises_per_day * len(routines))
+        for exercise in exercises
+    ])
+
+
+def schedule_data(routine):
+    """A routine's resolved days and exercises as write_weekly_schedule() input; uses prefetched rows."""
+    return [
+        {
+            **{field: getattr(item, field) for field in SCHEDULE_ITEM_FIELDS},
+            'exercises': [
+                {field: getattr(exercise, field) for field in EXERCISE_FIELDS[1:]}
+                for exercise in item.exercises.all()
+            ],
+        }
+        for item in routine.schedule
+    ]
+
+
+def schedule_matches(routine, weekly_schedule_data):
+    """True if an incoming tree has the same days and exercises, in order, as the routine's, ids aside."""
+    stored = schedule_data(routine)
+    if len(stored) != len(weekly_schedule_data):
+        return False
+    for stored_day, day in zip(stored, weekly_schedule_data):
+        exercises = day.get('exercises', [])
+        incoming_day = WeeklyScheduleItem(**_without_id({key: value for key, value in day.items() if key != 'exercises'}))
+        if any(getattr(incoming_day, field) != stored_day[field] for field in SCHEDULE_ITEM_FIELDS):
+            return False
+        if len(exercises) != len(stored_day['exercises']):
+            return False
+        for stored_exercise, exercise in zip(stored_day['exercises'], exercises):
+            incoming = Exercise(**_without_id(exercise))
+            if any(getattr(incoming, field) != value for field, value in stored_exercise.items()):
+                return False
+    return True
+
+
+def release_adoptions(preset):
+    """
+    Gives every routine still sharing `preset`'s schedule a copy of its
+    own, with one INSERT per table however many there are; call inside a
+    transaction, before the preset's schedule changes. Returns how many.
+    """
+    adopters = list(preset.adoptions.select_for_update().only('id'))
+    if adopters:
+        write_weekly_schedules(adopters, schedule_data(preset))
+        preset.adoptions.update(base_routine=None)
+    return len(adopters)
+
+
+def _without_id(data):
+    return {key: value for key, value in data.items() if key != 'id'}
+
+
+SCHEDULE_ITEM_FIELDS = ('day_of_week_or_number', 'session_focus')
+EXERCISE_FIELDS = ('schedule_item_id', 'exercise_name', 'target_muscles', 'sets', 'reps_or_duration', 'rest_period', 'notes')
+
+
+def _apply_changes(existing, incoming, fields, changed_fields):
+    """Copies differing fields from an unsaved instance onto a stored one; True if any differed."""
+    changed = False
+    for field in fields:
+        value = getattr(incoming, field)
+        if getattr(existing, field) != value:
+            setattr(existing, field, value)
+            changed_fields.add(field)
+            changed = True
+    return changed
+
+
+def sync_weekly_schedule(routine, weekly_schedule_data):
+    """
+    Brings a routine's stored days and exercises in line with an incoming
+    tree by id, with at most one batched INSERT, UPDATE and DELETE per
+    table; call inside a transaction. Days and exercises sent back with
+    their id keep it (an exercise may move to another day of the routine),
+    ones without an id or with an id from another routine are inserted,
+    and stored ones missing from the tree are deleted. Unchanged rows are
+    not written, so original_exercise_id references in daily logs stay
+    valid across edits. Uses the routine's prefetched tree when it has one.
+    """
+    prefetch_related_objects([routine], 'weekly_schedule__exercises')
+    stored_items = {item.pk: item for item in routine.weekly_schedule.all()}
+    stored_exercises = {exercise.pk: exercise for item in stored_items.values() for exercise in item.exercises.all()}
+
+    # Days first, so new and moved exercises have a day to point at.
+    days, new_items, changed_items, item_fields = [], [], [], set()
+    for day in weekly_schedule_data:
+        day = dict(day)
+        exercises = day.pop('exercises', [])
+        incoming = WeeklyScheduleItem(routine=routine, **_without_id(day))
+        item = stored_items.pop(day.get('id'), None)
+        if item is None:
+            new_items.append(incoming)
+            item = incoming
+        elif _apply_changes(item, incoming, SCHEDULE_ITEM_FIELDS, item_fields):
+            changed_items.append(item)
+        days.append((item, exercises))
+    WeeklyScheduleItem.objects.bulk_create(new_items)
+    if any(item.pk is None for item in new_items):
+        # Backends that can't return ids from a bulk insert: rows were inserted in order.
+        new_ids = list(routine.weekly_schedule.order_by('-id').values_list('id', flat=True)[:len(new_items)])
+        for item, pk in zip(new_items, reversed(new_ids)):
+            item.pk = pk
+    if changed_items:
+        WeeklyScheduleItem.objects.bulk_update(changed_items, list(item_fields))
+
+    new_exercises, changed_exercises, exercise_fields = [], [], set()
+    for item, exercises in days:
+        for data in exercises:
+            incoming = Exercise(schedule_item=item, **_without_id(data))
+            exercise = stored_exercises.pop(data.get('id'), None)
+            if exercise is None:
+                new_exercises.append(incoming)
+            elif _apply_changes(exercise, incoming, EXERCISE_FIELDS, exercise_fields):
+                changed_exercises.append(exercise)
+    Exercise.objects.bulk_create(new_exercises)
+    if changed_exercises:
+        Exercise.objects.bulk_update(changed_exercises, list(exercise_fields))
+
+    if stored_exercises:
+        Exercise.objects.filter(pk__in=list(stored_exercises)).delete()
+    if stored_items:
+        # Their exercises were either moved above or are among those just deleted.
+        WeeklyScheduleItem.objects.filter(pk__in=list(stored_items)).delete()
+
+
 class TrainingRoutineSerializer(serializers.ModelSerializer):
-    weekly_schedule = WeeklyScheduleItemSerializer(many=True)
+    # Read through TrainingRoutine.schedule, so an adopted routine shows its preset's days.
+    weekly_schedule = WeeklyScheduleItemSerializer(many=True, source='schedule')
     username = serializers.CharField(source='user.username', read_only=True)
 
     class Meta:
         model = TrainingRoutine
         fields = [
             'id', 'user', 'username', 'routine_id', 'routine_name', 'goal', 'experience_level',
-            'training_split', 'days_per_week', 'description', 'weekly_schedule',
+            'training_split', 'days_per_week', 'description', 'weekly_schedule', 'base_routine',
             'cardio_guidelines', 'flexibility_guidelines', 'precautions', 'coach_response',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['user', 'username', 'created_at', 'updated_at'] # User is set via perform_create
+        read_only_fields = ['user', 'username', 'base_routine', 'created_at', 'updated_at'] # User is set via perform_create
 
+    @transaction.atomic
     def create(self, validated_data):
-        weekly_schedule_data = validated_data.pop('weekly_schedule', [])
+        weekly_schedule_data = validated_data.pop('schedule', [])
         routine = TrainingRoutine.objects.create(**validated_data)
-
-        for schedule_item_data in weekly_schedule_data:
-            exercises_data = schedule_item_data.pop('exercises', [])
-            schedule_item = WeeklyScheduleItem.objects.create(routine=routine, **schedule_item_data)
-            for exercise_data in exercises_data:
-                Exercise.objects.create(schedule_item=schedule_item, **exercise_data)
+        write_weekly_schedule(routine, weekly_schedule_data)
         return routine
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.routine_id = validated_data.get('routine_id', instance.routine_id)
         instance.routine_name = validated_data.get('routine_name', instance.routine_name)
         instance.goal = validated_data.get('goal', instance.goal)
         instance.coach_response = validated_data.get('coach_response', instance.coach_response)
+
+        weekly_schedule_data = validated_data.pop('schedule', None)
+        if weekly_schedule_data is not None and instance.base_routine_id:
+            if schedule_matches(instance, weekly_schedule_data):
+                weekly_schedule_data = None  # still the preset's; keep sharing it
+            else:
+                # First edit of an adopted schedule: the preset's ids are
+                # foreign to this routine, so the sync below inserts it all.
+                instance.base_routine = None
         instance.save()
 
-        weekly_schedule_data = validated_data.pop('weekly_schedule', None)
         if weekly_schedule_data is not None:
-            instance.weekly_schedule.all().delete() 
-
-            for schedule_item_data in weekly_schedule_data:
-                exercises_data = schedule_item_data.pop('exercises', [])
-                schedule_item = WeeklyScheduleItem.objects.create(routine=instance, **schedule_item_data)
-                for exercise_data in exercises_data:
-                    Exercise.objects.create(schedule_item=schedule_item, **exercise_data)
+            if instance.is_preset and not schedule_matches(instance, weekly_schedule_data):
+                release_adoptions(instance)
+            sync_weekly_schedule(instance, weekly_schedule_data)
         return instance
     
+class TrainingRoutineSummarySerializer(serializers.ModelSerializer):
+    """Top-level routine fields with day and exercise counts (GET /routines/?view=summary)."""
+    username = serializers.CharField(source='user.username', read_only=True)
+    day_count = serializers.IntegerField(read_only=True)
+    exercise_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = TrainingRoutine
+        fields = [
+            'id', 'user', 'username', 'is_preset', 'routine_id', 'routine_name', 'goal', 'experience_level',
+            'training_split', 'days_per_week', 'description', 'day_count', 'exercise_count',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+    
 ##############################
 
 class WorkoutPlanSerializer(serializers.ModelSerializer):
@@ -125,10 +297,78 @@ class MinimalWeeklyScheduleItemSerializer(serializers.ModelSerializer):
         model = WeeklyScheduleItem
         fields = ['id', 'day_of_week_or_number', 'session_focus', 'exercises']
 
+class ExerciseLogEntrySerializer(serializers.ModelSerializer):
+    """One item of a log's logged_exercises; keys that aren't columns are kept in `extra`."""
+
+    class Meta:
+        model = ExerciseLogEntry
+        fields = list(ExerciseLogEntry.LOGGED_FIELDS)
+        # Written only by supervision sockets, so a client saving a stale copy can't drop new reps.
+        read_only_fields = ['rep_kinematics']
+
+    def to_internal_value(self, data):
+        if not isinstance(data, dict):
+            raise serializers.ValidationError("Each item in logged_exercises must be a dictionary.")
+        value = super().to_internal_value(data)
+        value['extra'] = {key: item for key, item in data.items() if key not in self.fields}
+        return value
+
+    def validate(self, attrs):
+        # Checked here because a PATCH of the log makes every nested field optional.
+        if any(field not in attrs for field in ('original_exercise_id', 'exercise_name', 'target_sets')):
+            raise serializers.ValidationError("Exercise item missing required fields (original_exercise_id, exercise_name, target_sets).")
+        return attrs
+
+    def to_representation(self, instance):
+        return instance.as_logged_exercise()
+
+
+LOG_ENTRY_FIELDS = tuple(field for field in ExerciseLogEntry.LOGGED_FIELDS if field != 'rep_kinematics') + ('position', 'extra')
+
+
+def sync_exercise_entries(daily_log, entries_data):
+    """
+    Makes a log's ExerciseLogEntry rows match an incoming logged_exercises
+    list, matched by original_exercise_id: changed entries are updated
+    (only the columns that differ), new ones inserted and missing ones
+    deleted, at most one statement each; call inside a transaction. An
+    edit to one exercise writes one row.
+    """
+    prefetch_related_objects([daily_log], 'exercise_entries')
+    stored = {entry.original_exercise_id: entry for entry in daily_log.exercise_entries.all()}
+    new_entries, changed_entries, changed_fields = [], [], set()
+    for position, data in enumerate(entries_data):
+        incoming = ExerciseLogEntry(daily_log=daily_log, position=position, **data)
+        entry = stored.pop(incoming.original_exercise_id, None)
+        if entry is None:
+            new_entries.append(incoming)
+        elif _apply_changes(entry, incoming, LOG_ENTRY_FIELDS, changed_fields):
+            changed_entries.append(entry)
+    ExerciseLogEntry.objects.bulk_create(new_entries)
+    if changed_entries:
+        ExerciseLogEntry.objects.bulk_update(changed_entries, sorted(changed_fields))
+    if stored:
+        ExerciseLogEntry.objects.filter(pk__in=[entry.pk for entry in stored.values()]).delete()
+    if new_entries or changed_entries or stored:
+        # The prefetched list is stale now; the next read reloads it.
+        daily_log._prefetched_objects_cache.pop('exercise_entries', None)
+
+
+def update_exercise_entry(entry, validated_data):
+    """Saves the columns of one entry that differ from validated_data; returns their names."""
+    incoming = ExerciseLogEntry(daily_log_id=entry.daily_log_id, position=entry.position, **validated_data)
+    changed_fields = set()
+    if _apply_changes(entry, incoming, LOG_ENTRY_FIELDS, changed_fields):
+        entry.save(update_fields=sorted(changed_fields))
+    return changed_fields
+
+
 class DailyWorkoutLogSerializer(serializers.ModelSerializer):
     workout_plan = serializers.PrimaryKeyRelatedField( 
         queryset=WorkoutPlan.objects.all(),
     )
+    # Stored as ExerciseLogEntry rows; presented as the nested list it used to be.
+    logged_exercises = ExerciseLogEntrySerializer(many=True, source='exercise_entries', required=False)
     username = serializers.CharField(source='workout_plan.user.username', read_only=True, allow_null=True)
     routine_name_from_plan = serializers.CharField(source='workout_plan.current_routine.routine_name', read_only=True, allow_null=True)
 
@@ -150,15 +390,26 @@ class DailyWorkoutLogSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'routine_name_from_plan']
 
     def validate_logged_exercises(self, value):
-        if not isinstance(value, list):
-            raise serializers.ValidationError("logged_exercises must be a list.")
-        for item in value:
-            if not isinstance(item, dict):
-                raise serializers.ValidationError("Each item in logged_exercises must be a dictionary.")
-            if 'exercise_name' not in item or 'target_sets' not in item:
-                 raise serializers.ValidationError("Exercise item missing required fields (e.g., exercise_name, target_sets).")
+        exercise_ids = [item['original_exercise_id'] for item in value]
+        if len(set(exercise_ids)) != len(exercise_ids):
+            raise serializers.ValidationError("Each exercise may appear only once in logged_exercises.")
         return value
 
+    @transaction.atomic
+    def create(self, validated_data):
+        entries_data = validated_data.pop('exercise_entries', [])
+        daily_log = super().create(validated_data)
+        sync_exercise_entries(daily_log, entries_data)
+        return daily_log
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        entries_data = validated_data.pop('exercise_entries', None)
+        instance = super().update(instance, validated_data)
+        if entries_data is not None:
+            sync_exercise_entries(instance, entries_data)
+        return instance
+
     def validate_completion_percentage(self, value):
         if not (0 <= value <= 100):
             raise serializers.ValidationError("Completion percentage must be between 0 and 100.")
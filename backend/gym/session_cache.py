@@ -0,0 +1,121 @@
+#session_cache.py
+#
+# In-process cache of supervision session state, keyed by
+# (user id, date, original exercise id).
+#
+# A (re)connecting socket finds the resolved exercise entry, its parsed
+# target sets and the live rep state here instead of querying today's
+# DailyWorkoutLog, so a client that drops off gym Wi-Fi resumes mid-set.
+# Entries expire TTL_S after their last use. Editing a log through the REST
+# API invalidates every entry for that log. The cache lives in one worker
+# process; a reconnect that lands on another worker loads from the DB.
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .metrics import registry
+
+DEFAULTS = {
+    "TTL_S": 15 * 60,
+    "MAX_ENTRIES": 10000,
+}
+
+
+def session_cache_settings():
+    return {**DEFAULTS, **getattr(settings, "SUPERVISION_SESSION_CACHE", {})}
+
+
+class SupervisionSession:
+    __slots__ = ("daily_log_id", "exercise_entry", "exercise_name", "target_sets",
+                 "sets_completed", "stage", "rep_counter")
+
+    def __init__(self, daily_log_id, exercise_entry, target_sets, sets_completed):
+        self.daily_log_id = daily_log_id
+        self.exercise_entry = exercise_entry
+        self.exercise_name = exercise_entry.exercise_name
+        self.target_sets = target_sets
+        self.sets_completed = sets_completed
+        self.stage = None
+        self.rep_counter = 0
+
+
+class SessionStateCache:
+    def __init__(self, ttl_s=None, max_entries=None, clock=time.monotonic):
+        config = session_cache_settings()
+        self.ttl_s = ttl_s if ttl_s is not None else config["TTL_S"]
+        self.max_entries = max_entries if max_entries is not None else config["MAX_ENTRIES"]
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, session), least recently used first
+        self._keys_by_log = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = (now + self.ttl_s, entry[1])
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, session):
+        now = self.clock()
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (now + self.ttl_s, session)
+            self._keys_by_log.setdefault(session.daily_log_id, set()).add(key)
+            self._evict_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def touch(self, key):
+        """Pushes back the expiry of a session that is still in use."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (self.clock() + self.ttl_s, entry[1])
+                self._entries.move_to_end(key)
+
+    def invalidate_log(self, daily_log_id):
+        with self._lock:
+            for key in self._keys_by_log.pop(daily_log_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_log.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_log.get(entry[1].daily_log_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_log[entry[1].daily_log_id]
+
+    def _evict_expired(self, now):
+        # Entries are kept in last-use order and share one TTL, so expired ones sit at the front.
+        while self._entries:
+            key, (expires_at, _session) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._discard(key)
+
+
+session_cache = SessionStateCache()
+registry.callback_gauge("supervision_session_cache_entries", "Supervision sessions held in this process's cache.", lambda: len(session_cache))
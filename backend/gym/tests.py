@@ -1,3 +1,1262 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .admission import AdmissionController, DEFAULTS as ADMISSION_DEFAULTS, admission
+from .archive import PoseArchive, PoseArchiveWriter, repair
+from .exes import TRACKERS, evaluate_batch, find_tracker, normalize_exercise_name
+from .flow import DEFAULTS as FLOW_DEFAULTS, FrameFlowControl
+from .jsonpatch import PatchError, apply_patch
+from .kinematics import CAPACITY, STORED_FIELDS, RepKinematics
+from .layers import LOCAL_LAYER_SUPPORTED, LocalChannelLayer
+from .metrics import Histogram, stage_seconds
+from .offload import DEFAULTS as OFFLOAD_DEFAULTS, TrackerPool
+from .models import DailyWorkoutLog, Exercise, ExerciseLogEntry, PoseSessionRecording, TrainingRoutine, WeeklyScheduleItem, WorkoutPlan
+from .persistence import SetProgressBuffer, _flush_on_shutdown, set_progress
+from .protocol import BATCH_HEADER, FRAME_HEADER, POSE_SUBPROTOCOL, FrameDecodeError, decode_frame, decode_frames, encode_batch, encode_frame
+from .replay import (
+    AuthenticatedApplication,
+    PoseRecording,
+    recording_from_messages,
+    replay_consumer,
+    replay_tracker,
+    seed_supervision_session,
+    synthetic_curl,
+)
+from .routing import websocket_urlpatterns
+from .serializers import write_weekly_schedule
+from .session_cache import SessionStateCache, SupervisionSession, session_cache
+from .util import LANDMARK_FIELDS, NUM_LANDMARKS, calculate_angle, calculate_angles, joint_triplets
+
+
+class PoseRecordingTests(TestCase):
+    def test_save_and_load_round_trip(self):
+        recording = synthetic_curl(reps=2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = recording.save(Path(directory) / "curl.npz")
+            loaded = PoseRecording.load(path)
+        self.assertEqual(loaded.exercise_name, "curl_l")
+        self.assertEqual(loaded.frames.shape, recording.frames.shape)
+        self.assertTrue((loaded.frames == recording.frames).all())
+        self.assertTrue((loaded.timestamps_ms == recording.timestamps_ms).all())
+
+    def test_recording_from_logged_messages(self):
+        recording = synthetic_curl(reps=1)
+        landmarks = [[dict(zip(("x", "y", "z", "visibility"), lm)) for lm in frame.tolist()] for frame in recording.frames[:4]]
+        lines = [
+            json.dumps({"type": "pose_landmarks", "exercise_name": "curl_l", "landmarks": landmarks[0], "t": 0}),
+            json.dumps({"type": "get_stats"}),
+            json.dumps({"type": "pose_landmarks_batch", "frames": [{"t": 33 * i, "landmarks": lm} for i, lm in enumerate(landmarks[1:], 1)]}),
+        ]
+        parsed = recording_from_messages(lines)
+        self.assertEqual(parsed.exercise_name, "curl_l")
+        self.assertEqual(len(parsed), 4)
+        self.assertEqual(parsed.timestamps_ms.tolist(), [0, 33, 66, 99])
+
+
+class PoseArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "session.gspose"
+        self.recording = synthetic_curl(reps=3)
+
+    def write(self, close=True):
+        writer = PoseArchiveWriter(self.path, meta={"exercise_name": "curl_l", "daily_log_id": 7}, chunk_frames=64)
+        for offset in range(0, len(self.recording), 25):
+            writer.append(self.recording.frames[offset:offset + 25], self.recording.timestamps_ms[offset:offset + 25])
+        if close:
+            writer.close()
+        else:
+            writer._file.flush()  # as if the process died here
+        return writer
+
+    def test_round_trip_and_time_range(self):
+        self.write()
+        archive = PoseArchive(self.path)
+        self.assertTrue(archive.finalized)
+        self.assertEqual(archive.meta["daily_log_id"], 7)
+        self.assertEqual(len(archive), len(self.recording))
+        self.assertGreater(len(archive.index), 1)
+
+        start, end = self.recording.timestamps_ms[70], self.recording.timestamps_ms[150]
+        timestamps, frames = archive.read(start, end)
+        self.assertEqual(timestamps.tolist(), self.recording.timestamps_ms[70:150].tolist())
+        self.assertTrue((frames == self.recording.frames[70:150]).all())
+        # Inside one chunk the result is a view of the mapped file.
+        inside, _frames = archive.read(self.recording.timestamps_ms[1], self.recording.timestamps_ms[3])
+        self.assertFalse(inside.flags.owndata)
+
+    def test_unfinalized_archive_is_recovered_and_repaired(self):
+        writer = self.write(close=False)
+        archive = PoseArchive(self.path)
+        self.assertFalse(archive.finalized)
+        self.assertEqual(len(archive), writer.frame_count)
+        archive.close()
+        writer._file.close()
+        self.assertEqual(repair(self.path, {"exercise_name": "curl_l"}), writer.frame_count)
+        repaired = PoseArchive(self.path)
+        self.assertTrue(repaired.finalized)
+        self.assertEqual(repaired.to_recording().exercise_name, "curl_l")
+
+
+class CalculateAnglesTests(TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(7)
+
+    def legacy(self, frame, joints):
+        return [calculate_angle(frame[a, :2], frame[b, :2], frame[c, :2]) for a, b, c in joints]
+
+    def test_matches_the_legacy_angle_for_random_triplets(self):
+        frame = self.rng.uniform(-1, 1, (NUM_LANDMARKS, LANDMARK_FIELDS))
+        joints = self.rng.integers(0, NUM_LANDMARKS, (200, 3))
+        np.testing.assert_allclose(calculate_angles(frame, joints), self.legacy(frame, joints), atol=1e-9)
+
+    def test_differences_past_180_degrees_wrap(self):
+        frame = np.zeros((NUM_LANDMARKS, LANDMARK_FIELDS))
+        # Arms at 170 and -170 degrees: the raw heading difference is 340, the angle between them 20.
+        frame[0, :2] = np.cos(np.radians(170)), np.sin(np.radians(170))
+        frame[2, :2] = np.cos(np.radians(-170)), np.sin(np.radians(-170))
+        frame[3, :2] = -1, 0
+        frame[4, :2] = 1, 0  # 3-1-4 is a straight arm: exactly 180
+        joints = joint_triplets((0, 1, 2), (2, 1, 0), (3, 1, 2), (3, 1, 4))
+        angles = calculate_angles(frame, joints)
+        np.testing.assert_allclose(angles, [20, 20, 10, 180], atol=1e-9)
+        np.testing.assert_allclose(angles, self.legacy(frame, joints), atol=1e-9)
+
+    def test_batches_match_frame_by_frame(self):
+        frames = self.rng.uniform(0, 1, (50, NUM_LANDMARKS, LANDMARK_FIELDS)).astype(np.float32)
+        joints = joint_triplets((11, 13, 15), (12, 14, 16), (23, 25, 27), (24, 26, 28))
+        batched = calculate_angles(frames, joints)
+        self.assertEqual(batched.shape, (50, 4))
+        for frame, angles in zip(frames, batched):
+            np.testing.assert_array_equal(angles, calculate_angles(frame, joints))
+            np.testing.assert_allclose(angles, self.legacy(frame, joints), atol=1e-3)
+
+
+class PoseProtocolTests(TestCase):
+    def setUp(self):
+        self.recording = synthetic_curl(reps=1)
+
+    def test_frames_and_batches_round_trip(self):
+        timestamp_ms, frame = decode_frame(encode_frame(self.recording.frames[0], 12.5))
+        self.assertEqual(timestamp_ms, 12.5)
+        np.testing.assert_array_equal(frame, self.recording.frames[0])
+        timestamps, frames = decode_frames(encode_batch(self.recording.frames[:5], self.recording.timestamps_ms[:5]))
+        np.testing.assert_array_equal(timestamps, self.recording.timestamps_ms[:5])
+        np.testing.assert_array_equal(frames, self.recording.frames[:5])
+        timestamps, frames = decode_frames(encode_frame(self.recording.frames[0], 12.5))
+        self.assertEqual((timestamps.tolist(), frames.shape), ([12.5], (1, NUM_LANDMARKS, LANDMARK_FIELDS)))
+
+    def test_malformed_messages_are_rejected(self):
+        frame = encode_frame(self.recording.frames[0])
+        batch = encode_batch(self.recording.frames[:3], self.recording.timestamps_ms[:3])
+        cases = [
+            (decode_frames, frame[:2], "shorter than its header"),
+            (decode_frame, frame[:FRAME_HEADER.size - 1], "shorter than its header"),
+            (decode_frames, batch[:BATCH_HEADER.size - 1], "shorter than its header"),
+            (decode_frame, frame[:-4], "length does not match"),
+            (decode_frames, frame + b"\0" * 4, "length does not match"),
+            (decode_frames, batch[:-16], "length does not match"),
+            (decode_frames, batch + b"\0" * 16, "length does not match"),
+            (decode_frames, bytes([2]) + frame[1:], "Unsupported protocol version 2"),
+            (decode_frames, encode_frame(self.recording.frames[0, :17]), f"Expected {NUM_LANDMARKS} landmarks, got 17"),
+            (decode_frames, encode_batch(self.recording.frames[:2, :17], [0, 1]), f"Expected {NUM_LANDMARKS} landmarks, got 17"),
+            (decode_frames, frame[:1] + bytes([9]) + frame[2:], "Unknown binary message kind 9"),
+            (decode_frame, batch, "Expected a single frame, got message kind 2"),
+        ]
+        for decode, data, message in cases:
+            with self.subTest(decode=decode.__name__, message=message):
+                with self.assertRaisesMessage(FrameDecodeError, message):
+                    decode(data)
+
+
+class ReplayTrackerTests(TestCase):
+    def test_rep_count_does_not_depend_on_batch_size(self):
+        recording = synthetic_curl(reps=12)
+        for batch_size in (1, 7, 30, len(recording)):
+            with self.subTest(batch_size=batch_size):
+                report = replay_tracker(recording, TRACKERS["curl_l"], batch_size)
+                self.assertEqual(report["reps"], 12)
+                self.assertEqual(report["frames"], len(recording))
+
+
+class ExerciseIndexTests(TestCase):
+    def test_logged_names_resolve_to_trackers(self):
+        self.assertEqual(normalize_exercise_name("Sit-Ups"), "sit_up")
+        for logged, tracker in [
+            ("curl_l", "curl_l"), ("Bicep Curls", "curl_l"), ("Dumbbell Bicep Curl", "curl_l"),
+            ("Seated Dumbbell Shoulder Press", "shoulder_press"), ("Bodyweight Squats", "squat"),
+            ("sit ups", "sit_up"), ("Jumping Jacks", "jumping_jacks"), ("Dumbbell Lateral Raises", "lateral_raise"),
+        ]:
+            with self.subTest(logged=logged):
+                self.assertEqual(find_tracker(logged).name, tracker)
+        for logged in ("Deadlift", "Press", "", None):
+            with self.subTest(logged=logged):
+                self.assertIsNone(find_tracker(logged))
+
+
+class RepKinematicsTests(TestCase):
+    def summarise(self, recording, batch_size):
+        tracker = TRACKERS["curl_l"]
+        kinematics = RepKinematics(tracker.concentric)
+        stage, counter, summaries = None, 0, []
+        for offset in range(0, len(recording), batch_size):
+            result = tracker.run(recording.frames[offset:offset + batch_size], stage, counter)
+            stage, counter = result.stage, result.counter
+            summaries += kinematics.extend(recording.timestamps_ms[offset:offset + batch_size], result.angles, result.rep_frames)
+        return kinematics, summaries
+
+    def test_summaries_do_not_depend_on_batch_size(self):
+        recording = synthetic_curl(reps=6)
+        _kinematics, expected = self.summarise(recording, 1)
+        self.assertEqual(len(expected), 6)
+        for batch_size in (7, 30, len(recording)):
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(self.summarise(recording, batch_size)[1], expected)
+
+    def test_tempo_and_range_of_motion(self):
+        # Two seconds per rep, elbow swinging between about 25 and 175 degrees.
+        _kinematics, summaries = self.summarise(synthetic_curl(reps=6), 30)
+        for summary in summaries[1:]:
+            self.assertAlmostEqual(summary["eccentric_ms"] + summary["concentric_ms"], summary["duration_ms"], delta=1)
+            self.assertGreater(summary["rom"], 140)
+            self.assertLess(summary["peak_angle"], 30)
+            self.assertAlmostEqual(summary["eccentric_ms"], 600, delta=100)
+
+    def test_memory_is_bounded_by_the_ring_buffer(self):
+        kinematics, summaries = self.summarise(synthetic_curl(reps=40), 30)
+        self.assertEqual(len(summaries), 40)
+        self.assertEqual(kinematics.angles.shape, (CAPACITY,))
+        self.assertGreater(kinematics.samples, CAPACITY)
+
+
+class TrackerPoolTests(TestCase):
+    def test_interleaved_sockets_match_inline_evaluation(self):
+        recordings = [synthetic_curl(reps=reps, seed=reps) for reps in (3, 5, 8)]
+
+        async def socket(pool, recording):
+            stage, counter, reps = None, 0, 0
+            for offset in range(0, len(recording), 20):
+                result = await pool.run("curl_l", recording.frames[offset:offset + 20], stage, counter)
+                stage, counter, reps = result.stage, result.counter, reps + len(result.rep_frames)
+            return reps
+
+        async def run():
+            pool = TrackerPool({**OFFLOAD_DEFAULTS, "ENABLED": True, "WORKERS": 2})
+            try:
+                return await asyncio.gather(*(socket(pool, recording) for recording in recordings)), pool.jobs
+            finally:
+                pool.shutdown()
+
+        reps, jobs = async_to_sync(run)()
+        self.assertEqual(reps, [replay_tracker(recording, TRACKERS["curl_l"], 20)["reps"] for recording in recordings])
+        self.assertEqual(reps, [3, 5, 8])
+        # Sockets waiting at the same time share a job.
+        self.assertLess(jobs, sum(-(-len(recording) // 20) for recording in recordings))
+
+    def test_workers_do_not_import_django(self):
+        # What a spawned worker does: unpickle the initializer and job function, then call them.
+        script = (
+            "import pickle, sys\n"
+            "evaluate = pickle.loads(sys.stdin.buffer.read())\n"
+            "evaluate([])\n"
+            "print(sorted({name.split('.')[0] for name in sys.modules} & {'django', 'channels', 'rest_framework'}))\n"
+        )
+        worker = subprocess.run([sys.executable, "-c", script], input=pickle.dumps(evaluate_batch),
+                                capture_output=True, cwd=Path(__file__).resolve().parent.parent, check=True)
+        self.assertEqual(worker.stdout.decode().strip(), "[]")
+
+
+class ReplayConsumerTests(TestCase):
+    def setUp(self):
+        # Primary keys are reused after each test's rollback; don't resume another test's session.
+        session_cache.clear()
+        admission.reset()
+
+    def replay(self, recording, exercise_name="curl_l", **kwargs):
+        user, exercise_id = seed_supervision_session(exercise_name)
+        application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+        report = async_to_sync(replay_consumer)(recording, application, exercise_id, **kwargs)
+        return report, DailyWorkoutLog.objects.get(workout_plan__user=user)
+
+    def test_binary_batches_count_reps_and_persist_sets(self):
+        report, daily_log = self.replay(synthetic_curl(reps=12), batch_size=30)
+        self.assertEqual(report["reps"], 12)
+        self.assertEqual(report["sets"], 1)
+        self.assertEqual(daily_log.logged_exercises[0]["actual_sets_completed"], 1)
+        self.assertEqual(daily_log.logged_exercises[0]["completed_status"], "partial")
+        stored = daily_log.logged_exercises[0]["rep_kinematics"]
+        self.assertEqual(stored["fields"], list(STORED_FIELDS))
+        self.assertEqual(len(stored["reps"]), 12)
+
+    def test_stage_timings_are_recorded(self):
+        before = stage_seconds.count("tracker", "curl_l")
+        self.replay(synthetic_curl(reps=1), batch_size=30)
+        self.assertEqual(stage_seconds.count("tracker", "curl_l") - before, 3)
+
+    def test_sessions_are_archived_against_the_log_entry(self):
+        recording = synthetic_curl(reps=2)
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(SUPERVISION_ARCHIVE={"ENABLED": True, "DIRECTORY": directory, "CHUNK_FRAMES": 50}):
+                _report, daily_log = self.replay(recording, batch_size=30)
+            archived = PoseSessionRecording.objects.get(daily_log=daily_log)
+            self.assertEqual(archived.original_exercise_id, daily_log.logged_exercises[0]["original_exercise_id"])
+            self.assertEqual(archived.exercise_name, "curl_l")
+            self.assertEqual(archived.frame_count, len(recording))
+            timestamps, frames = archived.open().read()
+            self.assertTrue((frames == recording.frames).all())
+            self.assertTrue((timestamps == recording.timestamps_ms).all())
+
+    def test_json_frames_match_binary(self):
+        recording = synthetic_curl(reps=12)
+        outcomes = {}
+        for binary in (True, False):
+            user, exercise_id = seed_supervision_session("curl_l", username=f"binary_{binary}")
+            application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+            report = async_to_sync(replay_consumer)(recording, application, exercise_id, batch_size=10, binary=binary)
+            session = session_cache.get((user.id, timezone.now().date(), exercise_id))
+            entry = ExerciseLogEntry.objects.get(daily_log__workout_plan__user=user)
+            outcomes[binary] = (report["reps"], report["sets"], session.stage, session.rep_counter,
+                                entry.actual_sets_completed, entry.rep_kinematics["reps"])
+        self.assertEqual(outcomes[False], outcomes[True])
+        self.assertEqual(outcomes[True][:5], (12, 1, "down", 2, 1))
+
+    def test_tracker_is_bound_from_the_logged_exercise_name(self):
+        report, _daily_log = self.replay(synthetic_curl(reps=3), exercise_name="Dumbbell Bicep Curls", batch_size=30)
+        self.assertEqual(report["reps"], 3)
+
+    def test_unsupported_exercise_is_rejected_at_connect(self):
+        from channels.testing import WebsocketCommunicator
+
+        user, exercise_id = seed_supervision_session("Deadlift")
+        application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+
+        async def run():
+            communicator = WebsocketCommunicator(application, f"/ws/supervision/{exercise_id}/", subprotocols=[POSE_SUBPROTOCOL])
+            connected, _subprotocol = await communicator.connect()
+            messages = [json.loads(await communicator.receive_from()) for _ in range(2)]
+            closed = await communicator.receive_output()
+            await communicator.wait()
+            return connected, messages, closed
+
+        connected, messages, closed = async_to_sync(run)()
+        self.assertTrue(connected)
+        self.assertEqual(messages[1]["type"], "error")
+        self.assertIn("Deadlift", messages[1]["message"])
+        self.assertEqual(closed, {"type": "websocket.close", "code": 4422})
+
+
+    def test_the_rep_that_completes_a_set_is_reported_before_the_set(self):
+        from channels.testing import WebsocketCommunicator
+
+        async def updates(reps, username):
+            user, exercise_id = await sync_to_async(seed_supervision_session)("curl_l", username=username)
+            application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+            recording = synthetic_curl(reps=reps)
+            communicator = WebsocketCommunicator(application, f"/ws/supervision/{exercise_id}/", subprotocols=[POSE_SUBPROTOCOL])
+            await communicator.connect()
+            await communicator.send_to(bytes_data=encode_batch(recording.frames, recording.timestamps_ms))
+            await communicator.send_to(text_data=json.dumps({"type": "get_stats"}))
+            messages = []
+            while (message := json.loads(await communicator.receive_from(timeout=10)))["type"] != "stats":
+                if message["type"] in ("rep_update", "set_update"):
+                    messages.append(message)
+            await communicator.disconnect()
+            return [(m["type"], m.get("current_reps_this_set", m.get("sets_completed")), m.get("stage")) for m in messages]
+
+        self.assertEqual(async_to_sync(updates)(10, "full_set"), [("rep_update", 10, "up"), ("set_update", 1, None)])
+        self.assertEqual(async_to_sync(updates)(11, "set_and_one"), [("set_update", 1, None), ("rep_update", 1, "down")])
+
+    def test_binary_frames_need_the_subprotocol(self):
+        from channels.testing import WebsocketCommunicator
+
+        user, exercise_id = seed_supervision_session("curl_l")
+        application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+        recording = synthetic_curl(reps=1)
+
+        async def run():
+            communicator = WebsocketCommunicator(application, f"/ws/supervision/{exercise_id}/")
+            _connected, subprotocol = await communicator.connect()
+            for _ in range(2):  # connection_established, initial_state
+                await communicator.receive_from()
+            await communicator.send_to(bytes_data=encode_batch(recording.frames, recording.timestamps_ms))
+            reply = json.loads(await communicator.receive_from())
+            await communicator.send_to(text_data=json.dumps({"type": "get_stats"}))
+            stats = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return subprotocol, reply, stats
+
+        subprotocol, reply, stats = async_to_sync(run)()
+        self.assertIsNone(subprotocol)
+        self.assertEqual(reply, {"type": "error", "message": f"Binary frames require the '{POSE_SUBPROTOCOL}' subprotocol."})
+        self.assertEqual((stats["processed"], stats["reps_counted"]), (0, 0))
+
+    def test_malformed_json_frames_are_answered_not_fatal(self):
+        from channels.testing import WebsocketCommunicator
+
+        user, exercise_id = seed_supervision_session("curl_l")
+        application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+        malformed = [
+            {"type": "pose_landmarks", "landmarks": [1, 2]},
+            {"type": "pose_landmarks_batch", "frames": [1, 2]},
+            {"type": "pose_landmarks_batch", "frames": {"t": 1}},
+            {"type": "pose_landmarks_batch", "frames": [{"t": 1, "landmarks": [1, 2]}]},
+            {"type": "pose_landmarks_batch", "frames": [{"t": 2}]},
+        ]
+
+        async def run():
+            communicator = WebsocketCommunicator(application, f"/ws/supervision/{exercise_id}/")
+            await communicator.connect()
+            for _ in range(2):  # connection_established, initial_state
+                await communicator.receive_from()
+            replies = []
+            for message in malformed:
+                await communicator.send_to(text_data=json.dumps(message))
+                replies.append(json.loads(await communicator.receive_from()))
+            await communicator.send_to(text_data=json.dumps({"type": "get_stats"}))
+            stats = json.loads(await communicator.receive_from())
+            await communicator.disconnect()
+            return replies, stats
+
+        replies, stats = async_to_sync(run)()
+        self.assertEqual([reply["message"] for reply in replies], ["Malformed pose landmarks."] * len(malformed))
+        self.assertEqual(stats["type"], "stats")  # the socket is still up
+
+    def test_reconnects_resume_until_the_log_is_edited(self):
+        from channels.testing import WebsocketCommunicator
+
+        user, exercise_id = seed_supervision_session("curl_l")
+        application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+        recording = synthetic_curl(reps=3)
+        expected_stage = find_tracker("curl_l").run(recording.frames, None, 0, reps_per_set=10).stage
+        daily_log = DailyWorkoutLog.objects.get(workout_plan__user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        async def connect(frames=None):
+            communicator = WebsocketCommunicator(application, f"/ws/supervision/{exercise_id}/", subprotocols=[POSE_SUBPROTOCOL])
+            await communicator.connect()
+            await communicator.receive_from()  # connection_established
+            initial = json.loads(await communicator.receive_from())
+            stats = None
+            if frames is not None:
+                await communicator.send_to(bytes_data=encode_batch(frames.frames, frames.timestamps_ms))
+                await communicator.send_to(text_data=json.dumps({"type": "get_stats"}))
+                while (stats := json.loads(await communicator.receive_from(timeout=10)))["type"] != "stats":
+                    pass
+            await communicator.disconnect()
+            return initial, stats
+
+        first, stats = async_to_sync(connect)(recording)
+        self.assertFalse(first["resumed"])
+        self.assertEqual(stats["current_reps_this_set"], 3)
+
+        resumed, _stats = async_to_sync(connect)()
+        self.assertTrue(resumed["resumed"])
+        self.assertEqual(resumed["current_reps_this_set"], 3)
+        self.assertEqual(resumed["stage"], expected_stage)
+
+        logged = client.get(f"/api/daily-logs/{daily_log.pk}/").data["logged_exercises"]
+        logged[0].update(actual_sets_completed=2, completed_status="partial")
+        response = client.put(f"/api/daily-logs/{daily_log.pk}/", {"workout_plan": daily_log.workout_plan_id, "date": str(daily_log.date), "logged_exercises": logged}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        reloaded, _stats = async_to_sync(connect)()
+        self.assertFalse(reloaded["resumed"])
+        self.assertEqual(reloaded["current_sets_completed"], 2)
+        self.assertEqual(reloaded["current_reps_this_set"], 0)
+        self.assertIsNone(reloaded["stage"])
+
+    def test_sockets_over_the_per_user_limit_are_told_to_retry(self):
+        from channels.testing import WebsocketCommunicator
+
+        user, exercise_id = seed_supervision_session("curl_l")
+        application = AuthenticatedApplication(URLRouter(websocket_urlpatterns), user)
+        limit = admission.config["MAX_PER_USER"]
+
+        async def run():
+            communicators = [WebsocketCommunicator(application, f"/ws/supervision/{exercise_id}/") for _ in range(limit + 1)]
+            for communicator in communicators:
+                self.assertTrue((await communicator.connect())[0])
+            refused = communicators[-1]
+            message = json.loads(await refused.receive_from())
+            closed = await refused.receive_output()
+            await refused.wait()
+            open_sockets = admission.open_for(user.id)
+            for communicator in communicators[:-1]:
+                await communicator.disconnect()
+            return message, closed, open_sockets
+
+        message, closed, open_sockets = async_to_sync(run)()
+        self.assertEqual(message["code"], "server_busy")
+        self.assertEqual(message["reason"], "user_limit")
+        self.assertGreater(message["retry_after"], 0)
+        self.assertEqual(closed["code"], 4503)
+        self.assertEqual(open_sockets, limit)
+        self.assertEqual(admission.open_for(user.id), 0)
+
+
+class SessionStateCacheTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = SessionStateCache(ttl_s=60, max_entries=3, clock=lambda: self.now)
+
+    def session(self, daily_log_id):
+        return SupervisionSession(daily_log_id, ExerciseLogEntry(exercise_name="curl_l"), 3, 0)
+
+    def test_entries_expire_after_their_last_use(self):
+        self.cache.put("a", self.session(1))
+        self.cache.put("b", self.session(1))
+        self.now = 50
+        self.assertIsNotNone(self.cache.get("a"))  # used again: expires at 110
+        self.cache.touch("b")  # also expires at 110
+        self.now = 100
+        self.assertIsNotNone(self.cache.get("b"))
+        self.now = 110
+        self.assertIsNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("b"))
+        self.now = 170
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 2))
+
+    def test_least_recently_used_entry_is_evicted_first(self):
+        for key in "abc":
+            self.cache.put(key, self.session(1))
+        self.cache.get("a")
+        self.cache.put("d", self.session(2))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual([key for key in "acd" if self.cache.get(key)], ["a", "c", "d"])
+
+        self.cache.invalidate_log(1)  # the evicted entry must not linger in the per-log index
+        self.assertEqual(len(self.cache), 1)
+        self.assertIsNotNone(self.cache.get("d"))
+        self.assertEqual(self.cache._keys_by_log, {2: {"d"}})
+
+
+class SetProgressBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buffered", password="x")
+        self.log = DailyWorkoutLog.objects.create(workout_plan=WorkoutPlan.objects.create(user=self.user), date=timezone.now().date())
+        self.entry = ExerciseLogEntry.objects.create(daily_log=self.log, original_exercise_id=7, exercise_name="curl_l", target_sets="3")
+        self.buffer = SetProgressBuffer()
+
+    def stored(self):
+        self.entry.refresh_from_db()
+        return self.entry.actual_sets_completed, self.entry.completed_status
+
+    def test_counts_coalesce_and_reps_accumulate_until_flushed(self):
+        self.buffer.record(self.log.id, 7, 1)
+        self.buffer.record(self.log.id, 7, 2)
+        self.buffer.record_reps(self.log.id, 7, [[1.0]])
+        self.buffer.record_reps(self.log.id, 7, [[2.0]])
+        self.assertEqual(self.buffer.pending(self.log.id, 7), 2)
+        self.assertEqual(self.stored(), (0, "pending"))
+        self.assertEqual(self.buffer.flush_sync(), 1)
+        self.assertEqual(self.stored(), (2, "partial"))
+        self.assertEqual(self.entry.rep_kinematics["reps"], [[1.0], [2.0]])
+        self.assertEqual((self.buffer.pending_count(), self.buffer.flush_sync()), (0, 0))
+
+    def test_failed_flush_is_requeued_and_newer_counts_win(self):
+        self.buffer.record(self.log.id, 7, 1)
+        self.buffer.record_reps(self.log.id, 7, [[1.0]])
+        with mock.patch.object(SetProgressBuffer, "_write", side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush_sync()
+        self.buffer.record(self.log.id, 7, 3)  # arrived while the flush was failing
+        self.buffer.record_reps(self.log.id, 7, [[2.0]])
+        self.buffer.flush_sync()
+        self.assertEqual(self.stored(), (3, "full"))
+        self.assertEqual(self.entry.rep_kinematics["reps"], [[1.0], [2.0]])
+
+    def test_shutdown_drains_the_shared_buffer(self):
+        set_progress.record(self.log.id, 7, 2)
+        _flush_on_shutdown()
+        self.assertEqual(self.stored(), (2, "partial"))
+        set_progress.record(self.log.id, 7, 3)
+        with mock.patch.object(SetProgressBuffer, "_write", side_effect=RuntimeError("gone")):
+            _flush_on_shutdown()  # reports, never raises at exit
+        set_progress.flush_sync()
+
+    def test_rest_edits_drop_buffered_counts(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        set_progress.record(self.log.id, 7, 1)
+        set_progress.record_reps(self.log.id, 7, [[1.0]])
+        logged = client.get(f"/api/daily-logs/{self.log.pk}/").data["logged_exercises"]
+        logged[0].update(actual_sets_completed=3, completed_status="full")
+        client.patch(f"/api/daily-logs/{self.log.pk}/", {"logged_exercises": logged}, format="json")
+        self.assertIsNone(set_progress.pending(self.log.id, 7))
+        set_progress.flush_sync()
+        self.assertEqual(self.stored(), (3, "full"))
+        self.assertEqual(self.entry.rep_kinematics["reps"], [[1.0]])  # rep rows are still written
+
+        set_progress.record(self.log.id, 7, 1)
+        client.patch(f"/api/daily-logs/{self.log.pk}/exercises/7/",
+                     [{"op": "replace", "path": "/actual_sets_completed", "value": 2}], format="json")
+        set_progress.flush_sync()
+        self.assertEqual(self.stored(), (2, "partial"))
+
+
+class FrameFlowControlTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.flow = FrameFlowControl(dict(FLOW_DEFAULTS), clock=lambda: self.now)
+
+    def observe_at(self, now, client_timestamp_ms, frame_count=1):
+        self.now = now
+        return self.flow.observe(client_timestamp_ms, frame_count)
+
+    def test_frames_behind_the_lag_budget_are_dropped(self):
+        self.assertFalse(self.observe_at(0.0, 0))
+        self.assertFalse(self.observe_at(1.0, 1000))
+        self.assertFalse(self.observe_at(2.0, 1800))  # 200 ms behind: still within the budget
+        self.assertTrue(self.observe_at(3.0, 2700, frame_count=5))
+        self.assertFalse(self.observe_at(3.0, None))  # no timestamp: never dropped
+        self.assertEqual(self.flow.dropped, 5)
+        self.assertEqual(self.flow.lag_ms, 300.0)
+        self.assertEqual(self.flow.max_lag_ms, 300.0)
+
+    def test_baseline_follows_a_drifting_client_clock(self):
+        self.observe_at(0.0, 0)
+        self.assertTrue(self.observe_at(30.0, 29600))  # the client clock fell 400 ms behind
+        self.assertFalse(self.observe_at(60.0, 59600))  # a full window later that is the new baseline
+        self.assertEqual(self.flow.lag_ms, 0.0)
+
+    def test_target_rate_backs_off_and_recovers(self):
+        self.observe_at(0.0, 0)
+        self.assertIsNone(self.flow.retarget())  # within the control interval
+        self.observe_at(1.0, 500)
+        self.assertEqual(self.flow.retarget(), 22)
+        self.assertFalse(self.observe_at(2.0, 1850))  # no drop, but more than half the lag budget behind
+        self.assertEqual(self.flow.retarget(), 16)
+        self.now = 3.0  # nothing seen since the last interval: keeping up
+        self.assertEqual(self.flow.retarget(), 18)
+        for second in range(4, 10):
+            self.now = second
+            self.flow.retarget()
+        self.assertEqual(self.flow.target_fps, FLOW_DEFAULTS["MAX_FPS"])
+        self.now = 10.0
+        self.assertIsNone(self.flow.retarget())  # unchanged at the cap
+
+    def test_cpu_budget_caps_the_target_rate(self):
+        self.flow.record_processed(10, 0.25)  # 25 ms a frame: 20 fps fits in half a core
+        self.now = 1.0
+        self.assertEqual(self.flow.retarget(), 20)
+        self.flow.record_processed(10, 2.5)  # the average moves towards 250 ms a frame
+        self.now = 2.0
+        self.assertEqual(self.flow.retarget(), FLOW_DEFAULTS["MIN_FPS"])
+        self.assertEqual(self.flow.stats(), {"processed": 20, "dropped": 0, "lag_ms": 0.0, "max_lag_ms": 0.0, "target_fps": 10})
+
+
+class AdmissionControllerTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.controller = AdmissionController({
+            **ADMISSION_DEFAULTS, "MAX_PER_USER": 10, "MAX_PER_WORKER": 4,
+            "USER_CONNECT_RATE": 0.5, "USER_CONNECT_BURST": 2, "WORKER_CONNECT_RATE": 10.0, "WORKER_CONNECT_BURST": 3,
+        }, clock=lambda: self.now)
+
+    def test_reconnect_loop_is_rate_limited_per_user(self):
+        for _ in range(2):
+            self.assertIsNone(self.controller.admit(1))
+            self.controller.release(1)
+        refusal = self.controller.admit(1)
+        self.assertEqual(refusal.reason, "user_rate")
+        self.assertAlmostEqual(refusal.retry_after, 2.0)
+        self.assertIsNone(self.controller.admit(2))  # other users are unaffected
+        self.now += 2.0
+        self.assertIsNone(self.controller.admit(1))
+
+    def test_worker_limits(self):
+        for user_id in range(3):
+            self.assertIsNone(self.controller.admit(user_id))
+        self.assertEqual(self.controller.admit(3).reason, "worker_rate")
+        self.now += 1.0
+        self.assertIsNone(self.controller.admit(3))
+        self.assertEqual(self.controller.admit(4).reason, "worker_limit")
+        self.controller.release(0)
+        self.assertIsNone(self.controller.admit(4))
+        self.assertEqual(self.controller.open, 4)
+
+
+class HeatLevelTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.plan = WorkoutPlan.objects.create(user=User.objects.create_user("heat", password="x"))
+
+    def log(self, days_ago, completion):
+        return DailyWorkoutLog.objects.create(workout_plan=self.plan, date=self.today - timedelta(days=days_ago),
+                                              completion_percentage=completion)
+
+    def heat(self):
+        return WorkoutPlan.objects.values_list("heat_level", "heat_window_total").get(pk=self.plan.pk)
+
+    def test_log_changes_update_the_stored_heat(self):
+        self.log(10, 100)  # outside the window
+        old = self.log(3, 100)
+        today = self.log(0, 50)
+        self.assertEqual(self.heat(), (2, 150))
+        today.completion_percentage = 100
+        today.save()
+        self.assertEqual(self.heat(), (3, 200))
+        old.delete()
+        self.assertEqual(self.heat(), (1, 100))
+        # Loaded without its completion: the window is recomputed instead.
+        partial = DailyWorkoutLog.objects.only("id", "session_notes").get(pk=today.pk)
+        partial.completion_percentage = 80
+        partial.save()
+        self.assertEqual(self.heat(), (1, 80))
+
+    def test_reading_on_a_new_day_rolls_the_window(self):
+        self.log(0, 70)
+        self.log(6, 70)
+        self.assertEqual(self.heat(), (2, 140))
+        plan = WorkoutPlan.objects.get(pk=self.plan.pk)
+        with self.assertNumQueries(0):
+            plan.refresh_heat_level()
+        self.assertEqual(plan.refresh_heat_level(self.today + timedelta(days=1)), 1)
+        self.assertEqual(self.heat(), (1, 70))
+
+    def test_command_recomputes_every_plan(self):
+        other = WorkoutPlan.objects.create(user=User.objects.create_user("heat2", password="x"))
+        DailyWorkoutLog.objects.create(workout_plan=other, date=self.today, completion_percentage=100)
+        self.log(1, 100)
+        WorkoutPlan.objects.update(heat_level=9, heat_window_total=0, heat_window_end=None)
+        call_command("recompute_heat_levels", stdout=open(os.devnull, "w"))
+        self.assertEqual(self.heat(), (1, 100))
+        self.assertEqual(WorkoutPlan.objects.get(pk=other.pk).heat_level, 1)
+        tomorrow = (self.today + timedelta(days=6)).isoformat()
+        call_command("recompute_heat_levels", "--date", tomorrow, stdout=open(os.devnull, "w"))
+        self.assertEqual(self.heat(), (0, 0))
+
+    def test_workout_plan_endpoint_reports_stored_heat(self):
+        self.log(0, 100)
+        self.log(1, 100)
+        client = APIClient()
+        client.force_authenticate(self.plan.user)
+        with self.assertNumQueries(1):  # no heat query on the same day
+            response = client.get("/api/workout-plan/")
+        self.assertEqual(response.data["heat_level"], 3)
+
+
+class QueryBudgetTests(TestCase):
+    """Read endpoints load their whole object graph in a fixed number of queries."""
+
+    ROUTINES, DAYS, EXERCISES = 6, 5, 6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("budget", password="x")
+        other = User.objects.create_user("someone_else", password="x")
+        for owner, is_preset in [(cls.user, False)] * cls.ROUTINES + [(None, True)] * 2 + [(other, False)]:
+            routine = TrainingRoutine.objects.create(
+                user=owner, is_preset=is_preset, routine_id="r", routine_name="Routine", goal="g",
+                experience_level="any", training_split="split", days_per_week="5", description="d",
+            )
+            for day in range(cls.DAYS):
+                item = WeeklyScheduleItem.objects.create(routine=routine, day_of_week_or_number=f"Day {day + 1}", session_focus="f")
+                Exercise.objects.bulk_create(
+                    Exercise(schedule_item=item, exercise_name=f"Exercise {i}", sets="3", reps_or_duration="10", rest_period="60s")
+                    for i in range(cls.EXERCISES)
+                )
+        cls.routine = routine = TrainingRoutine.objects.filter(user=cls.user).first()
+        cls.plan = WorkoutPlan.objects.create(user=cls.user, current_routine=routine)
+        cls.plan.refresh_heat_level()
+        cls.log = DailyWorkoutLog.objects.create(workout_plan=cls.plan, date=timezone.now().date())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, budget):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_routine_list(self):
+        response = self.get("/api/routines/", 3)
+        routines = response.data["results"]
+        self.assertEqual(len(routines), self.ROUTINES + 2)
+        self.assertEqual(sum(len(day["exercises"]) for routine in routines for day in routine["weekly_schedule"]),
+                         (self.ROUTINES + 2) * self.DAYS * self.EXERCISES)
+
+    def test_routine_summary(self):
+        response = self.get("/api/routines/?view=summary", 1)
+        routine = response.data["results"][0]
+        self.assertNotIn("weekly_schedule", routine)
+        self.assertTrue(routine["is_preset"])
+        self.assertEqual((routine["day_count"], routine["exercise_count"]), (self.DAYS, self.DAYS * self.EXERCISES))
+
+    def test_routine_cursor_pages(self):
+        expected = [routine["id"] for routine in self.get("/api/routines/?view=summary", 1).data["results"]]
+        seen, url = [], "/api/routines/?view=summary&page_size=3"
+        while url:
+            page = self.get(url, 1).data
+            seen += [routine["id"] for routine in page["results"]]
+            url = page["next"]
+            # A routine created between pages lands before the cursor and never shifts the pages.
+            TrainingRoutine.objects.create(user=self.user, routine_id="new", routine_name="New", goal="g", experience_level="any",
+                                           training_split="s", days_per_week="1", description="d")
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get("/api/routines/?cursor=garbage").status_code, 404)
+
+    def test_routine_detail(self):
+        self.get(f"/api/routines/{self.routine.pk}/", 3)
+
+    def test_workout_plan(self):
+        response = self.get("/api/workout-plan/", 3)
+        self.assertEqual(len(response.data["current_routine_details"]["weekly_schedule"]), self.DAYS)
+
+    def test_daily_logs(self):
+        response = self.get(f"/api/daily-logs/{self.log.pk}/", 2)  # the log, then its exercise entries
+        self.assertEqual(response.data["username"], "budget")
+        with self.assertNumQueries(3):
+            response = self.client.post("/api/daily-logs/get-or-create-for-date/", {"date": self.log.date.isoformat()})
+        self.assertEqual(response.data["routine_name_from_plan"], "Routine")
+        self.get("/api/workout-contributions/", 1)
+
+    def test_profile(self):
+        self.get("/api/profile/", 4)  # lookup, then the first access inserts in a savepoint
+        self.get("/api/profile/", 1)
+
+
+class RoutineWriteTests(TestCase):
+    DAYS, EXERCISES = 7, 8
+
+    def setUp(self):
+        self.user = User.objects.create_user("writer", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, name="Big routine"):
+        return {
+            "routine_id": "big", "routine_name": name, "goal": "g", "experience_level": "any",
+            "training_split": "split", "days_per_week": str(self.DAYS), "description": "d",
+            "weekly_schedule": [
+                {"day_of_week_or_number": f"Day {day + 1}", "session_focus": "f", "exercises": [
+                    {"exercise_name": f"Exercise {day}.{i}", "target_muscles": ["legs"], "sets": "3",
+                     "reps_or_duration": "10", "rest_period": "60s"}
+                    for i in range(self.EXERCISES)
+                ]}
+                for day in range(self.DAYS)
+            ],
+        }
+
+    def exercise_names(self, routine_id):
+        return list(Exercise.objects.filter(schedule_item__routine_id=routine_id)
+                    .order_by("schedule_item_id", "id").values_list("schedule_item__day_of_week_or_number", "exercise_name"))
+
+    def test_create_replace_and_copy_are_batched(self):
+        # Insert the routine, its days and its exercises, then read the tree back for the response.
+        with self.assertNumQueries(8):
+            response = self.client.post("/api/routines/", self.payload(), format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        pk = response.data["id"]
+        self.assertEqual(len(response.data["weekly_schedule"][-1]["exercises"]), self.EXERCISES)
+        expected = self.exercise_names(pk)
+        self.assertEqual(len(expected), self.DAYS * self.EXERCISES)
+        self.assertEqual(expected[:2], [("Day 1", "Exercise 0.0"), ("Day 1", "Exercise 0.1")])
+
+        with self.assertNumQueries(15):  # without ids, every day and exercise is replaced
+            response = self.client.put(f"/api/routines/{pk}/", self.payload(), format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.exercise_names(pk), expected)
+
+        with self.assertNumQueries(11):
+            response = self.client.post(f"/api/routines/{pk}/copy/")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["routine_name"], "Big routine (Copy)")
+        self.assertEqual(self.exercise_names(response.data["id"]), expected)
+
+    def test_update_keeps_ids_and_writes_only_the_difference(self):
+        routine = self.client.post("/api/routines/", self.payload(), format="json").data
+        ids = {exercise["id"] for day in routine["weekly_schedule"] for exercise in day["exercises"]}
+        days = routine["weekly_schedule"]
+        days[0]["exercises"][0]["reps_or_duration"] = "12"
+
+        # Lookup and prefetch (3), the routine row, one UPDATE for the edited exercise, the reload (3).
+        with self.assertNumQueries(10):
+            response = self.client.put(f"/api/routines/{routine['id']}/", routine, format="json")
+        self.assertEqual(response.data["weekly_schedule"], days)
+
+        moved = days[1]["exercises"].pop()
+        removed = days[2]["exercises"].pop()
+        days[0]["exercises"].append(moved)
+        days[0]["exercises"].append({"exercise_name": "New", "target_muscles": [], "sets": "1", "reps_or_duration": "5", "rest_period": "30s"})
+        dropped_day = days.pop()
+        days.append({"day_of_week_or_number": "Day 8", "session_focus": "new", "exercises": dropped_day["exercises"][:1]})
+        response = self.client.put(f"/api/routines/{routine['id']}/", routine, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+        stored = {exercise.pk: exercise for exercise in Exercise.objects.filter(schedule_item__routine_id=routine["id"])}
+        self.assertEqual(stored[moved["id"]].schedule_item_id, days[0]["id"])
+        self.assertNotIn(removed["id"], stored)
+        self.assertEqual(stored[dropped_day["exercises"][0]["id"]].schedule_item.day_of_week_or_number, "Day 8")
+        self.assertEqual(set(stored) - ids, {max(stored)})  # only "New" got a fresh id
+        self.assertEqual(stored[days[0]["exercises"][0]["id"]].reps_or_duration, "12")
+        self.assertFalse(WeeklyScheduleItem.objects.filter(pk=dropped_day["id"]).exists())
+
+    def test_failed_write_leaves_nothing_behind(self):
+        with mock.patch.object(Exercise.objects, "bulk_create", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                self.client.post("/api/routines/", self.payload(), format="json")
+        self.assertFalse(TrainingRoutine.objects.exists())
+        self.assertFalse(WeeklyScheduleItem.objects.exists())
+
+
+class RoutineAdoptionTests(TestCase):
+    DAYS, EXERCISES = 3, 4
+
+    def setUp(self):
+        self.user = User.objects.create_user("adopter", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.preset = TrainingRoutine.objects.create(
+            is_preset=True, routine_id="p", routine_name="Preset", goal="g", experience_level="any",
+            training_split="split", days_per_week="3", description="d",
+        )
+        write_weekly_schedule(self.preset, [
+            {"day_of_week_or_number": f"Day {day + 1}", "session_focus": "f", "exercises": [
+                {"exercise_name": f"Exercise {day}.{i}", "target_muscles": ["legs"], "sets": "3",
+                 "reps_or_duration": "10", "rest_period": "60s"}
+                for i in range(self.EXERCISES)
+            ]}
+            for day in range(self.DAYS)
+        ])
+
+    def adopt(self):
+        response = self.client.post(f"/api/routines/{self.preset.pk}/copy/")
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_adopting_a_preset_inserts_one_row(self):
+        exercises = Exercise.objects.count()
+        # Lookup with the preset's tree (3), one INSERT, the reload through the preset (4).
+        with self.assertNumQueries(8):
+            routine = self.adopt()
+        self.assertEqual(Exercise.objects.count(), exercises)
+        self.assertEqual(routine["base_routine"], self.preset.pk)
+        preset = self.client.get(f"/api/routines/{self.preset.pk}/").data
+        self.assertEqual(routine["weekly_schedule"], preset["weekly_schedule"])
+
+        # A copy of the adopted routine shares the same preset.
+        copy = self.client.post(f"/api/routines/{routine['id']}/copy/").data
+        self.assertEqual(copy["base_routine"], self.preset.pk)
+        summary = self.client.get("/api/routines/?view=summary").data["results"]
+        self.assertEqual({(r["day_count"], r["exercise_count"]) for r in summary}, {(self.DAYS, self.DAYS * self.EXERCISES)})
+
+    def test_first_schedule_edit_materializes_a_private_copy(self):
+        routine = self.adopt()
+        routine["routine_name"] = "Mine"
+        response = self.client.put(f"/api/routines/{routine['id']}/", routine, format="json")
+        self.assertEqual(response.data["base_routine"], self.preset.pk)  # renamed, still shared
+        self.assertFalse(WeeklyScheduleItem.objects.filter(routine_id=routine["id"]).exists())
+
+        routine["weekly_schedule"][0]["exercises"][0]["sets"] = "5"
+        response = self.client.put(f"/api/routines/{routine['id']}/", routine, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIsNone(response.data["base_routine"])
+        self.assertEqual(Exercise.objects.filter(schedule_item__routine_id=routine["id"]).count(), self.DAYS * self.EXERCISES)
+        self.assertEqual(response.data["weekly_schedule"][0]["exercises"][0]["sets"], "5")
+        self.assertFalse(Exercise.objects.filter(schedule_item__routine=self.preset, sets="5").exists())
+
+    def test_preset_changes_leave_adopted_schedules_alone(self):
+        first, second = self.adopt(), self.adopt()
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_authenticate(staff)
+        preset = self.client.get(f"/api/routines/{self.preset.pk}/").data
+        preset["weekly_schedule"].pop()
+        response = self.client.put(f"/api/routines/{self.preset.pk}/", preset, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(TrainingRoutine.objects.filter(base_routine=self.preset).exists())
+        for routine in (first, second):
+            self.assertEqual(WeeklyScheduleItem.objects.filter(routine_id=routine["id"]).count(), self.DAYS)
+
+        third = self.adopt()
+        self.assertEqual(self.client.delete(f"/api/routines/{self.preset.pk}/").status_code, 204)
+        self.assertEqual(WeeklyScheduleItem.objects.filter(routine_id=third["id"]).count(), self.DAYS - 1)
+
+    def test_daily_log_lists_the_shared_exercises(self):
+        routine = self.adopt()
+        WorkoutPlan.objects.create(user=self.user, current_routine_id=routine["id"])
+        day = timezone.now().date()
+        day -= timedelta(days=day.weekday())  # a Monday: "Day 1"
+        response = self.client.post("/api/daily-logs/get-or-create-for-date/", {"date": day.isoformat()})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([e["original_exercise_id"] for e in response.data["logged_exercises"]],
+                         [e["id"] for e in routine["weekly_schedule"][0]["exercises"]])
+
+
+class ExerciseLogEntryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("logger", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        plan = WorkoutPlan.objects.create(user=self.user)
+        self.log = DailyWorkoutLog.objects.create(workout_plan=plan, date=timezone.now().date())
+        ExerciseLogEntry.objects.bulk_create(
+            ExerciseLogEntry(daily_log=self.log, position=i, original_exercise_id=100 + i, exercise_name=f"Exercise {i}",
+                             target_sets="3", rep_kinematics={"fields": ["t"], "reps": [[1]]} if i == 0 else None)
+            for i in range(4)
+        )
+
+    def test_api_keeps_the_nested_shape_and_writes_one_row_per_edit(self):
+        logged = self.client.get(f"/api/daily-logs/{self.log.pk}/").data["logged_exercises"]
+        self.assertEqual([item["original_exercise_id"] for item in logged], [100, 101, 102, 103])
+        self.assertEqual(logged[0]["rep_kinematics"], {"fields": ["t"], "reps": [[1]]})
+        self.assertNotIn("rep_kinematics", logged[1])
+
+        logged[2].update(actual_sets_completed=2, completed_status="partial", actual_reps_per_set=[10, 8], client_flag=True)
+        logged[0]["rep_kinematics"] = None  # server-owned; ignored
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f"/api/daily-logs/{self.log.pk}/", {"logged_exercises": logged}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        writes = [q["sql"] for q in queries if "gym_exerciselogentry" in q["sql"] and not q["sql"].startswith("SELECT")]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith("UPDATE"))
+        self.assertEqual(response.data["logged_exercises"][2]["client_flag"], True)
+        self.assertEqual(response.data["logged_exercises"][0]["rep_kinematics"], {"fields": ["t"], "reps": [[1]]})
+        entry = ExerciseLogEntry.objects.get(daily_log=self.log, original_exercise_id=102)
+        self.assertEqual((entry.actual_sets_completed, entry.actual_reps_per_set), (2, [10, 8]))
+
+        # Dropping an entry deletes its row; history is one aggregate query.
+        response = self.client.patch(f"/api/daily-logs/{self.log.pk}/", {"logged_exercises": logged[1:]}, format="json")
+        self.assertEqual(len(response.data["logged_exercises"]), 3)
+        total = ExerciseLogEntry.objects.filter(daily_log__workout_plan__user=self.user, exercise_name="Exercise 2").aggregate(
+            sets=Sum("actual_sets_completed"))
+        self.assertEqual(total["sets"], 2)
+
+    def test_invalid_entries_are_rejected(self):
+        url = f"/api/daily-logs/{self.log.pk}/"
+        item = {"original_exercise_id": 1, "exercise_name": "Squat", "target_sets": "3"}
+        self.assertEqual(self.client.patch(url, {"logged_exercises": [item, item]}, format="json").status_code, 400)
+        self.assertEqual(self.client.patch(url, {"logged_exercises": ["squat"]}, format="json").status_code, 400)
+        self.assertEqual(self.client.patch(url, {"logged_exercises": [{"exercise_name": "Squat"}]}, format="json").status_code, 400)
+        self.assertEqual(ExerciseLogEntry.objects.filter(daily_log=self.log).count(), 4)
+
+
+class ExerciseLogEntryMigrationTests(TransactionTestCase):
+    before = [("gym", "0010_trainingroutine_base_routine")]
+    after = [("gym", "0011_exerciselogentry")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def seed_log(self, apps, logged_exercises):
+        user = apps.get_model("auth", "User").objects.create(username=f"migrated{apps.get_model('gym', 'DailyWorkoutLog').objects.count()}")
+        plan = apps.get_model("gym", "WorkoutPlan").objects.create(user_id=user.id)
+        return apps.get_model("gym", "DailyWorkoutLog").objects.create(
+            workout_plan_id=plan.id, date=timezone.now().date(), logged_exercises=logged_exercises,
+        ).id
+
+    def test_entries_without_a_usable_id_survive_the_round_trip(self):
+        logged = [
+            {"original_exercise_id": 5, "exercise_name": "Squat", "target_sets": "3", "actual_sets_completed": 2},
+            {"original_exercise_id": 5, "exercise_name": "Squat again", "target_sets": "3"},
+            {"exercise_name": "Plank", "target_sets": "1", "actual_duration_seconds": 60},
+            {"original_exercise_id": "abc", "exercise_name": "Lunge", "target_sets": "2"},
+            {"original_exercise_id": -1, "exercise_name": "Curl", "target_sets": "2", "mood": "tired"},
+        ]
+        apps = self.migrate(self.before)
+        log_id = self.seed_log(apps, logged)
+
+        apps = self.migrate(self.after)
+        entries = list(apps.get_model("gym", "ExerciseLogEntry").objects.filter(daily_log_id=log_id).order_by("position"))
+        self.assertEqual([entry.exercise_name for entry in entries], ["Squat", "Squat again", "Plank", "Lunge", "Curl"])
+        self.assertEqual([entry.original_exercise_id for entry in entries],
+                         [5, 2_000_000_001, 2_000_000_002, 2_000_000_003, 2_000_000_004])
+        self.assertEqual(entries[1].extra, {"legacy_original_exercise_id": 5})
+        self.assertEqual(entries[4].extra, {"legacy_original_exercise_id": -1, "mood": "tired"})
+        self.assertEqual(entries[2].actual_duration_seconds, 60)
+
+        apps = self.migrate(self.before)
+        restored = apps.get_model("gym", "DailyWorkoutLog").objects.get(id=log_id).logged_exercises
+        self.assertEqual([item["original_exercise_id"] for item in restored], [5, 5, None, "abc", -1])
+        self.assertEqual(restored[4]["mood"], "tired")
+        self.assertNotIn("legacy_original_exercise_id", restored[1])
+
+    def test_logs_that_are_not_lists_of_objects_abort_the_migration(self):
+        apps = self.migrate(self.before)
+        log_id = self.seed_log(apps, [{"original_exercise_id": 1, "exercise_name": "Squat", "target_sets": "3"}, "Squat"])
+        with self.assertRaisesMessage(ValueError, f"DailyWorkoutLog {log_id}"):
+            self.migrate(self.after)
+        self.assertEqual(MigrationExecutor(connection).loader.applied_migrations.keys() & set(self.after), set())
+        apps.get_model("gym", "DailyWorkoutLog").objects.filter(id=log_id).update(logged_exercises=[])
+
+
+class DailyLogExercisePatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ticker", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.plan = WorkoutPlan.objects.create(user=self.user)
+        self.plan.refresh_heat_level()
+        self.log = DailyWorkoutLog.objects.create(workout_plan=self.plan, date=timezone.now().date())
+        ExerciseLogEntry.objects.bulk_create(
+            ExerciseLogEntry(daily_log=self.log, position=i, original_exercise_id=100 + i, exercise_name=f"Exercise {i}",
+                             target_sets=target)
+            for i, target in enumerate(["3", "2-3", "4"])
+        )
+        self.url = f"/api/daily-logs/{self.log.pk}/exercises/101/"
+
+    def patch(self, operations, url=None):
+        return self.client.generic("PATCH", url or self.url, json.dumps(operations), content_type="application/json-patch+json")
+
+    def test_ticking_a_set_writes_one_row_and_recomputes_completion(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch([
+                {"op": "test", "path": "/actual_sets_completed", "value": 0},
+                {"op": "replace", "path": "/actual_sets_completed", "value": 1},
+                {"op": "add", "path": "/actual_reps_per_set/-", "value": 12},
+                {"op": "add", "path": "/weight_used_per_set/-", "value": "20kg"},
+            ])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(set(response.data), {"exercise", "completion_percentage"})
+        exercise = response.data["exercise"]
+        self.assertEqual((exercise["actual_sets_completed"], exercise["completed_status"]), (1, "partial"))
+        self.assertEqual(exercise["actual_reps_per_set"], [12])
+        entry_writes = [q["sql"] for q in queries if q["sql"].startswith("UPDATE \"gym_exerciselogentry\"")]
+        self.assertEqual(len(entry_writes), 1)
+
+        # 1 of 2 target sets on one of three exercises: 50 / 3, rounded.
+        self.assertEqual(response.data["completion_percentage"], 17)
+        self.log.refresh_from_db()
+        self.assertEqual(self.log.completion_percentage, 17)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.heat_window_total, 17)
+
+        response = self.patch([{"op": "replace", "path": "/completed_status", "value": "full"}])
+        self.assertEqual(response.data["completion_percentage"], 33)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.heat_window_total, 33)
+
+    def test_rejected_patches_change_nothing(self):
+        for operations in (
+            [{"op": "test", "path": "/actual_sets_completed", "value": 5}],
+            [{"op": "replace", "path": "/original_exercise_id", "value": 7}],
+            [{"op": "remove", "path": "/exercise_name"}],
+            [{"op": "replace", "path": "/actual_reps_per_set/3", "value": 1}],
+            [{"op": "replace", "path": "/actual_reps_per_set/²", "value": 1}],
+            [{"op": "add", "path": "/actual_reps_per_set/٣", "value": 1}],
+            [{"op": "remove", "path": "/actual_reps_per_set/01"}],
+            [{"op": "frobnicate", "path": "/notes"}],
+            [{"op": "move", "from": "/notes_from_routine"}],
+            [{"op": "move", "from": 7, "path": "/notes_from_routine"}],
+            [{"op": "copy", "from": None, "path": "/x"}],
+            [{"op": "remove"}],
+            [{"op": "replace", "path": "actual_sets_completed", "value": 1}],
+            {"op": "replace", "path": "/actual_sets_completed", "value": 1},
+        ):
+            self.assertEqual(self.patch(operations).status_code, 400, operations)
+        self.assertEqual(self.patch([], url=f"/api/daily-logs/{self.log.pk}/exercises/999/").status_code, 404)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user("other", password="x"))
+        self.assertEqual(other.patch(self.url, [], format="json").status_code, 404)
+        entry = ExerciseLogEntry.objects.get(daily_log=self.log, original_exercise_id=101)
+        self.assertEqual((entry.actual_sets_completed, entry.exercise_name), (0, "Exercise 1"))
+
+    def test_apply_patch(self):
+        document = {"a/b": [1, 2], "c": {"d": "x"}}
+        patched = apply_patch(document, [
+            {"op": "add", "path": "/a~1b/0", "value": 0},
+            {"op": "move", "from": "/c/d", "path": "/e"},
+            {"op": "copy", "from": "/a~1b", "path": "/f"},
+            {"op": "remove", "path": "/a~1b/2"},
+        ])
+        self.assertEqual(patched, {"a/b": [0, 1], "c": {}, "e": "x", "f": [0, 1, 2]})
+        self.assertEqual(document, {"a/b": [1, 2], "c": {"d": "x"}})
+        with self.assertRaises(PatchError):
+            apply_patch(document, [{"op": "add", "path": "/a~1b/01", "value": 0}])
+
+
+@unittest.skipUnless(LOCAL_LAYER_SUPPORTED, "the local channel hub needs Unix sockets and fcntl")
+class LocalChannelLayerTests(TestCase):
+    """Two layer instances on one socket stand in for two worker processes."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, "hub.sock")
+
+    def test_group_send_reaches_a_channel_on_another_layer(self):
+        async def run():
+            worker_a, worker_b = LocalChannelLayer(self.path), LocalChannelLayer(self.path)
+            channel = await worker_a.new_channel()
+            await worker_a.group_add("supervision_1_2", channel)
+            # The hub handles each connection's ops in order, so once the
+            # barrier arrives the group_add has been applied.
+            await worker_a.send("barrier", {"type": "barrier"})
+            await worker_b.receive("barrier")
+            await worker_b.group_send("supervision_1_2", {"type": "rep.update", "reps": 3})
+            await worker_b.group_send("supervision_1_2", {"type": "rep.update", "reps": 4})
+            received = [await asyncio.wait_for(worker_a.receive(channel), 5) for _ in range(2)]
+            await worker_a.close()
+            await worker_b.close()
+            return received
+
+        received = async_to_sync(run)()
+        self.assertEqual([message["reps"] for message in received], [3, 4])
+
+    def test_plain_channel_is_received_once(self):
+        async def run():
+            worker_a, worker_b = LocalChannelLayer(self.path), LocalChannelLayer(self.path)
+            await worker_a.send("jobs", {"type": "job", "payload": b"\x00\x01"})
+            message = await asyncio.wait_for(worker_b.receive("jobs"), 5)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(worker_a.receive("jobs"), 0.2)
+            await worker_a.close()
+            await worker_b.close()
+            return message
+
+        self.assertEqual(async_to_sync(run)()["payload"], b"\x00\x01")
+
+
+class MetricsTests(TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("test_seconds", "Test.", ("exercise",), buckets=(0.001, 0.01))
+        for value in (0.0005, 0.005, 0.005, 2.0):
+            histogram.observe(value, "squat")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{exercise="squat",le="0.001"} 1', lines)
+        self.assertIn('test_seconds_bucket{exercise="squat",le="0.01"} 3', lines)
+        self.assertIn('test_seconds_bucket{exercise="squat",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{exercise="squat"} 4', lines)
+
+    def test_endpoint_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("lifter", password="x"))
+        self.assertEqual(client.get("/api/metrics/").status_code, 403)
+        client.force_authenticate(User.objects.create_superuser("admin", password="x"))
+        response = client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn(b"# TYPE supervision_stage_seconds histogram", response.content)
@@ -1,6 +1,6 @@
 from django.urls import path
 from . import views 
-from .views import UserCreateView, UserProfileCreateView, UserProfileDetailView, TrainingRoutineListCreateView, TrainingRoutineDetailView,GenerateWorkoutView,UserWorkoutPlanView , DailyLogGetOrCreateView, DailyLogDetailView,WorkoutContributionView
+from .views import UserCreateView, UserProfileCreateView, UserProfileDetailView, TrainingRoutineListCreateView, TrainingRoutineDetailView,TrainingRoutineCopyView,GenerateWorkoutView,UserWorkoutPlanView , DailyLogGetOrCreateView, DailyLogDetailView,DailyLogExerciseView,WorkoutContributionView,MetricsView
 
 urlpatterns = [
     path('register/', UserCreateView.as_view(), name='user-register'),
@@ -9,10 +9,13 @@ urlpatterns = [
 
     path('routines/', TrainingRoutineListCreateView.as_view(), name='routine-list-create'),
     path('routines/<int:pk>/', TrainingRoutineDetailView.as_view(), name='routine-detail'),
+    path('routines/<int:pk>/copy/', TrainingRoutineCopyView.as_view(), name='routine-copy'),
     path('generate-workout/', GenerateWorkoutView.as_view(), name='generate-workout'),
     path('workout-plan/', UserWorkoutPlanView.as_view(), name='user-workout-plan'),
     path('daily-logs/get-or-create-for-date/', DailyLogGetOrCreateView.as_view(), name='daily-log-get-or-create'),
     path('daily-logs/<int:pk>/', DailyLogDetailView.as_view(), name='daily-log-detail'),
+    path('daily-logs/<int:pk>/exercises/<int:original_exercise_id>/', DailyLogExerciseView.as_view(), name='daily-log-exercise'),
     path('workout-contributions/', WorkoutContributionView.as_view(), name='workout-contributions'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
@@ -1,14 +1,99 @@
 #util.py
 
+import re
+from itertools import chain
+
 import numpy as np
 
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = 4  # x, y, z, visibility
+
 
 def calculate_angle(a, b, c):
-    a = np.array(a) 
+    a = np.array(a)
     b = np.array(b)
     c = np.array(c)
     radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
     angle = np.abs(radians * 180.0 / np.pi)
     if angle > 180.0:
         angle = 360 - angle
-    return angle
\ No newline at end of file
+    return angle
+
+
+def landmarks_to_array(landmarks):
+    """
+    Packs one frame of pose landmarks into a contiguous (33, 4) float32 array
+    of x, y, z, visibility. Accepts the dicts sent by the frontend, MediaPipe
+    landmark objects, or an array that is already in that layout.
+    """
+    if isinstance(landmarks, np.ndarray):
+        return np.ascontiguousarray(landmarks, dtype=np.float32).reshape(-1, LANDMARK_FIELDS)
+
+    count = len(landmarks)
+    if count and isinstance(landmarks[0], dict):
+        values = chain.from_iterable(
+            (lm['x'], lm['y'], lm.get('z', 0.0), lm.get('visibility', 0.0)) for lm in landmarks
+        )
+    else:
+        values = chain.from_iterable(
+            (lm.x, lm.y, getattr(lm, 'z', 0.0), getattr(lm, 'visibility', 0.0)) for lm in landmarks
+        )
+    return np.fromiter(values, dtype=np.float32, count=count * LANDMARK_FIELDS).reshape(count, LANDMARK_FIELDS)
+
+
+def joint_triplets(*triplets):
+    """Builds the (k, 3) index array that calculate_angles expects."""
+    return np.array(triplets, dtype=np.intp).reshape(-1, 3)
+
+
+def calculate_angles(frames, joints):
+    """
+    Vectorized calculate_angle. `frames` is a (33, 4) landmark array or a
+    (n, 33, 4) stack of them, `joints` a (k, 3) array of landmark indices
+    (first point, vertex, last point). Returns the k angles in degrees for
+    every frame, shape (k,) or (n, k).
+    """
+    points = frames[..., joints, :2]
+    # Both arms of every angle share the vertex, so one arctan2 call covers them.
+    vectors = points[..., ::2, :] - points[..., 1:2, :]
+    headings = np.arctan2(vectors[..., 1], vectors[..., 0])
+    angles = np.abs(np.degrees(headings[..., 1] - headings[..., 0]))
+    return np.minimum(angles, 360.0 - angles)
+
+
+def parse_target_sets(target_sets):
+    """ "3" -> 3, "3-4" -> 4; anything unparseable counts as one set. """
+    try:
+        return int(str(target_sets).split('-')[-1])
+    except ValueError:
+        return 1
+
+
+def completion_status(sets_completed, target_sets):
+    if sets_completed >= parse_target_sets(target_sets):
+        return "full"
+    if sets_completed > 0:
+        return "partial"
+    return "pending"
+
+
+def completion_percentage(entries, current=0):
+    """
+    A day's completion from its (completed_status, actual_sets_completed,
+    target_sets) entries, the way the log page computes it: "full" counts
+    100, "partial" its share of the target sets (the first number of a
+    range), anything else 0, averaged and rounded half up. A day without
+    exercises stays at 100 if it was already marked done.
+    """
+    entries = list(entries)
+    if not entries:
+        return 100 if current == 100 else 0
+    total = 0.0
+    for status, sets_completed, target_sets in entries:
+        if status == "full":
+            total += 100
+        elif status == "partial":
+            match = re.match(r"\s*(\d+)", str(target_sets))
+            target = int(match.group(1)) if match and int(match.group(1)) else 1
+            total += min(100.0, sets_completed / target * 100)
+    return int(total / len(entries) + 0.5)
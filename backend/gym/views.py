@@ -1,18 +1,25 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from django.contrib.auth.models import User
-from .models import UserProfile, TrainingRoutine, WeeklyScheduleItem, Exercise,WorkoutPlan,DailyWorkoutLog
-from .serializers import UserSerializer,UserProfileSerializer,TrainingRoutineSerializer,WorkoutPlanSerializer,DailyWorkoutLogSerializer
+from .models import UserProfile, TrainingRoutine, WorkoutPlan,DailyWorkoutLog,ExerciseLogEntry
+from .serializers import UserSerializer,UserProfileSerializer,TrainingRoutineSerializer,TrainingRoutineSummarySerializer,WorkoutPlanSerializer,DailyWorkoutLogSerializer,ExerciseLogEntrySerializer,write_weekly_schedule,schedule_data,release_adoptions,update_exercise_entry
+from .jsonpatch import PatchError, apply_patch, patched_paths
+from .util import completion_percentage, completion_status
+from .pagination import RoutineCursorPagination
+from .session_cache import session_cache
+from .persistence import set_progress
+from .metrics import registry as metrics_registry
+from django.http import HttpResponse
 from rest_framework.exceptions import ValidationError
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
 from rest_framework.exceptions import PermissionDenied
-from rest_framework.decorators import action
 import time
 import os
 import json
 from rest_framework.views import APIView
-from google import genai
-from google.generativeai import types as GenAITypes
+from rest_framework.parsers import JSONParser
+from django.shortcuts import get_object_or_404
 from pydantic import BaseModel, Field, ValidationError as PydanticValidationError
 from typing import List, Optional
 from dotenv import load_dotenv
@@ -41,7 +48,7 @@ class UserProfileDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        profile, created = UserProfile.objects.get_or_create(user=self.request.user)
+        profile, created = UserProfile.objects.select_related('user').get_or_create(user=self.request.user)
         if created:
             print(f"Profile created on first access for user {self.request.user.username}")
         return profile
@@ -49,15 +56,50 @@ class UserProfileDetailView(generics.RetrieveUpdateAPIView):
 
 ##############################################################################################
 
+# Everything TrainingRoutineSerializer reads, in three queries however many
+# routines, days and exercises there are (two more when some of them share
+# an adopted preset's schedule).
+ROUTINE_TREE = ('weekly_schedule__exercises', 'base_routine__weekly_schedule__exercises')
+
+
+def routine_tree(queryset):
+    return queryset.select_related('user', 'base_routine').prefetch_related(*ROUTINE_TREE)
+
+
+def reload_routine_tree(serializer):
+    """Points a saved serializer at a freshly prefetched copy so the response doesn't query per day."""
+    serializer.instance = routine_tree(TrainingRoutine.objects.filter(pk=serializer.instance.pk)).get()
+
+
 class TrainingRoutineListCreateView(generics.ListCreateAPIView):
+    """
+    GET pages through the routines (presets first, newest first) with a
+    cursor: {"next": url or null, "results": [...]}. ?view=summary returns
+    only the top-level fields with day and exercise counts; the full tree is
+    what /routines/<pk>/ is for.
+    """
     serializer_class = TrainingRoutineSerializer
+    pagination_class = RoutineCursorPagination
 
+    def summary_requested(self):
+        return self.request.method == 'GET' and self.request.query_params.get('view') == 'summary'
+
+    def get_serializer_class(self):
+        return TrainingRoutineSummarySerializer if self.summary_requested() else TrainingRoutineSerializer
 
     def get_queryset(self):
         user = self.request.user
-        return TrainingRoutine.objects.filter(
+        routines = TrainingRoutine.objects.filter(
             Q(is_preset=True) | Q(user=user)
-        ).distinct().order_by('-is_preset', '-created_at') 
+        ).distinct().order_by('-is_preset', '-created_at')
+        if self.summary_requested():
+            # A routine has its own schedule or shares its base routine's, never both.
+            return routines.select_related('user').annotate(
+                day_count=Count('weekly_schedule', distinct=True) + Count('base_routine__weekly_schedule', distinct=True),
+                exercise_count=Count('weekly_schedule__exercises', distinct=True)
+                + Count('base_routine__weekly_schedule__exercises', distinct=True),
+            )
+        return routine_tree(routines)
 
     def get_permissions(self):
         if self.request.method == 'POST':
@@ -77,6 +119,7 @@ class TrainingRoutineListCreateView(generics.ListCreateAPIView):
         else:
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("Authentication required or invalid preset creation attempt.")
+        reload_routine_tree(serializer)
 
 class TrainingRoutineDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = TrainingRoutineSerializer
@@ -84,27 +127,39 @@ class TrainingRoutineDetailView(generics.RetrieveUpdateDestroyAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return TrainingRoutine.objects.filter(
+        return routine_tree(TrainingRoutine.objects.filter(
             Q(is_preset=True) | Q(user=user)
-        ).distinct()
+        ).distinct())
 
     def perform_update(self, serializer):
         instance = serializer.instance
         if instance.is_preset and not self.request.user.is_staff:
             raise PermissionDenied("You do not have permission to edit preset routines.")
-        serializer.save() 
+        serializer.save()
+        reload_routine_tree(serializer)
 
     def perform_destroy(self, instance):
         if instance.is_preset and not self.request.user.is_staff:
             raise PermissionDenied("You do not have permission to delete preset routines.")
-        instance.delete()
+        with transaction.atomic():
+            release_adoptions(instance)
+            instance.delete()
 
-    @action(detail=True, methods=['post'], url_path='copy', permission_classes=[permissions.IsAuthenticated])
-    def copy_routine(self, request, pk=None):
-        original_routine = self.get_object() 
 
-        if not original_routine:
-            return Response({"detail": "Routine not found."}, status=status.HTTP_404_NOT_FOUND)
+class TrainingRoutineCopyView(TrainingRoutineDetailView):
+    """
+    POST /routines/<pk>/copy/: a private, editable copy of a preset or own
+    routine. Copying a preset, or a routine still sharing one, adopts it:
+    one new row that shares the preset's schedule until it is edited.
+    """
+    http_method_names = ['post', 'options']
+
+    def post(self, request, *args, **kwargs):
+        original_routine = self.get_object()  # with its days and exercises prefetched
+        if original_routine.is_preset:
+            base_routine = original_routine
+        else:
+            base_routine = original_routine.base_routine  # None once it has its own schedule
 
         new_routine_data = {
             "user": request.user,
@@ -119,29 +174,19 @@ class TrainingRoutineDetailView(generics.RetrieveUpdateDestroyAPIView):
             "cardio_guidelines": original_routine.cardio_guidelines,
             "flexibility_guidelines": original_routine.flexibility_guidelines,
             "precautions": original_routine.precautions,
-            "coach_response": "Copied from preset. Adjust as needed."
+            "coach_response": "Copied from preset. Adjust as needed.",
+            "base_routine": base_routine,
         }
 
-        new_routine = TrainingRoutine.objects.create(**new_routine_data)
-
-        for original_schedule_item in original_routine.weekly_schedule.all():
-            new_schedule_item = WeeklyScheduleItem.objects.create(
-                routine=new_routine,
-                day_of_week_or_number=original_schedule_item.day_of_week_or_number,
-                session_focus=original_schedule_item.session_focus
-            )
-            for original_exercise in original_schedule_item.exercises.all():
-                Exercise.objects.create(
-                    schedule_item=new_schedule_item,
-                    exercise_name=original_exercise.exercise_name,
-                    target_muscles=original_exercise.target_muscles,
-                    sets=original_exercise.sets,
-                    reps_or_duration=original_exercise.reps_or_duration,
-                    rest_period=original_exercise.rest_period,
-                    notes=original_exercise.notes
-                )
+        if base_routine is not None:
+            new_routine = TrainingRoutine.objects.create(**new_routine_data)
+        else:
+            with transaction.atomic():
+                new_routine = TrainingRoutine.objects.create(**new_routine_data)
+                write_weekly_schedule(new_routine, schedule_data(original_routine))
 
         serializer = self.get_serializer(new_routine)
+        reload_routine_tree(serializer)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
 #############################################################################
@@ -175,21 +220,30 @@ class GeminiTrainingRoutine(BaseModel):
     coach_response: str = Field(..., description="AI's response/reasoning based on the prompt.")
 
 # --- Gemini Configuration ---
-load_dotenv()
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "YOUR_API_KEY_HERE_IF_NOT_IN_ENV")
-genai_client = None
+# The SDK is slow to import and only this view needs it, so the client is
+# built on the first generate request instead of when the URLconf loads.
+_genai_client = None
 
-try:
-    genai_client = genai.Client(api_key=GEMINI_API_KEY)
-except Exception as e:
-    print(f"Error initializing Gemini Client: {e}")
-    genai_client = None
+
+def get_genai_client():
+    global _genai_client
+    if _genai_client is None:
+        load_dotenv()
+        api_key = os.environ.get("GEMINI_API_KEY", "YOUR_API_KEY_HERE_IF_NOT_IN_ENV")
+        try:
+            from google import genai
+            _genai_client = genai.Client(api_key=api_key)
+        except Exception as e:
+            print(f"Error initializing Gemini Client: {e}")
+            return None
+    return _genai_client
 
 
 class GenerateWorkoutView(APIView):
     permission_classes = [permissions.IsAuthenticated] 
 
     def post(self, request, *args, **kwargs):
+        genai_client = get_genai_client()
         if not genai_client:
             return Response(
                 {"error": "Gemini AI client not initialized. Check API key and server logs."},
@@ -274,9 +328,13 @@ class UserWorkoutPlanView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        plan, created = WorkoutPlan.objects.get_or_create(user=self.request.user)
+        plan, created = WorkoutPlan.objects.select_related(
+            'user', 'current_routine__user', 'current_routine__base_routine').prefetch_related(
+            *(f'current_routine__{path}' for path in ROUTINE_TREE)
+        ).get_or_create(user=self.request.user)
         if created:
             print(f"WorkoutPlan created for user: {self.request.user.username}")
+        plan.refresh_heat_level()  # no query unless the day has rolled over
         return plan
     
 #############################################
@@ -295,28 +353,38 @@ class DailyLogGetOrCreateView(APIView):
 
         user = request.user
         try:
-            workout_plan = WorkoutPlan.objects.get(user=user)
+            workout_plan = WorkoutPlan.objects.select_related('user', 'current_routine__base_routine').get(user=user)
         except WorkoutPlan.DoesNotExist:
             return Response({"error": "User has no active workout plan."}, status=status.HTTP_404_NOT_FOUND)
 
         if not workout_plan.current_routine:
             return Response({"error": "No routine selected in the current workout plan."}, status=status.HTTP_400_BAD_REQUEST)
 
-        daily_log, created = DailyWorkoutLog.objects.get_or_create(
-            workout_plan=workout_plan,
-            date=log_date,
-            defaults={
-                'routine_used': workout_plan.current_routine,
-                'routine_log_name': workout_plan.current_routine.routine_name,
-                'logged_exercises': self.get_exercises_for_day(workout_plan.current_routine, log_date),
-                'completion_percentage': 0 
-            }
-        )
+        existing = DailyWorkoutLog.objects.prefetch_related('exercise_entries').filter(workout_plan=workout_plan, date=log_date)
+        daily_log = existing.first()
+        created = daily_log is None
+        if created:
+            try:
+                with transaction.atomic():
+                    daily_log = DailyWorkoutLog.objects.create(
+                        workout_plan=workout_plan,
+                        date=log_date,
+                        routine_used=workout_plan.current_routine,
+                        routine_log_name=workout_plan.current_routine.routine_name,
+                        completion_percentage=0,
+                    )
+                    # The schedule is only queried when the log is created.
+                    ExerciseLogEntry.objects.bulk_create(
+                        ExerciseLogEntry(daily_log=daily_log, position=position, **exercise)
+                        for position, exercise in enumerate(self.get_exercises_for_day(workout_plan.current_routine, log_date))
+                    )
+            except IntegrityError:  # a concurrent request created it first
+                daily_log, created = existing.get(), False
 
         if created:
             print(f"Created new DailyWorkoutLog for {user.username} on {log_date}")
         else:
-            pass
+            daily_log.workout_plan = workout_plan  # already loaded, with its user and routine
 
 
         serializer = DailyWorkoutLogSerializer(daily_log) 
@@ -328,7 +396,7 @@ class DailyLogGetOrCreateView(APIView):
         day_of_week_str_short = day_of_week_str_long[:3]
         numeric_day_str = f"Day {log_date.weekday() + 1}" 
 
-        schedule_item_for_today = routine.weekly_schedule.filter(
+        schedule_item_for_today = routine.schedule_owner.weekly_schedule.filter(
             Q(day_of_week_or_number__iexact=day_of_week_str_long) |
             Q(day_of_week_or_number__iexact=day_of_week_str_short) |
             Q(day_of_week_or_number__iexact=numeric_day_str) 
@@ -359,12 +427,72 @@ class DailyLogDetailView(generics.RetrieveUpdateAPIView):
     queryset = DailyWorkoutLog.objects.all() # Standard queryset
     
     def get_queryset(self):
-        return DailyWorkoutLog.objects.filter(workout_plan__user=self.request.user)
+        return DailyWorkoutLog.objects.filter(workout_plan__user=self.request.user).select_related(
+            'workout_plan__user', 'workout_plan__current_routine').prefetch_related('exercise_entries')
 
     def perform_update(self, serializer):
+        if 'exercise_entries' in serializer.validated_data:
+            # Before the write, so a flush can't put a socket's older count back over it.
+            set_progress.discard_sets(serializer.instance.id)
         instance = serializer.save()
+        session_cache.invalidate_log(instance.id)
         print(f"DailyWorkoutLog {instance.id} updated. Completion: {instance.completion_percentage}%")
 
+class JSONPatchParser(JSONParser):
+    media_type = 'application/json-patch+json'
+
+
+class DailyLogExerciseView(APIView):
+    """
+    PATCH /daily-logs/<pk>/exercises/<original_exercise_id>/ applies a JSON
+    Patch (gym/jsonpatch.py) to that one logged exercise and writes only the
+    columns it changed. Changing actual_sets_completed without touching
+    completed_status updates the status too. The log's
+    completion_percentage is then recomputed on the server, which keeps the
+    plan's heat level current. Responds with the entry and the percentage.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONPatchParser, JSONParser]
+    read_only_paths = {'original_exercise_id', 'rep_kinematics'}
+
+    def patch(self, request, pk, original_exercise_id):
+        with transaction.atomic():
+            # Locking the log serializes edits to its exercises, so each
+            # recomputed percentage sees the others.
+            daily_log = get_object_or_404(
+                DailyWorkoutLog.objects.select_for_update(of=('self',)).only(
+                    'id', 'workout_plan_id', 'date', 'completion_percentage', 'routine_used_id'),
+                pk=pk, workout_plan__user=request.user,
+            )
+            entry = get_object_or_404(ExerciseLogEntry, daily_log=daily_log, original_exercise_id=original_exercise_id)
+            set_progress.discard_sets(daily_log.id, original_exercise_id)
+
+            document = entry.as_logged_exercise()
+            try:
+                patched = apply_patch(document, request.data)
+            except PatchError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            read_only = sorted(path for path in self.read_only_paths if patched.get(path) != document.get(path))
+            if read_only:
+                return Response({"error": f"{', '.join(read_only)} can't be changed."}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = ExerciseLogEntrySerializer(entry, data=patched)
+            serializer.is_valid(raise_exception=True)
+            values = serializer.validated_data
+            if 'completed_status' not in patched_paths(request.data) and values['actual_sets_completed'] != entry.actual_sets_completed:
+                values['completed_status'] = completion_status(values['actual_sets_completed'], values['target_sets'])
+            if update_exercise_entry(entry, values):
+                completion = completion_percentage(
+                    daily_log.exercise_entries.values_list('completed_status', 'actual_sets_completed', 'target_sets'),
+                    daily_log.completion_percentage,
+                )
+                if completion != daily_log.completion_percentage:
+                    daily_log.completion_percentage = completion
+                    daily_log.save(update_fields=['completion_percentage'])
+        session_cache.invalidate_log(daily_log.id)
+        return Response({"exercise": entry.as_logged_exercise(), "completion_percentage": daily_log.completion_percentage})
+
+
 class WorkoutContributionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -378,4 +506,12 @@ class WorkoutContributionView(APIView):
             date__gte=one_year_ago
         ).values('date', 'completion_percentage')
         
-        return Response(list(logs))
\ No newline at end of file
+        return Response(list(logs))
+
+
+class MetricsView(APIView):
+    """Supervision pipeline metrics for this worker, in the Prometheus text format."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics_registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")